@@ -0,0 +1,91 @@
+"""
+Подготовка признаков для множества штабелей: prepare_features по одному словарю
+против векторизованного prepare_features_batch
+
+Синтетические штабели: дата формирования и история температур (записи каждые
+--step-hours часов за 90 дней, даты строками ISO как из API). Проверяется
+совпадение признаков и замеряется время:
+- prepare_features в цикле по словарям;
+- stockpile_frames + prepare_features_batch (вход — те же словари);
+- prepare_features_batch на готовых колоночных данных.
+
+Запуск из директории ml-service:
+    python benchmarks/bench_features.py --stockpiles 1000 5000
+"""
+import sys
+import os
+import time
+import argparse
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.feature_engineering import prepare_features, prepare_features_batch, stockpile_frames
+
+
+def make_stockpiles(n_stockpiles: int, step_hours: int, target_date: datetime, seed: int = 42):
+    """Словари штабелей в формате DatabaseService.get_stockpiles_data"""
+    rng = np.random.default_rng(seed)
+    n_records = 90 * 24 // step_hours
+    stockpiles = []
+    for shtabel_id in range(n_stockpiles):
+        dates = [target_date - timedelta(hours=step_hours * k + int(rng.integers(0, step_hours))) for k in range(n_records)]
+        temps = rng.uniform(10, 120, n_records).round(1)
+        stockpiles.append({
+            "shtabel_id": shtabel_id,
+            "formed_at": (target_date - timedelta(days=int(rng.integers(0, 400)))).isoformat() + "Z",
+            "last_temp": None if shtabel_id % 10 == 0 else float(temps[0]),
+            "temperatures": [
+                {"record_date": d.isoformat(), "max_temp": float(t)}
+                for d, t in zip(dates, temps)
+            ],
+        })
+    return stockpiles
+
+
+def timeit(func, repeat: int) -> float:
+    """Медианное время вызова в миллисекундах"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings) * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='prepare_features vs prepare_features_batch')
+    parser.add_argument('--stockpiles', type=int, nargs='+', default=[100, 1000, 5000], help='Числа штабелей')
+    parser.add_argument('--step-hours', type=int, default=24, help='Интервал между замерами температуры, ч')
+    parser.add_argument('--repeat', type=int, default=3, help='Повторов для замера')
+    args = parser.parse_args()
+
+    target_date = datetime(2024, 6, 1, 12)
+    print(f"История: 90 дней, запись каждые {args.step_hours} ч")
+    print(f"\n{'штабелей':>9} {'цикл, мс':>10} {'словари→batch, мс':>18} {'колонки, мс':>12} {'ускорение':>10} {'расхождений':>12}")
+
+    for n_stockpiles in args.stockpiles:
+        stockpiles = make_stockpiles(n_stockpiles, args.step_hours, target_date)
+        stockpiles_df, temperatures_df = stockpile_frames(stockpiles)
+
+        expected = pd.concat([prepare_features(s, target_date=target_date) for s in stockpiles], ignore_index=True)
+        actual = prepare_features_batch(stockpiles_df, temperatures_df, target_date, key="stockpile")
+        mismatches = int((~np.isclose(expected.to_numpy(float), actual.to_numpy(float), equal_nan=True)).any(axis=1).sum())
+
+        loop_ms = timeit(lambda: [prepare_features(s, target_date=target_date) for s in stockpiles], args.repeat)
+        dicts_ms = timeit(
+            lambda: prepare_features_batch(*stockpile_frames(stockpiles), target_date, key="stockpile"), args.repeat
+        )
+        columns_ms = timeit(
+            lambda: prepare_features_batch(stockpiles_df, temperatures_df, target_date, key="stockpile"), args.repeat
+        )
+        print(
+            f"{n_stockpiles:>9} {loop_ms:>10.1f} {dicts_ms:>18.1f} {columns_ms:>12.1f} "
+            f"{loop_ms / dicts_ms:>9.1f}x {mismatches:>12}"
+        )
+
+
+if __name__ == "__main__":
+    main()
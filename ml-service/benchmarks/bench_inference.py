@@ -0,0 +1,83 @@
+"""
+Замер задержки одного вызова модели: XGBClassifier.predict_proba на DataFrame
+против общего адаптера src/inference.py (float32-матрица + Booster.inplace_predict)
+
+Запуск из директории ml-service:
+    python benchmarks/bench_inference.py --model models/coal_fire_model.json
+"""
+import sys
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.feature_engineering import FEATURE_COLUMNS
+from src.inference import predict_positive, to_feature_matrix
+
+
+def make_features(n_rows: int, seed: int = 42) -> pd.DataFrame:
+    """Синтетические признаки в реалистичных диапазонах (как строит prepare_features)"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Максимальная температура': rng.uniform(0, 150, n_rows),
+        'age_days': rng.integers(0, 400, n_rows),
+        'temp_air': rng.uniform(-25, 35, n_rows),
+        'humidity': rng.uniform(20, 100, n_rows),
+        'precip': rng.exponential(1.0, n_rows),
+        'temp_delta_3d': rng.normal(0, 10, n_rows),
+    }, columns=FEATURE_COLUMNS)
+
+
+def timeit(func, repeat: int) -> float:
+    """Медианное время вызова в микросекундах"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings) * 1e6)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inference adapter: per-call latency')
+    parser.add_argument('--model', type=str, default='models/coal_fire_model.json', help='Путь к JSON модели')
+    parser.add_argument('--repeat', type=int, default=500, help='Повторов для замера')
+    args = parser.parse_args()
+
+    model = xgb.XGBClassifier()
+    model.load_model(args.model)
+    features = make_features(4096)
+
+    expected = model.predict_proba(features)[:, 1]
+    actual = predict_positive(model, features)
+    max_diff = float(np.abs(expected - actual).max())
+    print(f"Модель: {args.model}")
+    print(f"Совпадение на {len(features)} строках: max |Δp| = {max_diff:.3g}")
+
+    # DataFrame на входе — как в Predictor и CSVPredictor; список строк — как в /predict/direct
+    print(f"\n{'rows':>6} {'predict_proba, мкс':>19} {'адаптер (DataFrame), мкс':>25} {'адаптер (строки), мкс':>22} {'ускорение':>10}")
+    for n_rows in (1, 8, 64, 512, 4096):
+        batch = features.iloc[:n_rows]
+        rows = batch.to_numpy().tolist()
+        repeat = max(10, args.repeat // max(1, n_rows // 64))
+        wrapper_us = timeit(lambda: model.predict_proba(batch)[:, 1], repeat)
+        adapter_df_us = timeit(lambda: predict_positive(model, batch), repeat)
+        adapter_rows_us = timeit(lambda: predict_positive(model, rows), repeat)
+        print(f"{n_rows:>6} {wrapper_us:>19.1f} {adapter_df_us:>25.1f} {adapter_rows_us:>22.1f} {wrapper_us / adapter_df_us:>9.2f}x")
+
+    matrix = to_feature_matrix(features.iloc[:1])
+    print(f"\nПреобразование одной строки в матрицу: {timeit(lambda: to_feature_matrix(features.iloc[:1]), args.repeat):.1f} мкс "
+          f"(dtype={matrix.dtype}, C-contiguous={matrix.flags['C_CONTIGUOUS']})")
+
+    if max_diff > 1e-6:
+        print(f"\n❌ Расхождение {max_diff:.3g}", file=sys.stderr)
+        sys.exit(1)
+    print("\n✅ Предсказания совпадают")
+
+
+if __name__ == "__main__":
+    main()
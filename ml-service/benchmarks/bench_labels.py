@@ -0,0 +1,91 @@
+"""
+Метка «возгорание в окне ±2 дня»: построчный apply с объектами datetime.date
+против векторизованного fire_labels (searchsorted по целым ключам штабель/день)
+
+Данные — data/fires.csv и data/temperature.csv. С --scale N замеры и возгорания
+размножаются на N копий с разными номерами штабелей. Проверяется совпадение
+меток и замеряется время только этапа разметки.
+
+Запуск из директории ml-service:
+    python benchmarks/bench_labels.py --scale 1 10 100
+"""
+import sys
+import os
+import time
+import argparse
+from datetime import timedelta
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.preprocessing import FIRE_WINDOW_DAYS, fire_days, fire_labels, prepare_temperature
+
+DATA_DIR = Path(__file__).parent.parent / 'data'
+
+
+def apply_labels(temp: pd.DataFrame, fires: pd.DataFrame) -> pd.Series:
+    """Прежняя разметка train_from_csv.py / make_dataset (эталон)"""
+    temp = temp.assign(date=temp['date'].dt.date)
+    fire_events = set(zip(fires['stack_id'], fires['date_fire'].dt.date))
+
+    def has_fire_in_window(row):
+        for delta in range(-FIRE_WINDOW_DAYS, FIRE_WINDOW_DAYS + 1):
+            if (row['stack_id'], row['date'] + timedelta(days=delta)) in fire_events:
+                return 1
+        return 0
+
+    return temp.apply(has_fire_in_window, axis=1)
+
+
+def scaled(df: pd.DataFrame, scale: int, offset: int) -> pd.DataFrame:
+    """N копий таблицы, номера штабелей k-й копии сдвинуты на offset * k"""
+    if scale == 1:
+        return df
+    return pd.concat(
+        [df.assign(Штабель=df['Штабель'] + offset * k) for k in range(scale)],
+        ignore_index=True,
+    )
+
+
+def timeit(func, repeat: int) -> float:
+    """Медианное время вызова в миллисекундах"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings) * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Построчная разметка vs fire_labels')
+    parser.add_argument('--scale', type=int, nargs='+', default=[1, 10, 100], help='Множители числа штабелей')
+    parser.add_argument('--repeat', type=int, default=3, help='Повторов для замера')
+    args = parser.parse_args()
+
+    fires = pd.read_csv(DATA_DIR / 'fires.csv')
+    temp = pd.read_csv(DATA_DIR / 'temperature.csv')
+    print(f"Данные: возгораний {len(fires)}, замеров {len(temp)}")
+    print(f"\n{'масштаб':>8} {'замеров':>9} {'меток 1':>8} {'apply, мс':>10} {'fire_labels, мс':>16} {'ускорение':>10} {'расхождений':>12}")
+
+    offset = int(max(fires['Штабель'].max(), temp['Штабель'].max())) + 1
+    for scale in args.scale:
+        temp_n = prepare_temperature(scaled(temp, scale, offset))
+        fires_n = fire_days(scaled(fires, scale, offset))
+
+        expected = apply_labels(temp_n, fires_n).to_numpy()
+        actual = fire_labels(temp_n, fires_n)
+        mismatches = int((expected != actual).sum())
+
+        apply_ms = timeit(lambda: apply_labels(temp_n, fires_n), args.repeat)
+        vectorized_ms = timeit(lambda: fire_labels(temp_n, fires_n), args.repeat)
+        print(
+            f"{scale:>8} {len(temp_n):>9} {int(actual.sum()):>8} {apply_ms:>10.1f} {vectorized_ms:>16.2f} "
+            f"{apply_ms / vectorized_ms:>9.0f}x {mismatches:>12}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Предобработка CSV-выгрузок: прежняя построчная версия (даты datetime.date,
+apply для метки, слияние с погодой) против общего конвейера src/preprocessing.py
+
+Данные — файлы из data/ (fires.csv, supplies.csv, temperature.csv,
+weather_data_*.csv). С --scale N замеры и возгорания размножаются на N копий
+с разными номерами штабелей. Проверяется совпадение признаков, метки и
+порядка строк и замеряется время.
+
+Запуск из директории ml-service:
+    python benchmarks/bench_preprocessing.py --scale 1 10
+"""
+import sys
+import os
+import time
+import argparse
+from datetime import timedelta
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.feature_engineering import FEATURE_COLUMNS
+from src.preprocessing import build_dataset
+
+DATA_DIR = Path(__file__).parent.parent / 'data'
+
+
+def legacy_dataset(fires, supplies, temp, weather):
+    """Прежняя предобработка train_from_csv.py / CSVPredictor (эталон)"""
+    fires = fires.rename(columns={'Груз': 'Марка', 'Дата начала': 'Дата возгорания'})
+    supplies = supplies.rename(columns={'ВыгрузкаНаСклад': 'Дата поступления'})
+    weather = weather.rename(columns={'t': 'temp_air', 'precipitation': 'precip'})
+
+    fires['date_fire'] = pd.to_datetime(fires['Дата возгорания'], errors='coerce')
+    fires = fires.dropna(subset=['date_fire'])
+    temp['date'] = pd.to_datetime(temp['Дата акта'], errors='coerce')
+    temp = temp.dropna(subset=['date'])
+    supplies['stack_start_date'] = pd.to_datetime(supplies['Дата поступления'], errors='coerce')
+    supplies = supplies.dropna(subset=['stack_start_date'])
+
+    temp['stack_id'] = temp['Склад'].astype(str) + '_' + temp['Штабель'].astype(str)
+    fires['stack_id'] = fires['Склад'].astype(str) + '_' + fires['Штабель'].astype(str)
+    fires['date_fire'] = fires['date_fire'].dt.date
+    temp['date'] = temp['date'].dt.date
+
+    fire_events = set(zip(fires['stack_id'], fires['date_fire']))
+
+    def has_fire_in_window(row):
+        for delta in range(-2, 3):
+            if (row['stack_id'], row['date'] + timedelta(days=delta)) in fire_events:
+                return 1
+        return 0
+
+    temp['target'] = temp.apply(has_fire_in_window, axis=1)
+
+    supply_start = supplies.groupby(['Склад', 'Штабель'])['stack_start_date'].min().reset_index()
+    supply_start['stack_id'] = supply_start['Склад'].astype(str) + '_' + supply_start['Штабель'].astype(str)
+    temp['stack_start'] = temp['stack_id'].map(dict(zip(supply_start['stack_id'], supply_start['stack_start_date'])))
+    temp['stack_start'] = pd.to_datetime(temp['stack_start']).dt.date
+    temp['age_days'] = (pd.to_datetime(temp['date']) - pd.to_datetime(temp['stack_start'])).dt.days
+    temp['age_days'] = temp['age_days'].clip(lower=0).fillna(0)
+
+    weather['date'] = pd.to_datetime(weather['date'], errors='coerce').dt.date
+    weather_daily = weather.groupby('date').agg({'temp_air': 'max', 'humidity': 'mean', 'precip': 'sum'}).reset_index()
+    temp = temp.merge(weather_daily, on='date', how='left')
+
+    temp = temp.sort_values(['stack_id', 'date']).reset_index(drop=True)
+    temp['temp_lag3'] = temp.groupby('stack_id')['Максимальная температура'].shift(3)
+    temp['temp_delta_3d'] = (temp['Максимальная температура'] - temp['temp_lag3']).fillna(0)
+    temp = temp.dropna(subset=['Максимальная температура'])
+    for col, default in [('temp_air', 20.0), ('humidity', 60.0), ('precip', 0.0)]:
+        temp[col] = temp[col].ffill().bfill().fillna(default)
+    return temp
+
+
+def scaled(df: pd.DataFrame, scale: int, offset: int) -> pd.DataFrame:
+    """N копий таблицы, номера штабелей k-й копии сдвинуты на offset * k"""
+    if scale == 1:
+        return df
+    return pd.concat(
+        [df.assign(Штабель=df['Штабель'] + offset * k) for k in range(scale)],
+        ignore_index=True,
+    )
+
+
+def timeit(func, repeat: int) -> float:
+    """Медианное время вызова в миллисекундах"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings) * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Построчная предобработка vs общий конвейер')
+    parser.add_argument('--scale', type=int, nargs='+', default=[1, 10], help='Множители числа штабелей')
+    parser.add_argument('--repeat', type=int, default=3, help='Повторов для замера')
+    args = parser.parse_args()
+
+    fires = pd.read_csv(DATA_DIR / 'fires.csv')
+    supplies = pd.read_csv(DATA_DIR / 'supplies.csv')
+    temp = pd.read_csv(DATA_DIR / 'temperature.csv')
+    weather = pd.concat([pd.read_csv(f) for f in sorted(DATA_DIR.glob('weather_data_*.csv'))], ignore_index=True)
+    print(f"Данные: возгораний {len(fires)}, поставок {len(supplies)}, замеров {len(temp)}, погода {len(weather)} записей")
+    print(f"\n{'масштаб':>8} {'замеров':>9} {'прежняя, мс':>12} {'конвейер, мс':>13} {'ускорение':>10} {'расхождений':>12}")
+
+    offset = int(max(fires['Штабель'].max(), supplies['Штабель'].max(), temp['Штабель'].max())) + 1
+    for scale in args.scale:
+        fires_n, supplies_n, temp_n = (scaled(df, scale, offset) for df in (fires, supplies, temp))
+
+        expected = legacy_dataset(fires_n.copy(), supplies_n.copy(), temp_n.copy(), weather.copy())
+        actual = build_dataset(fires_n, supplies_n, temp_n, weather)
+        columns = ['stack_id', 'target'] + FEATURE_COLUMNS
+        same_shape = expected.shape[0] == actual.shape[0]
+        mismatches = int((expected[columns].to_numpy() != actual[columns].to_numpy()).any(axis=1).sum()) if same_shape else -1
+
+        legacy_ms = timeit(
+            lambda: legacy_dataset(fires_n.copy(), supplies_n.copy(), temp_n.copy(), weather.copy()), args.repeat
+        )
+        pipeline_ms = timeit(lambda: build_dataset(fires_n, supplies_n, temp_n, weather), args.repeat)
+        print(
+            f"{scale:>8} {len(temp_n):>9} {legacy_ms:>12.1f} {pipeline_ms:>13.1f} "
+            f"{legacy_ms / pipeline_ms:>9.1f}x {mismatches:>12}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+Пропускная способность serve.py в зависимости от числа воркеров
+
+Для каждого числа воркеров запускается serve.py с моделью models/coal_fire_model.json,
+после ответа 200 от /ready клиенты из нескольких процессов в течение --duration секунд
+шлют /predict/direct с разными параметрами (кэш /predict/direct выключен,
+чтобы каждый запрос доходил до модели).
+
+Запуск из директории ml-service:
+    python benchmarks/bench_serving.py --workers 1 2 4 --clients 8 --duration 10
+"""
+import sys
+import os
+import time
+import socket
+import signal
+import argparse
+import subprocess
+import multiprocessing
+
+import httpx
+
+ML_SERVICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(base_url: str, timeout: float) -> None:
+    """Ждём, пока все воркеры прогреются (несколько ответов 200 от /ready подряд)"""
+    deadline = time.monotonic() + timeout
+    ready_in_row = 0
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/ready", timeout=2).status_code == 200:
+                ready_in_row += 1
+                if ready_in_row >= 10:
+                    return
+                continue
+        except httpx.HTTPError:
+            pass
+        ready_in_row = 0
+        time.sleep(0.2)
+    raise TimeoutError(f"{base_url} не готов за {timeout} с")
+
+
+def client(base_url: str, duration: float, seed: int, results) -> None:
+    """Последовательные запросы одного клиента; возвращает (успешные, ошибки, задержки)"""
+    latencies = []
+    errors = 0
+    i = seed * 100000
+    with httpx.Client(base_url=base_url, timeout=10) as http:
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            i += 1
+            body = {
+                "max_temp": 20 + (i * 7) % 100,
+                "age_days": (i * 13) % 365,
+                "humidity": 30 + (i * 3) % 70,
+                "temp_delta_3d": (i % 21) - 10,
+            }
+            started = time.perf_counter()
+            try:
+                response = http.post("/predict/direct", json=body)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+            except httpx.HTTPError:
+                errors += 1
+    results.put((len(latencies), errors, latencies))
+
+
+def run_load(base_url: str, clients: int, duration: float):
+    results = multiprocessing.Queue()
+    procs = [
+        multiprocessing.Process(target=client, args=(base_url, duration, n, results))
+        for n in range(clients)
+    ]
+    for proc in procs:
+        proc.start()
+    collected = [results.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+
+    ok = sum(c[0] for c in collected)
+    errors = sum(c[1] for c in collected)
+    latencies = sorted(l for c in collected for l in c[2])
+    p50 = latencies[len(latencies) // 2] * 1000 if latencies else float("nan")
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else float("nan")
+    return ok / duration, errors, p50, p99
+
+
+def main():
+    parser = argparse.ArgumentParser(description='serve.py: throughput vs worker count')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='Числа воркеров для замера')
+    parser.add_argument('--clients', type=int, default=8, help='Параллельных клиентских процессов')
+    parser.add_argument('--duration', type=float, default=10.0, help='Длительность замера, с')
+    parser.add_argument('--threads', type=int, default=1, help='SERVE_THREADS_PER_WORKER')
+    parser.add_argument('--startup-timeout', type=float, default=120.0, help='Ожидание /ready, с')
+    args = parser.parse_args()
+
+    print(f"Ядер: {os.cpu_count()}, клиентов: {args.clients}, длительность: {args.duration} с")
+    print(f"\n{'workers':>8} {'req/s':>10} {'масштаб':>8} {'p50, мс':>9} {'p99, мс':>9} {'ошибок':>7}")
+
+    baseline = None
+    for workers in args.workers:
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        env = {
+            **os.environ,
+            "SERVE_WORKERS": str(workers),
+            "SERVE_THREADS_PER_WORKER": str(args.threads),
+            "DIRECT_CACHE_SIZE": "0",
+        }
+        server = subprocess.Popen(
+            [sys.executable, "serve.py", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+            cwd=ML_SERVICE_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            wait_ready(base_url, args.startup_timeout)
+            throughput, errors, p50, p99 = run_load(base_url, args.clients, args.duration)
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=30)
+
+        baseline = baseline or throughput
+        print(f"{workers:>8} {throughput:>10.1f} {throughput / baseline:>7.2f}x {p50:>9.2f} {p99:>9.2f} {errors:>7}")
+
+
+if __name__ == "__main__":
+    main()
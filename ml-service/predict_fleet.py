@@ -0,0 +1,63 @@
+"""
+Скрипт прогнозирования для всех активных штабелей (весь парк)
+Использует BatchPredictor: массовая загрузка данных и один вызов модели
+"""
+import sys
+import os
+import json
+import argparse
+
+# Добавляем путь к src
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src.model_manager import model_manager
+from src.batch_predictor import batch_predictor
+from src.weather_index import weather_index
+from src.config import settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Прогноз для всех активных штабелей')
+    parser.add_argument('--sklad-id', type=int, default=None, help='Только штабели указанного склада')
+    parser.add_argument('--horizon-days', type=int, default=7, help='Горизонт прогнозирования в днях')
+    parser.add_argument('--threshold', type=float, default=0.5, help='Порог вероятности для высокого риска')
+    parser.add_argument('--model-name', type=str, default='coal_fire_model', help='Название модели')
+    parser.add_argument('--model-version', type=str, default='1.0.0', help='Версия модели')
+    parser.add_argument('--persist', action='store_true', help='Сохранить прогнозы в таблицу Prediction')
+    parser.add_argument('--output', type=str, default=None, help='Сохранить результат в JSON файл')
+    args = parser.parse_args()
+
+    print(f"🔄 Загрузка модели {args.model_name} v{args.model_version}...")
+    if not model_manager.load_model(args.model_name, args.model_version):
+        print("⚠ Модель не загружена, будут использованы эвристические прогнозы")
+
+    if settings.WEATHER_INDEX_ENABLED:
+        weather_index.load()
+
+    result = batch_predictor.predict_fleet(
+        sklad_id=args.sklad_id,
+        horizon_days=args.horizon_days,
+        threshold=args.threshold,
+        persist=args.persist,
+    )
+
+    print(f"\n📊 Штабелей: {result['total']}, успешно: {result['success']}, ошибок: {result['failed']}")
+    print(f"🔥 Высокий риск (p >= {args.threshold}): {result['high_risk_count']}")
+    for stack in result['high_risk_stacks']:
+        print(f"  Склад {stack['sklad_id']}, штабель {stack['label'] or stack['shtabel_id']}: "
+              f"p={stack['probability']:.2f}, {stack['risk_level']}, дата {stack['predicted_date']}")
+    if args.persist:
+        print(f"💾 Сохранено прогнозов: {result['saved']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False, default=str)
+        print(f"✓ Результат сохранён: {args.output}")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"\n❌ Ошибка при прогнозировании: {e}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,228 @@
+"""
+Production entrypoint: prefork uvicorn workers sharing a preloaded model
+
+The parent process loads the model and the weather index once, binds the
+listening socket and forks SERVE_WORKERS workers. Workers inherit the model
+pages copy-on-write (gc.freeze() keeps the collector from touching them) and
+accept connections on the shared socket. The parent restarts workers that
+die and forwards SIGTERM/SIGINT for a graceful shutdown. A worker that dies
+right after starting is restarted with exponential backoff; when it keeps
+failing (SERVE_MAX_FAST_EXITS in a row), the parent stops all workers and
+exits with status 1 instead of forking in a tight loop. Each worker gets
+an index in SERVE_WORKER_INDEX (kept across restarts); jobs that write
+shared state, such as feature store refreshes, run only in worker 0.
+
+Per-worker thread limits (SERVE_THREADS_PER_WORKER) are applied to
+OpenMP/BLAS before numpy and xgboost are imported, so N workers do not
+oversubscribe the cores.
+
+Запуск:
+    python serve.py                      # SERVE_WORKERS из окружения
+    SERVE_WORKERS=4 python serve.py --port 8000
+Для разработки: uvicorn src.main:app --reload
+"""
+import sys
+import os
+import gc
+import signal
+import socket
+import argparse
+import logging
+import time
+
+# Добавляем путь к src
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src.config import settings
+
+THREAD_LIMIT_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+# Upper bound of the restart delay (with SERVE_MAX_FAST_EXITS=0 it would grow without limit)
+RESTART_BACKOFF_MAX_SECONDS = 60.0
+
+logger = logging.getLogger("serve")
+
+
+def limit_threads(threads: int) -> None:
+    """Cap native thread pools per worker (explicitly set variables win)"""
+    for var in THREAD_LIMIT_VARS:
+        os.environ.setdefault(var, str(threads))
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    """Listening socket created in the parent and shared by all workers"""
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def preload() -> None:
+    """Load everything workers share read-only before forking"""
+    from src.model_manager import model_manager
+    from src.weather_index import weather_index
+    from src.rolling_features import rolling_features
+    from src.database import DatabaseService, dispose_engines
+    from src.startup import startup_report
+
+    # Timed as preload.* phases; workers inherit them and report them in their startup summary
+    with startup_report.phase("preload.model_load"):
+        loaded = model_manager.load_model("coal_fire_model", "1.0.0")
+    if not loaded:
+        logger.warning("Model not preloaded; workers start without a model (placeholder predictions)")
+    if settings.WEATHER_INDEX_ENABLED:
+        with startup_report.phase("preload.weather_index"):
+            loaded = weather_index.load(DatabaseService())
+        if not loaded:
+            logger.warning("Weather index not preloaded; workers load it at startup")
+    if settings.ROLLING_FEATURES_ENABLED:
+        with startup_report.phase("preload.rolling_features"):
+            loaded = rolling_features.load(DatabaseService())
+        if not loaded:
+            logger.warning("Rolling features not preloaded; workers load them at startup")
+
+    # Connections opened by the parent must not be shared with workers
+    dispose_engines(close=True)
+    startup_report.preloaded()
+
+
+def restart_delay(fast_exits: int) -> float:
+    """Seconds to wait before restarting a worker after fast_exits fast exits in a row"""
+    if fast_exits <= 0:
+        return 0.0
+    return min(settings.SERVE_RESTART_BACKOFF_SECONDS * 2 ** (fast_exits - 1), RESTART_BACKOFF_MAX_SECONDS)
+
+
+def run_worker(sock: socket.socket, app, log_level: str, index: int) -> None:
+    """Serve the shared socket in a forked worker (never returns)"""
+    import uvicorn
+    from src.database import dispose_engines
+    from src.startup import startup_report
+
+    startup_report.forked()
+    os.environ["SERVE_WORKER_INDEX"] = str(index)
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, signal.SIG_DFL)
+    dispose_engines(close=False)
+
+    config = uvicorn.Config(app, log_level=log_level, lifespan="on")
+    server = uvicorn.Server(config)
+    try:
+        server.run(sockets=[sock])
+    finally:
+        os._exit(0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ML Service: prefork-воркеры с общей предзагруженной моделью')
+    parser.add_argument('--host', type=str, default=settings.SERVE_HOST, help='Адрес для прослушивания')
+    parser.add_argument('--port', type=int, default=settings.SERVE_PORT, help='Порт')
+    parser.add_argument('--workers', type=int, default=settings.SERVE_WORKERS,
+                        help='Количество воркеров (0 — по числу ядер)')
+    parser.add_argument('--threads', type=int, default=settings.SERVE_THREADS_PER_WORKER,
+                        help='Потоков OpenMP/BLAS на воркер')
+    parser.add_argument('--log-level', type=str, default='info', help='Уровень логирования uvicorn')
+    args = parser.parse_args()
+
+    limit_threads(max(1, args.threads))
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+
+    # Imported after the thread limits: numpy/xgboost read them at import
+    from src.main import app
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    preload()
+    sock = bind_socket(args.host, args.port)
+
+    # Objects allocated so far are never collected; workers keep sharing their pages
+    gc.collect()
+    gc.freeze()
+
+    # pid -> worker index
+    children = {}
+    # worker index -> start time, fast exits in a row, time of a pending restart
+    spawned_at = {}
+    fast_exits = {}
+    restarts = {}
+    stopping = False
+    exit_code = 0
+
+    def spawn(index: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            run_worker(sock, app, args.log_level, index)
+        children[pid] = index
+        spawned_at[index] = time.monotonic()
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for index in range(workers):
+        spawn(index)
+    logger.info(
+        f"Serving on {args.host}:{args.port} with {workers} workers "
+        f"({max(1, args.threads)} threads each, parent pid {os.getpid()})"
+    )
+
+    while children or (restarts and not stopping):
+        if restarts and not stopping:
+            # Restarts are pending: poll for exits until the earliest one is due
+            index = min(restarts, key=restarts.get)
+            if time.monotonic() >= restarts[index]:
+                del restarts[index]
+                spawn(index)
+                continue
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                pid, status = 0, 0
+            if pid == 0:
+                time.sleep(min(0.1, max(0.0, restarts[index] - time.monotonic())))
+                continue
+        else:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+        index = children.pop(pid, None)
+        if index is None or stopping:
+            continue
+
+        uptime = time.monotonic() - spawned_at[index]
+        fast_exits[index] = fast_exits.get(index, 0) + 1 if uptime < settings.SERVE_FAST_EXIT_SECONDS else 0
+        if 0 < settings.SERVE_MAX_FAST_EXITS <= fast_exits[index]:
+            logger.error(
+                f"Worker {index} (pid {pid}) exited with status {status} {fast_exits[index]} times in a row "
+                f"within {settings.SERVE_FAST_EXIT_SECONDS:.0f}s of starting; giving up"
+            )
+            exit_code = 1
+            stop(signal.SIGTERM, None)
+            continue
+        delay = restart_delay(fast_exits[index])
+        logger.warning(
+            f"Worker {index} (pid {pid}) exited with status {status} after {uptime:.1f}s, "
+            f"restarting" + (f" in {delay:.1f}s" if delay else "")
+        )
+        restarts[index] = time.monotonic() + delay
+
+    sock.close()
+    logger.info("All workers stopped")
+    if exit_code:
+        sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,7 @@ from src.model_manager import model_manager
 from src.feature_engineering import prepare_features
 from src.database import DatabaseService
 from src.predictor import Predictor
+from src.rolling_features import rolling_features
 
 logger = logging.getLogger(__name__)
 
@@ -27,6 +28,7 @@ class BatchPredictor:
         target_date: Optional[datetime] = None,
         horizon_days: int = 7,
         threshold: float = 0.5,
+        model_version: Optional[str] = None,
     ) -> Dict[str, Any]:
         """
         Predict fire risk for all specified stockpiles
@@ -38,11 +40,14 @@ class BatchPredictor:
             target_date: Target date for prediction (default: now)
             horizon_days: Prediction horizon in days
             threshold: Probability threshold for high risk (default: 0.5)
+            model_version: Registry version to use (default: current model)
             
         Returns:
             Dictionary with predictions and high-risk stockpiles
         """
         try:
+            # Without an explicit date the predictor may use materialized feature vectors
+            requested_target_date = target_date
             if target_date is None:
                 target_date = datetime.now()
             
@@ -51,47 +56,49 @@ class BatchPredictor:
             results = []
             high_risk_stacks = []
             errors = []
+            stockpiles = []
+            
+            # Get stockpile data for all ids in one bulk fetch; live predictions take the
+            # temperature history from the rolling feature state and fetch only newer records
+            temperatures_after = rolling_features.history_watermark if requested_target_date is None else None
+            stockpiles_data = self.db_service.get_stockpiles_data(shtabel_ids, temperatures_after)
             
             for shtabel_id in shtabel_ids:
-                try:
-                    # Get stockpile data
-                    stockpile_data = self.db_service.get_stockpile_data(shtabel_id)
-                    
-                    if not stockpile_data:
-                        errors.append({
-                            "shtabel_id": shtabel_id,
-                            "error": "Stockpile not found"
-                        })
-                        continue
-                    
-                    # Make prediction
-                    prediction = self.predictor.predict(
-                        stockpile_data,
-                        horizon_days=horizon_days,
-                        target_date=target_date
-                    )
-                    
-                    results.append(prediction)
-                    
-                    # Check if high risk (probability >= threshold)
-                    if prediction.get("prob_event", 0) >= threshold:
-                        high_risk_stacks.append({
-                            "shtabel_id": shtabel_id,
-                            "sklad_id": stockpile_data.get("sklad_id"),
-                            "label": stockpile_data.get("label"),
-                            "mark": stockpile_data.get("mark"),
-                            "last_temp": stockpile_data.get("last_temp", 0),
-                            "probability": prediction.get("prob_event", 0),
-                            "predicted": 1 if prediction.get("prob_event", 0) >= 0.5 else 0,
-                            "risk_level": prediction.get("risk_level", "LOW"),
-                            "predicted_date": prediction.get("predicted_date"),
-                        })
-                    
-                except Exception as e:
-                    logger.error(f"Error predicting for shtabel {shtabel_id}: {e}")
+                stockpile_data = stockpiles_data.get(shtabel_id)
+                
+                if not stockpile_data:
                     errors.append({
                         "shtabel_id": shtabel_id,
-                        "error": str(e)
+                        "error": "Stockpile not found"
+                    })
+                    continue
+                
+                stockpiles.append(stockpile_data)
+            
+            # Make predictions with a single model call
+            predictions = self.predictor.predict_batch(
+                stockpiles,
+                horizon_days=horizon_days,
+                target_date=requested_target_date,
+                model_version=model_version,
+            )
+            
+            for stockpile_data, prediction in zip(stockpiles, predictions):
+                prediction["sklad_id"] = stockpile_data.get("sklad_id")
+                results.append(prediction)
+                
+                # Check if high risk (probability >= threshold)
+                if prediction.get("prob_event", 0) >= threshold:
+                    high_risk_stacks.append({
+                        "shtabel_id": stockpile_data.get("shtabel_id"),
+                        "sklad_id": stockpile_data.get("sklad_id"),
+                        "label": stockpile_data.get("label"),
+                        "mark": stockpile_data.get("mark"),
+                        "last_temp": stockpile_data.get("last_temp", 0),
+                        "probability": prediction.get("prob_event", 0),
+                        "predicted": 1 if prediction.get("prob_event", 0) >= 0.5 else 0,
+                        "risk_level": prediction.get("risk_level", "LOW"),
+                        "predicted_date": prediction.get("predicted_date"),
                     })
             
             return {
@@ -109,6 +116,54 @@ class BatchPredictor:
             logger.error(f"Error in batch prediction: {e}", exc_info=True)
             raise
 
+    def predict_fleet(
+        self,
+        sklad_id: Optional[int] = None,
+        horizon_days: int = 7,
+        threshold: float = 0.5,
+        persist: bool = False,
+        model_version: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Predict fire risk for every ACTIVE stockpile in one server-side pass
+        
+        Stockpile data is bulk-loaded and scored with a single model call
+        (see predict_all).
+        
+        Args:
+            sklad_id: Only stockpiles of this warehouse (default: all)
+            horizon_days: Prediction horizon in days
+            threshold: Probability threshold for high risk (default: 0.5)
+            persist: Save the predictions to the Prediction table
+            model_version: Registry version to use (default: current model)
+            
+        Returns:
+            predict_all() result plus sklad_id and the number of saved rows
+        """
+        shtabel_ids = self.db_service.get_active_shtabel_ids(sklad_id)
+        logger.info(
+            f"Fleet prediction for {len(shtabel_ids)} active stockpiles"
+            + (f" of sklad {sklad_id}" if sklad_id is not None else "")
+        )
+        
+        result = self.predict_all(
+            shtabel_ids,
+            horizon_days=horizon_days,
+            threshold=threshold,
+            model_version=model_version,
+        )
+        result["sklad_id"] = sklad_id
+        result["saved"] = 0
+        
+        if persist and result["predictions"]:
+            ts = datetime.now()
+            result["saved"] = self.db_service.save_predictions([
+                {**prediction, "ts": ts} for prediction in result["predictions"]
+            ])
+            logger.info(f"Saved {result['saved']} fleet predictions")
+        
+        return result
+
 
 # Global batch predictor instance
 batch_predictor = BatchPredictor()
@@ -0,0 +1,98 @@
+"""
+Bounded in-process LRU cache with optional TTL
+
+Used for prediction results (keyed by stockpile and data watermarks) and
+for /predict/direct (keyed by the normalized feature vector). Keys must be
+hashable and include everything the cached value depends on, so stale
+entries are simply never hit again and age out of the LRU.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """Thread-safe LRU cache with size bound, optional TTL and hit/miss counters"""
+
+    def __init__(self, name: str, max_size: int = 10000, ttl_seconds: Optional[float] = None):
+        """
+        Args:
+            name: Cache name used in stats and logs
+            max_size: Maximum number of entries (0 disables the cache)
+            ttl_seconds: Entry lifetime in seconds (None or 0: no expiry)
+        """
+        self.name = name
+        self.max_size = max(0, int(max_size))
+        self.ttl = ttl_seconds if ttl_seconds and ttl_seconds > 0 else None
+
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "clears": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Cached value for key, or None on a miss"""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+
+            value, expires_at = entry
+            if expires_at is not None and time.monotonic() >= expires_at:
+                del self._entries[key]
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Store value, evicting the least recently used entries beyond max_size"""
+        if not self.enabled:
+            return
+
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def clear(self) -> None:
+        """Drop all entries"""
+        with self._lock:
+            dropped = len(self._entries)
+            self._entries.clear()
+            self._stats["clears"] += 1
+        if dropped:
+            logger.info(f"Cache {self.name}: dropped {dropped} entries")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Size, configuration and hit/miss counters"""
+        with self._lock:
+            size = len(self._entries)
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        return {
+            "name": self.name,
+            "enabled": self.enabled,
+            "size": size,
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "hit_rate": round(stats["hits"] / lookups, 4) if lookups else 0.0,
+            **stats,
+        }
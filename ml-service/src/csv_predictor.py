@@ -4,17 +4,52 @@
 """
 import pandas as pd
 import numpy as np
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Iterator
 from datetime import datetime, timedelta
 import logging
 import io
 
 from src.model_manager import model_manager
 from src.database import DatabaseService
+from src.feature_engineering import FEATURE_COLUMNS
+from src.inference import predict_positive
+from src.perf_metrics import stage
+from src.preprocessing import build_dataset
 
 logger = logging.getLogger(__name__)
 
 
+class PredictionStatistics:
+    """Накопление статистики по прогнозам, поступающим порциями"""
+    
+    def __init__(self):
+        self.total = 0
+        self.high_risk = 0
+        self.medium_risk = 0
+        self.low_risk = 0
+        self.probability_sum = 0.0
+    
+    def update(self, predictions: List[Dict[str, Any]]) -> None:
+        for p in predictions:
+            self.total += 1
+            if p["risk_level"] in ["HIGH", "CRITICAL"]:
+                self.high_risk += 1
+            elif p["risk_level"] == "MEDIUM":
+                self.medium_risk += 1
+            elif p["risk_level"] == "LOW":
+                self.low_risk += 1
+            self.probability_sum += p["prob_event"]
+    
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "total_predictions": self.total,
+            "high_risk": self.high_risk,
+            "medium_risk": self.medium_risk,
+            "low_risk": self.low_risk,
+            "avg_probability": self.probability_sum / self.total if self.total else float("nan"),
+        }
+
+
 class CSVPredictor:
     """Класс для прогнозирования на основе CSV файлов"""
     
@@ -29,6 +64,7 @@ class CSVPredictor:
         temperature_csv: bytes,
         weather_csv: Optional[bytes] = None,
         horizon_days: int = 7,
+        model_version: Optional[str] = None,
     ) -> Dict[str, Any]:
         """
         Прогнозирование на основе CSV файлов
@@ -39,159 +75,35 @@ class CSVPredictor:
             temperature_csv: CSV файл с данными о температурах
             weather_csv: CSV файл с погодными данными (опционально)
             horizon_days: Горизонт прогнозирования в днях
+            model_version: Версия модели из реестра (по умолчанию текущая)
             
         Returns:
             Словарь с результатами прогнозирования для каждого штабеля
         """
         try:
-            logger.info("Начало прогнозирования на основе CSV файлов")
-            
-            # Загружаем CSV файлы
-            fires = pd.read_csv(io.BytesIO(fires_csv))
-            supplies = pd.read_csv(io.BytesIO(supplies_csv))
-            temp = pd.read_csv(io.BytesIO(temperature_csv))
-            
-            logger.info(f"Загружены файлы: fires={len(fires)}, supplies={len(supplies)}, temp={len(temp)}")
-            
-            # Обрабатываем погодные данные, если есть
-            weather = None
-            if weather_csv:
-                try:
-                    weather = pd.read_csv(io.BytesIO(weather_csv))
-                    logger.info(f"Загружены погодные данные: {len(weather)} записей")
-                except Exception as e:
-                    logger.warning(f"Ошибка при загрузке погодных данных: {e}")
-            
-            # Предобрабатываем данные
-            processed_data = self._preprocess_data(fires, supplies, temp, weather)
-            
-            if processed_data.empty:
-                raise ValueError("После предобработки не осталось валидных данных")
-            
-            logger.info(f"После предобработки: {len(processed_data)} записей")
-            
-            # Проверяем, загружена ли модель
-            if not self.model_manager.is_model_loaded():
-                logger.warning("Модель не загружена, пытаемся загрузить по умолчанию...")
-                if not self.model_manager.load_model("coal_fire_model", "1.0.0"):
-                    raise ValueError("Модель не загружена. Пожалуйста, загрузите модель перед прогнозированием.")
-            
-            model = self.model_manager.get_model()
-            if not model:
-                raise ValueError("Модель недоступна")
-            
-            # Подготавливаем признаки
-            feature_cols = [
-                'Максимальная температура',
-                'age_days',
-                'temp_air',
-                'humidity',
-                'precip',
-                'temp_delta_3d'
-            ]
-            
-            # Проверяем наличие необходимых колонок
-            missing_cols = [col for col in feature_cols if col not in processed_data.columns]
-            if missing_cols:
-                raise ValueError(f"Отсутствуют необходимые колонки: {missing_cols}")
-            
-            X = processed_data[feature_cols]
-            
-            # Удаляем строки с NaN
-            mask = X.notnull().all(axis=1)
-            X = X[mask]
-            processed_data = processed_data[mask]
-            
-            if len(X) == 0:
-                raise ValueError("Нет валидных данных после удаления NaN")
-            
-            logger.info(f"Валидных записей для прогнозирования: {len(X)}")
-            
-            # Делаем предсказания
-            logger.info("Выполнение прогнозирования...")
-            y_pred = model.predict(X)
-            y_pred_proba = model.predict_proba(X)[:, 1]
-            
-            # Формируем результаты для каждой записи
-            predictions = []
             target_date = datetime.now()
+            statistics = PredictionStatistics()
+            predictions = []
             
-            for idx, row in processed_data.iterrows():
-                # Определяем уровень риска
-                proba = float(y_pred_proba[idx])
-                pred = int(y_pred[idx])
-                
-                if proba >= 0.8:
-                    risk_level = "CRITICAL"
-                elif proba >= 0.6:
-                    risk_level = "HIGH"
-                elif proba >= 0.4:
-                    risk_level = "MEDIUM"
-                else:
-                    risk_level = "LOW"
-                
-                # Рассчитываем предсказанную дату
-                if pred == 1:
-                    days_to_fire = max(1, int(horizon_days * (1 - proba)))
-                    predicted_date = target_date + timedelta(days=days_to_fire)
-                else:
-                    predicted_date = None
-                
-                # Интервал уверенности
-                if predicted_date:
-                    interval_low = predicted_date - timedelta(days=2)
-                    interval_high = predicted_date + timedelta(days=2)
-                else:
-                    interval_low = None
-                    interval_high = None
-                
-                # Получаем информацию о штабеле
-                stack_id = row.get('stack_id', 'unknown')
-                sklad = row.get('Склад', None)
-                shtabel = row.get('Штабель', None)
-                
-                prediction_result = {
-                    "stack_id": str(stack_id),
-                    "sklad": int(sklad) if pd.notna(sklad) else None,
-                    "shtabel": int(shtabel) if pd.notna(shtabel) else None,
-                    "record_date": row.get('date', target_date).isoformat() if hasattr(row.get('date'), 'isoformat') else str(row.get('date', target_date)),
-                    "model_name": "xgboost_v1",
-                    "model_version": self.model_manager.get_model_info().get("model_version", "1.0.0") if self.model_manager.get_model_info() else "1.0.0",
-                    "predicted_date": predicted_date.isoformat() if predicted_date else None,
-                    "prob_event": proba,
-                    "risk_level": risk_level,
-                    "horizon_days": horizon_days,
-                    "interval_low": interval_low.isoformat() if interval_low else None,
-                    "interval_high": interval_high.isoformat() if interval_high else None,
-                    "confidence": proba,
-                    "features": {
-                        "max_temp": float(row.get('Максимальная температура', 0)),
-                        "age_days": float(row.get('age_days', 0)),
-                        "temp_air": float(row.get('temp_air', 20)),
-                        "humidity": float(row.get('humidity', 60)),
-                        "precip": float(row.get('precip', 0)),
-                        "temp_delta_3d": float(row.get('temp_delta_3d', 0)),
-                    },
-                }
-                
-                predictions.append(prediction_result)
+            for chunk in self.iter_predictions_from_csv(
+                fires_csv,
+                supplies_csv,
+                temperature_csv,
+                weather_csv=weather_csv,
+                horizon_days=horizon_days,
+                target_date=target_date,
+                model_version=model_version,
+            ):
+                statistics.update(chunk)
+                predictions.extend(chunk)
             
             logger.info(f"Прогнозирование завершено: {len(predictions)} предсказаний")
             
-            # Статистика
-            stats = {
-                "total_predictions": len(predictions),
-                "high_risk": sum(1 for p in predictions if p["risk_level"] in ["HIGH", "CRITICAL"]),
-                "medium_risk": sum(1 for p in predictions if p["risk_level"] == "MEDIUM"),
-                "low_risk": sum(1 for p in predictions if p["risk_level"] == "LOW"),
-                "avg_probability": float(np.mean([p["prob_event"] for p in predictions])),
-            }
-            
             return {
                 "success": True,
                 "predictions": predictions,
-                "statistics": stats,
-                "model_info": self.model_manager.get_model_info(),
+                "statistics": statistics.as_dict(),
+                "model_info": self.model_manager.get_model_info(model_version),
                 "prediction_date": target_date.isoformat(),
             }
             
@@ -199,6 +111,172 @@ class CSVPredictor:
             logger.error(f"Ошибка при прогнозировании: {e}", exc_info=True)
             raise
     
+    def iter_predictions_from_csv(
+        self,
+        fires_csv: bytes,
+        supplies_csv: bytes,
+        temperature_csv: bytes,
+        weather_csv: Optional[bytes] = None,
+        horizon_days: int = 7,
+        target_date: Optional[datetime] = None,
+        chunk_size: int = 1000,
+        model_version: Optional[str] = None,
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Прогнозирование на основе CSV файлов по частям
+        
+        Предобработка выполняется целиком (нужны лаги по штабелям), а модель
+        вызывается и результаты формируются порциями по chunk_size записей,
+        так что потребитель может отдавать их клиенту по мере готовности.
+        Ошибки загрузки и предобработки возникают при получении первой порции.
+        
+        Args:
+            fires_csv: CSV файл с данными о возгораниях
+            supplies_csv: CSV файл с данными о поставках
+            temperature_csv: CSV файл с данными о температурах
+            weather_csv: CSV файл с погодными данными (опционально)
+            horizon_days: Горизонт прогнозирования в днях
+            target_date: Дата прогноза (по умолчанию сейчас)
+            chunk_size: Количество записей в порции
+            model_version: Версия модели из реестра (по умолчанию текущая)
+            
+        Yields:
+            Списки прогнозов (не более chunk_size в каждом)
+        """
+        logger.info("Начало прогнозирования на основе CSV файлов")
+        if target_date is None:
+            target_date = datetime.now()
+        
+        # Загружаем CSV файлы
+        fires = pd.read_csv(io.BytesIO(fires_csv))
+        supplies = pd.read_csv(io.BytesIO(supplies_csv))
+        temp = pd.read_csv(io.BytesIO(temperature_csv))
+        
+        logger.info(f"Загружены файлы: fires={len(fires)}, supplies={len(supplies)}, temp={len(temp)}")
+        
+        # Обрабатываем погодные данные, если есть
+        weather = None
+        if weather_csv:
+            try:
+                weather = pd.read_csv(io.BytesIO(weather_csv))
+                logger.info(f"Загружены погодные данные: {len(weather)} записей")
+            except Exception as e:
+                logger.warning(f"Ошибка при загрузке погодных данных: {e}")
+        
+        # Предобрабатываем данные
+        with stage("prepare_features", model_version):
+            processed_data = self._preprocess_data(fires, supplies, temp, weather)
+        
+        if processed_data.empty:
+            raise ValueError("После предобработки не осталось валидных данных")
+        
+        logger.info(f"После предобработки: {len(processed_data)} записей")
+        
+        # Модель загружается при старте или через /model/load, не во время запроса
+        if not self.model_manager.is_model_loaded():
+            raise ValueError("Модель не загружена. Пожалуйста, загрузите модель перед прогнозированием.")
+        
+        model, model_info = self.model_manager.get_model_with_info(model_version)
+        if not model:
+            raise ValueError(f"Модель недоступна (версия {model_version})" if model_version else "Модель недоступна")
+        
+        # Проверяем наличие необходимых колонок
+        missing_cols = [col for col in FEATURE_COLUMNS if col not in processed_data.columns]
+        if missing_cols:
+            raise ValueError(f"Отсутствуют необходимые колонки: {missing_cols}")
+        
+        # Удаляем строки с NaN
+        mask = processed_data[FEATURE_COLUMNS].notnull().all(axis=1)
+        processed_data = processed_data[mask]
+        
+        if len(processed_data) == 0:
+            raise ValueError("Нет валидных данных после удаления NaN")
+        
+        logger.info(f"Валидных записей для прогнозирования: {len(processed_data)}")
+        
+        model_version = model_info.get("model_version", "1.0.0") if model_info else "1.0.0"
+        
+        for start in range(0, len(processed_data), chunk_size):
+            chunk = processed_data.iloc[start:start + chunk_size]
+            # Вероятности по позиции в порции; класс — порог 0.5, как в model.predict
+            y_pred_proba = predict_positive(model, chunk, model_version)
+            with stage("postprocess", model_version):
+                predictions = [
+                    self._prediction_record(row, float(proba), horizon_days, target_date, model_version)
+                    for row, proba in zip(chunk.to_dict(orient="records"), y_pred_proba)
+                ]
+            yield predictions
+    
+    def _prediction_record(
+        self,
+        row: Dict[str, Any],
+        proba: float,
+        horizon_days: int,
+        target_date: datetime,
+        model_version: str,
+    ) -> Dict[str, Any]:
+        """Прогноз для одной записи температуры"""
+        pred = int(proba > 0.5)
+        
+        # Определяем уровень риска
+        if proba >= 0.8:
+            risk_level = "CRITICAL"
+        elif proba >= 0.6:
+            risk_level = "HIGH"
+        elif proba >= 0.4:
+            risk_level = "MEDIUM"
+        else:
+            risk_level = "LOW"
+        
+        # Рассчитываем предсказанную дату
+        if pred == 1:
+            days_to_fire = max(1, int(horizon_days * (1 - proba)))
+            predicted_date = target_date + timedelta(days=days_to_fire)
+        else:
+            predicted_date = None
+        
+        # Интервал уверенности
+        if predicted_date:
+            interval_low = predicted_date - timedelta(days=2)
+            interval_high = predicted_date + timedelta(days=2)
+        else:
+            interval_low = None
+            interval_high = None
+        
+        # Получаем информацию о штабеле
+        stack_id = row.get('stack_id', 'unknown')
+        sklad = row.get('Склад', None)
+        shtabel = row.get('Штабель', None)
+        
+        # Дата замера — день (datetime64 из конвейера предобработки)
+        record_date = row.get('date', target_date)
+        if isinstance(record_date, pd.Timestamp):
+            record_date = record_date.date()
+        
+        return {
+            "stack_id": str(stack_id),
+            "sklad": int(sklad) if pd.notna(sklad) else None,
+            "shtabel": int(shtabel) if pd.notna(shtabel) else None,
+            "record_date": record_date.isoformat() if hasattr(record_date, 'isoformat') else str(record_date),
+            "model_name": "xgboost_v1",
+            "model_version": model_version,
+            "predicted_date": predicted_date.isoformat() if predicted_date else None,
+            "prob_event": proba,
+            "risk_level": risk_level,
+            "horizon_days": horizon_days,
+            "interval_low": interval_low.isoformat() if interval_low else None,
+            "interval_high": interval_high.isoformat() if interval_high else None,
+            "confidence": proba,
+            "features": {
+                "max_temp": float(row.get('Максимальная температура', 0)),
+                "age_days": float(row.get('age_days', 0)),
+                "temp_air": float(row.get('temp_air', 20)),
+                "humidity": float(row.get('humidity', 60)),
+                "precip": float(row.get('precip', 0)),
+                "temp_delta_3d": float(row.get('temp_delta_3d', 0)),
+            },
+        }
+    
     def _preprocess_data(
         self,
         fires: pd.DataFrame,
@@ -208,127 +286,12 @@ class CSVPredictor:
     ) -> pd.DataFrame:
         """
         Предобработка данных из CSV файлов
-        Использует ту же логику, что и train_from_csv.py
+        Общий конвейер src/preprocessing.py, тот же, что и в train_from_csv.py
         """
         try:
             logger.info("Начало предобработки данных...")
             
-            # 1. Переименование колонок для совместимости
-            if 'Груз' in fires.columns:
-                fires = fires.rename(columns={
-                    'Груз': 'Марка',
-                    'Дата начала': 'Дата возгорания',
-                    'Нач.форм.штабеля': 'Формирование штабеля'
-                })
-            
-            if 'ВыгрузкаНаСклад' in supplies.columns:
-                supplies = supplies.rename(columns={
-                    'ВыгрузкаНаСклад': 'Дата поступления',
-                    'Наим. ЕТСНГ': 'Марка',
-                    'ПогрузкаНаСудно': 'Дата отправления'
-                })
-            
-            # 2. Преобразование дат
-            fires['date_fire'] = pd.to_datetime(fires.get('Дата возгорания', fires.get('Дата начала', None)), errors='coerce')
-            fires = fires.dropna(subset=['date_fire'])
-            
-            temp['date'] = pd.to_datetime(temp.get('Дата акта', temp.get('Дата', None)), errors='coerce')
-            temp = temp.dropna(subset=['date'])
-            
-            supplies['stack_start_date'] = pd.to_datetime(supplies.get('Дата поступления', supplies.get('ВыгрузкаНаСклад', None)), errors='coerce')
-            supplies = supplies.dropna(subset=['stack_start_date'])
-            
-            if len(fires) == 0 or len(temp) == 0 or len(supplies) == 0:
-                raise ValueError("Один или несколько CSV файлов пусты после обработки дат")
-            
-            # 3. Создание stack_id
-            temp['stack_id'] = temp['Склад'].astype(str) + '_' + temp['Штабель'].astype(str)
-            fires['stack_id'] = fires['Склад'].astype(str) + '_' + fires['Штабель'].astype(str)
-            
-            # Приводим даты к .date()
-            fires['date_fire'] = fires['date_fire'].dt.date
-            temp['date'] = temp['date'].dt.date
-            
-            # 4. Возраст штабеля
-            supply_start = supplies.groupby(['Склад', 'Штабель'])['stack_start_date'].min().reset_index()
-            supply_start['stack_id'] = supply_start['Склад'].astype(str) + '_' + supply_start['Штабель'].astype(str)
-            stack_age_map = dict(zip(supply_start['stack_id'], supply_start['stack_start_date']))
-            
-            temp['stack_start'] = temp['stack_id'].map(stack_age_map)
-            temp['stack_start'] = pd.to_datetime(temp['stack_start']).dt.date
-            temp['age_days'] = (pd.to_datetime(temp['date']) - pd.to_datetime(temp['stack_start'])).dt.days
-            temp['age_days'] = temp['age_days'].clip(lower=0).fillna(0)
-            
-            # 5. Погода: агрегация до дня
-            if weather is not None and not weather.empty:
-                # Переименовываем колонки погоды, если нужно
-                weather_renamed = weather.copy()
-                
-                # Переименование колонок для совместимости
-                rename_map = {}
-                if 'date' not in weather_renamed.columns:
-                    if 'datetime' in weather_renamed.columns:
-                        rename_map['datetime'] = 'date'
-                
-                if 'temp_air' not in weather_renamed.columns:
-                    if 't' in weather_renamed.columns:
-                        rename_map['t'] = 'temp_air'
-                
-                if 'precip' not in weather_renamed.columns:
-                    if 'precipitation' in weather_renamed.columns:
-                        rename_map['precipitation'] = 'precip'
-                
-                if rename_map:
-                    weather_renamed = weather_renamed.rename(columns=rename_map)
-                
-                # Преобразуем дату
-                if 'date' in weather_renamed.columns:
-                    weather_renamed['date'] = pd.to_datetime(weather_renamed['date'], errors='coerce').dt.date
-                elif 'datetime' in weather_renamed.columns:
-                    weather_renamed['date'] = pd.to_datetime(weather_renamed['datetime'], errors='coerce').dt.date
-                else:
-                    raise ValueError("В погодных данных отсутствует колонка date или datetime")
-                
-                weather_renamed = weather_renamed.dropna(subset=['date'])
-                
-                # Агрегируем по дням
-                agg_dict = {}
-                if 'temp_air' in weather_renamed.columns:
-                    agg_dict['temp_air'] = 'max'
-                if 'humidity' in weather_renamed.columns:
-                    agg_dict['humidity'] = 'mean'
-                if 'precip' in weather_renamed.columns:
-                    agg_dict['precip'] = 'sum'
-                
-                if agg_dict:
-                    weather_daily = weather_renamed.groupby('date').agg(agg_dict).reset_index()
-                    
-                    # Присоединяем погоду по дате
-                    temp = temp.merge(weather_daily[['date'] + list(agg_dict.keys())], on='date', how='left')
-                else:
-                    logger.warning("В погодных данных нет нужных колонок, используем значения по умолчанию")
-                    temp['temp_air'] = 20.0
-                    temp['humidity'] = 60.0
-                    temp['precip'] = 0.0
-            else:
-                logger.info("Погодные данные отсутствуют, используем значения по умолчанию")
-                temp['temp_air'] = 20.0
-                temp['humidity'] = 60.0
-                temp['precip'] = 0.0
-            
-            # 6. Динамика температуры: рост за 3 дня
-            temp = temp.sort_values(['stack_id', 'date']).reset_index(drop=True)
-            temp['temp_lag3'] = temp.groupby('stack_id')['Максимальная температура'].shift(3)
-            temp['temp_delta_3d'] = temp['Максимальная температура'] - temp['temp_lag3']
-            temp['temp_delta_3d'] = temp['temp_delta_3d'].fillna(0)
-            
-            # 7. Подготовка финального датасета
-            temp = temp.dropna(subset=['Максимальная температура'])
-            
-            # Заполнение пропусков в погоде
-            for col in ['temp_air', 'humidity', 'precip']:
-                if col in temp.columns:
-                    temp[col] = temp[col].ffill().bfill().fillna(20.0 if col == 'temp_air' else (60.0 if col == 'humidity' else 0.0))
+            temp = build_dataset(fires, supplies, temp, weather, with_target=False)
             
             logger.info(f"Предобработка завершена: {len(temp)} записей")
             return temp
@@ -3,28 +3,424 @@ Database connection and queries for ML Service
 """
 from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy.pool import NullPool
+from sqlalchemy.pool import NullPool, QueuePool, AsyncAdaptedQueuePool
 from typing import Optional, List, Dict, Any
 import pandas as pd
-from datetime import datetime, timedelta
+import json
+import re
+import threading
+import time
+from contextlib import AsyncExitStack, ExitStack
+from datetime import date, datetime, timedelta
 from src.config import settings
+from src.perf_metrics import stage, query_timer
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Upper bounds (seconds) of the checkout wait histogram buckets
+CHECKOUT_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+
+class PoolMetrics:
+    """Connection checkout wait-time statistics for a pool"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+    
+    def reset(self) -> None:
+        with self._lock:
+            self.checkouts = 0
+            self.timeouts = 0
+            self.total_wait = 0.0
+            self.max_wait = 0.0
+            self.buckets = [0] * (len(CHECKOUT_WAIT_BUCKETS) + 1)
+    
+    def observe(self, wait: float, timed_out: bool = False) -> None:
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            for i, bound in enumerate(CHECKOUT_WAIT_BUCKETS):
+                if wait <= bound:
+                    self.buckets[i] += 1
+                    break
+            else:
+                self.buckets[-1] += 1
+    
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            labels = [str(b) for b in CHECKOUT_WAIT_BUCKETS] + ["+Inf"]
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": round(self.total_wait / self.checkouts * 1000.0, 3) if self.checkouts else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000.0, 3),
+                "total_wait_s": round(self.total_wait, 6),
+                "wait_histogram_s": dict(zip(labels, self.buckets)),
+            }
+
+
+sync_pool_metrics = PoolMetrics()
+async_pool_metrics = PoolMetrics()
+
+
+def _instrumented(pool_class, metrics: PoolMetrics):
+    """Pool subclass recording how long each checkout waited for a connection"""
+    
+    class InstrumentedPool(pool_class):
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except Exception:
+                metrics.observe(time.perf_counter() - started, timed_out=True)
+                raise
+            metrics.observe(time.perf_counter() - started)
+            return connection
+    
+    InstrumentedPool.__name__ = f"Instrumented{pool_class.__name__}"
+    return InstrumentedPool
+
+
+def _pool_kwargs(pool_class) -> Dict[str, Any]:
+    """Pool configuration from settings (DB_POOL_SIZE=0 disables pooling)"""
+    if settings.DB_POOL_SIZE <= 0:
+        return {"poolclass": NullPool, "pool_pre_ping": settings.DB_POOL_PRE_PING}
+    return {
+        "poolclass": pool_class,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
 # Create database engine
 # Use psycopg2 with proper parameter style
 engine = create_engine(
     settings.DATABASE_URL,
-    poolclass=NullPool,
-    pool_pre_ping=True,
     echo=False,
-    connect_args={"options": "-c statement_timeout=30000"}
+    connect_args={"options": "-c statement_timeout=30000"},
+    **_pool_kwargs(_instrumented(QueuePool, sync_pool_metrics)),
 )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+def _create_async_engine():
+    """
+    Optional asyncpg-backed engine so handlers can await queries
+    without holding a worker thread (DB_ASYNC_ENABLED=true)
+    """
+    if not settings.DB_ASYNC_ENABLED:
+        return None
+    try:
+        import asyncpg  # noqa: F401
+        from sqlalchemy.ext.asyncio import create_async_engine
+    except ImportError:
+        logger.warning("DB_ASYNC_ENABLED is set but asyncpg is not installed; using sync engine")
+        return None
+    
+    url = re.sub(r"^postgres(ql)?(\+\w+)?://", "postgresql+asyncpg://", settings.DATABASE_URL)
+    return create_async_engine(
+        url,
+        echo=False,
+        connect_args={"server_settings": {"statement_timeout": "30000"}},
+        **_pool_kwargs(_instrumented(AsyncAdaptedQueuePool, async_pool_metrics)),
+    )
+
+
+async_engine = _create_async_engine()
+
+
+def dispose_engines(close: bool = True) -> None:
+    """
+    Drop pooled connections of both engines
+    
+    Args:
+        close: Close the connections (in the process that opened them);
+            False in a forked child, which must not touch the parent's sockets
+    """
+    engine.dispose(close=close)
+    if async_engine is not None:
+        async_engine.sync_engine.dispose(close=close)
+    sync_pool_metrics.reset()
+    async_pool_metrics.reset()
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Pool occupancy and checkout wait metrics for the sync and async engines"""
+    stats = {
+        "sync": {
+            "pool": engine.pool.status(),
+            **sync_pool_metrics.snapshot(),
+        },
+    }
+    if async_engine is not None:
+        stats["async"] = {
+            "pool": async_engine.pool.status(),
+            **async_pool_metrics.snapshot(),
+        }
+    return stats
+
+
+# Days of temperature history loaded per stockpile
+TEMPERATURE_HISTORY_DAYS = 90
+
+
+STOCKPILES_QUERY = """
+    SELECT 
+        s.id as shtabel_id,
+        s.sklad_id,
+        s.label,
+        s.mark,
+        s.formed_at,
+        s.height_m,
+        s.width_m,
+        s.length_m,
+        s.mass_t,
+        s.current_mass,
+        s.last_temp,
+        s.last_temp_date,
+        s.status,
+        sk.number as sklad_number,
+        sk.name as sklad_name,
+        (SELECT MAX(t.record_date) FROM "TempRecord" t WHERE t.shtabel_id = s.id) AS last_record_date
+    FROM "Shtabel" s
+    JOIN "Sklad" sk ON s.sklad_id = sk.id
+    WHERE s.id = ANY(%(shtabel_ids)s)
+    ORDER BY s.id
+"""
+
+SUPPLIES_QUERY = """
+    SELECT shtabel_id, date_in, mark, to_storage_t, to_ship_t
+    FROM (
+        SELECT 
+            shtabel_id,
+            date_in,
+            mark,
+            to_storage_t,
+            to_ship_t,
+            ROW_NUMBER() OVER (PARTITION BY shtabel_id ORDER BY date_in DESC) AS rn
+        FROM "Supply"
+        WHERE shtabel_id = ANY(%(shtabel_ids)s)
+    ) ranked
+    WHERE rn <= 100
+    ORDER BY shtabel_id, date_in DESC
+"""
+
+TEMPERATURES_QUERY = """
+    SELECT 
+        id,
+        shtabel_id,
+        record_date,
+        max_temp,
+        risk_level,
+        piket
+    FROM "TempRecord"
+    WHERE shtabel_id = ANY(%(shtabel_ids)s)
+        AND record_date >= %(start_date)s
+        AND id > %(after_id)s
+    ORDER BY shtabel_id, record_date DESC
+"""
+
+TEMPERATURE_RECORDS_QUERY = """
+    SELECT id, shtabel_id, record_date, max_temp
+    FROM "TempRecord"
+    WHERE id > %(after_id)s
+        AND record_date >= %(since)s
+    ORDER BY id
+"""
+
+FIRES_QUERY = """
+    SELECT shtabel_id, start_date, end_date, weight_t, duration_hours
+    FROM (
+        SELECT 
+            shtabel_id,
+            start_date,
+            end_date,
+            weight_t,
+            duration_hours,
+            ROW_NUMBER() OVER (PARTITION BY shtabel_id ORDER BY start_date DESC) AS rn
+        FROM "FireRecord"
+        WHERE shtabel_id = ANY(%(shtabel_ids)s)
+    ) ranked
+    WHERE rn <= 10
+    ORDER BY shtabel_id, start_date DESC
+"""
+
+FEATURE_VECTORS_QUERY = """
+    SELECT DISTINCT ON (shtabel_id)
+        shtabel_id,
+        ts,
+        features,
+        model_version
+    FROM "FeatureVector"
+    WHERE shtabel_id = ANY(%(shtabel_ids)s)
+    ORDER BY shtabel_id, ts DESC
+"""
+
+STOCKPILE_WATERMARK_QUERY = """
+    SELECT
+        s.id AS shtabel_id,
+        s.last_temp_date,
+        (
+            SELECT MAX(t.record_date)
+            FROM "TempRecord" t
+            WHERE t.shtabel_id = s.id
+        ) AS last_record_date
+    FROM "Shtabel" s
+    WHERE s.id = %(shtabel_id)s
+"""
+
+ACTIVE_STOCKPILES_QUERY = """
+    SELECT id
+    FROM "Shtabel"
+    WHERE status = 'ACTIVE'
+        AND (%(sklad_id)s::int IS NULL OR sklad_id = %(sklad_id)s)
+    ORDER BY id
+"""
+
+INSERT_PREDICTION = """
+    INSERT INTO "Prediction" (
+        ts, sklad_id, shtabel_id, model_name, model_version,
+        predicted_date, prob_event, risk_level, horizon_days,
+        interval_low, interval_high, confidence, meta, updated_at
+    )
+    VALUES (
+        :ts, :sklad_id, :shtabel_id, :model_name, :model_version,
+        :predicted_date, :prob_event, :risk_level, :horizon_days,
+        :interval_low, :interval_high, :confidence, CAST(:meta AS jsonb), now()
+    )
+"""
+
+INSERT_FEATURE_VECTOR = """
+    INSERT INTO "FeatureVector" (ts, sklad_id, shtabel_id, features, model_version)
+    VALUES (:ts, :sklad_id, :shtabel_id, CAST(:features AS jsonb), :model_version)
+"""
+
+
+def _optional(value: Any, cast) -> Any:
+    """Convert a nullable DB value, keeping NULL/NaN as None"""
+    return cast(value) if pd.notna(value) else None
+
+
+def _stockpile_record(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "shtabel_id": int(row["shtabel_id"]),
+        "sklad_id": int(row["sklad_id"]),
+        "label": _optional(row["label"], str),
+        "mark": _optional(row["mark"], str),
+        "formed_at": row["formed_at"] if pd.notna(row["formed_at"]) else None,
+        "height_m": _optional(row["height_m"], float),
+        "width_m": _optional(row["width_m"], float),
+        "length_m": _optional(row["length_m"], float),
+        "mass_t": _optional(row["mass_t"], float),
+        "current_mass": _optional(row["current_mass"], float),
+        "last_temp": _optional(row["last_temp"], float),
+        "last_temp_date": row["last_temp_date"] if pd.notna(row["last_temp_date"]) else None,
+        "status": _optional(row["status"], str),
+        "sklad_number": _optional(row["sklad_number"], int),
+        "sklad_name": _optional(row["sklad_name"], str),
+        "last_record_date": row["last_record_date"] if pd.notna(row["last_record_date"]) else None,
+    }
+
+
+def _supply_record(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "date_in": row["date_in"],
+        "mark": _optional(row["mark"], str),
+        "to_storage_t": _optional(row["to_storage_t"], float),
+        "to_ship_t": _optional(row["to_ship_t"], float),
+    }
+
+
+def _temperature_record(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": int(row["id"]),
+        "record_date": row["record_date"],
+        "max_temp": _optional(row["max_temp"], float),
+        "risk_level": _optional(row["risk_level"], str),
+        "piket": _optional(row["piket"], str),
+    }
+
+
+def _fire_record(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "start_date": row["start_date"],
+        "end_date": row["end_date"] if pd.notna(row["end_date"]) else None,
+        "weight_t": _optional(row["weight_t"], float),
+        "duration_hours": _optional(row["duration_hours"], float),
+    }
+
+
+def _watermark_record(df: pd.DataFrame) -> Optional[Dict[str, Any]]:
+    if df.empty:
+        return None
+    row = df.iloc[0]
+    return {
+        "shtabel_id": int(row["shtabel_id"]),
+        "last_temp_date": row["last_temp_date"] if pd.notna(row["last_temp_date"]) else None,
+        "last_record_date": row["last_record_date"] if pd.notna(row["last_record_date"]) else None,
+    }
+
+
+def _feature_vector_record(row: Dict[str, Any]) -> Dict[str, Any]:
+    features = row["features"]
+    if isinstance(features, str):
+        features = json.loads(features)
+    return {
+        "ts": row["ts"],
+        "features": features,
+        "model_version": _optional(row["model_version"], str),
+    }
+
+
+def _assemble_stockpiles(
+    shtabel_df: pd.DataFrame,
+    supplies_df: pd.DataFrame,
+    temp_df: pd.DataFrame,
+    fire_df: pd.DataFrame,
+    vectors_df: pd.DataFrame,
+    temperatures_after: Optional[int] = None,
+) -> Dict[int, Dict[str, Any]]:
+    """Group bulk-loaded rows into per-stockpile dictionaries"""
+    stockpiles = {}
+    for row in shtabel_df.to_dict(orient="records"):
+        stockpile_data = _stockpile_record(row)
+        stockpile_data["supplies"] = []
+        stockpile_data["temperatures"] = []
+        stockpile_data["temperatures_after"] = temperatures_after
+        stockpile_data["fires"] = []
+        stockpile_data["feature_vector"] = None
+        stockpiles[stockpile_data["shtabel_id"]] = stockpile_data
+    
+    for row in vectors_df.to_dict(orient="records"):
+        stockpiles[int(row["shtabel_id"])]["feature_vector"] = _feature_vector_record(row)
+    
+    for df, key, convert in (
+        (supplies_df, "supplies", _supply_record),
+        (temp_df, "temperatures", _temperature_record),
+        (fire_df, "fires", _fire_record),
+    ):
+        for row in df.to_dict(orient="records"):
+            stockpiles[int(row["shtabel_id"])][key].append(convert(row))
+    
+    return stockpiles
+
+
+async def _read_sql_async(conn, query: str, params: Dict[str, Any]) -> pd.DataFrame:
+    """pd.read_sql equivalent for an async connection (psycopg2 %(name)s → :name binds)"""
+    result = await conn.execute(text(re.sub(r"%\((\w+)\)s", r":\1", query)), params)
+    return pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+
+
 def get_db() -> Session:
     """Get database session"""
     db = SessionLocal()
@@ -39,8 +435,11 @@ class DatabaseService:
     
     def __init__(self):
         self.engine = engine
+        self.async_engine = async_engine
     
-    def get_stockpile_data(self, shtabel_id: int) -> Optional[Dict[str, Any]]:
+    def get_stockpile_data(
+        self, shtabel_id: int, temperatures_after: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
         """
         Get all data for a stockpile needed for prediction
         
@@ -52,135 +451,302 @@ class DatabaseService:
             - weather data
             - fire history
         """
+        return self.get_stockpiles_data([shtabel_id], temperatures_after).get(shtabel_id)
+    
+    def get_stockpiles_data(
+        self, shtabel_ids: List[int], temperatures_after: Optional[int] = None
+    ) -> Dict[int, Dict[str, Any]]:
+        """
+        Get prediction data for many stockpiles at once
+        
+        Each table is queried once for the whole id list (WHERE ... = ANY(...))
+        and rows are grouped in memory, so N stockpiles cost five queries on a
+        single connection instead of 5N. The latest materialized feature vector
+        (FeatureVector) is attached as "feature_vector" (None if there is none).
+        
+        Args:
+            shtabel_ids: List of stockpile IDs
+            temperatures_after: Fetch only temperature records with a greater
+                TempRecord id (the rolling feature watermark) instead of the
+                full history; stored as "temperatures_after". None - full history
+            
+        Returns:
+            Dictionary {shtabel_id: stockpile data} with the same structure as
+            get_stockpile_data(). Stockpiles that do not exist are absent.
+        """
+        shtabel_ids = list(dict.fromkeys(int(i) for i in shtabel_ids))
+        if not shtabel_ids:
+            return {}
+        
         try:
-            with self.engine.connect() as conn:
+            with stage("db_fetch"), self.engine.connect() as conn:
                 # Use pandas read_sql for proper parameter handling
                 # This avoids the psycopg2 parameter conversion issue
-                query_str = """
-                    SELECT 
-                        s.id as shtabel_id,
-                        s.sklad_id,
-                        s.label,
-                        s.mark,
-                        s.formed_at,
-                        s.height_m,
-                        s.width_m,
-                        s.length_m,
-                        s.mass_t,
-                        s.current_mass,
-                        s.last_temp,
-                        s.last_temp_date,
-                        s.status,
-                        sk.number as sklad_number,
-                        sk.name as sklad_name
-                    FROM "Shtabel" s
-                    JOIN "Sklad" sk ON s.sklad_id = sk.id
-                    WHERE s.id = %(shtabel_id)s
-                """
-                df = pd.read_sql(query_str, conn, params={"shtabel_id": shtabel_id})
-                
-                if df.empty:
-                    return None
+                params = {"shtabel_ids": shtabel_ids}
                 
-                if df.empty:
-                    return None
+                with query_timer("stockpiles"):
+                    shtabel_df = pd.read_sql(STOCKPILES_QUERY, conn, params=params)
+                if shtabel_df.empty:
+                    return {}
                 
-                row = df.iloc[0]
+                # Only query history for stockpiles that exist
+                params = {"shtabel_ids": [int(i) for i in shtabel_df["shtabel_id"]]}
                 
-                stockpile_data = {
-                    "shtabel_id": int(row["shtabel_id"]),
-                    "sklad_id": int(row["sklad_id"]),
-                    "label": str(row["label"]) if pd.notna(row["label"]) else None,
-                    "mark": str(row["mark"]) if pd.notna(row["mark"]) else None,
-                    "formed_at": row["formed_at"] if pd.notna(row["formed_at"]) else None,
-                    "height_m": float(row["height_m"]) if pd.notna(row["height_m"]) else None,
-                    "width_m": float(row["width_m"]) if pd.notna(row["width_m"]) else None,
-                    "length_m": float(row["length_m"]) if pd.notna(row["length_m"]) else None,
-                    "mass_t": float(row["mass_t"]) if pd.notna(row["mass_t"]) else None,
-                    "current_mass": float(row["current_mass"]) if pd.notna(row["current_mass"]) else None,
-                    "last_temp": float(row["last_temp"]) if pd.notna(row["last_temp"]) else None,
-                    "last_temp_date": row["last_temp_date"] if pd.notna(row["last_temp_date"]) else None,
-                    "status": str(row["status"]) if pd.notna(row["status"]) else None,
-                    "sklad_number": int(row["sklad_number"]) if pd.notna(row["sklad_number"]) else None,
-                    "sklad_name": str(row["sklad_name"]) if pd.notna(row["sklad_name"]) else None,
-                }
+                # Get supplies history (last 100 per stockpile)
+                with query_timer("supplies"):
+                    supplies_df = pd.read_sql(SUPPLIES_QUERY, conn, params=params)
                 
-                # Get supplies history
-                supplies_query = """
-                    SELECT 
-                        date_in,
-                        mark,
-                        to_storage_t,
-                        to_ship_t
-                    FROM "Supply"
-                    WHERE shtabel_id = %(shtabel_id)s
-                    ORDER BY date_in DESC
-                    LIMIT 100
-                """
-                supplies_df = pd.read_sql(supplies_query, conn, params={"shtabel_id": shtabel_id})
-                stockpile_data["supplies"] = [
-                    {
-                        "date_in": row["date_in"],
-                        "mark": str(row["mark"]) if pd.notna(row["mark"]) else None,
-                        "to_storage_t": float(row["to_storage_t"]) if pd.notna(row["to_storage_t"]) else None,
-                        "to_ship_t": float(row["to_ship_t"]) if pd.notna(row["to_ship_t"]) else None,
-                    }
-                    for _, row in supplies_df.iterrows()
-                ]
+                # Get temperature history (last 90 days, or only records after the watermark)
+                start_date = datetime.now() - timedelta(days=TEMPERATURE_HISTORY_DAYS)
+                with query_timer("temperatures"):
+                    temp_df = pd.read_sql(
+                        TEMPERATURES_QUERY, conn,
+                        params={**params, "start_date": start_date, "after_id": temperatures_after or 0},
+                    )
                 
-                # Get temperature history (last 90 days)
-                start_date = datetime.now() - timedelta(days=90)
-                temp_query = """
-                    SELECT 
-                        record_date,
-                        max_temp,
-                        risk_level,
-                        piket
-                    FROM "TempRecord"
-                    WHERE shtabel_id = %(shtabel_id)s
-                        AND record_date >= %(start_date)s
-                    ORDER BY record_date DESC
-                """
-                temp_df = pd.read_sql(temp_query, conn, params={"shtabel_id": shtabel_id, "start_date": start_date})
-                stockpile_data["temperatures"] = [
-                    {
-                        "record_date": row["record_date"],
-                        "max_temp": float(row["max_temp"]) if pd.notna(row["max_temp"]) else None,
-                        "risk_level": str(row["risk_level"]) if pd.notna(row["risk_level"]) else None,
-                        "piket": str(row["piket"]) if pd.notna(row["piket"]) else None,
-                    }
-                    for _, row in temp_df.iterrows()
-                ]
+                # Get fire history (last 10 per stockpile)
+                with query_timer("fires"):
+                    fire_df = pd.read_sql(FIRES_QUERY, conn, params=params)
                 
-                # Get fire history
-                fire_query = """
-                    SELECT 
-                        start_date,
-                        end_date,
-                        weight_t,
-                        duration_hours
-                    FROM "FireRecord"
-                    WHERE shtabel_id = %(shtabel_id)s
-                    ORDER BY start_date DESC
-                    LIMIT 10
-                """
-                fire_df = pd.read_sql(fire_query, conn, params={"shtabel_id": shtabel_id})
-                stockpile_data["fires"] = [
-                {
-                    "start_date": row["start_date"],
-                    "end_date": row["end_date"] if pd.notna(row["end_date"]) else None,
-                    "weight_t": float(row["weight_t"]) if pd.notna(row["weight_t"]) else None,
-                    "duration_hours": float(row["duration_hours"]) if pd.notna(row["duration_hours"]) else None,
-                }
-                for _, row in fire_df.iterrows()
-            ]
+                # Get latest materialized feature vector
+                with query_timer("feature_vectors"):
+                    vectors_df = pd.read_sql(FEATURE_VECTORS_QUERY, conn, params=params)
             
-            return stockpile_data
+            return _assemble_stockpiles(
+                shtabel_df, supplies_df, temp_df, fire_df, vectors_df, temperatures_after
+            )
                 
         except Exception as e:
             logger.error(f"Error getting stockpile data: {e}")
             raise
     
+    @property
+    def async_enabled(self) -> bool:
+        """True when the asyncpg engine is configured"""
+        return self.async_engine is not None
+    
+    async def get_stockpile_data_async(
+        self, shtabel_id: int, temperatures_after: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Async variant of get_stockpile_data() using the asyncpg engine"""
+        return (await self.get_stockpiles_data_async([shtabel_id], temperatures_after)).get(shtabel_id)
+    
+    async def get_stockpiles_data_async(
+        self, shtabel_ids: List[int], temperatures_after: Optional[int] = None
+    ) -> Dict[int, Dict[str, Any]]:
+        """
+        Async variant of get_stockpiles_data() using the asyncpg engine
+        
+        Runs the same queries without occupying a worker thread.
+        """
+        if self.async_engine is None:
+            raise RuntimeError("Async database engine is not enabled (DB_ASYNC_ENABLED)")
+        
+        shtabel_ids = list(dict.fromkeys(int(i) for i in shtabel_ids))
+        if not shtabel_ids:
+            return {}
+        
+        try:
+            with stage("db_fetch"):
+                async with self.async_engine.connect() as conn:
+                    params = {"shtabel_ids": shtabel_ids}
+                    
+                    with query_timer("stockpiles"):
+                        shtabel_df = await _read_sql_async(conn, STOCKPILES_QUERY, params)
+                    if shtabel_df.empty:
+                        return {}
+                    
+                    params = {"shtabel_ids": [int(i) for i in shtabel_df["shtabel_id"]]}
+                    with query_timer("supplies"):
+                        supplies_df = await _read_sql_async(conn, SUPPLIES_QUERY, params)
+                    start_date = datetime.now() - timedelta(days=TEMPERATURE_HISTORY_DAYS)
+                    with query_timer("temperatures"):
+                        temp_df = await _read_sql_async(
+                            conn, TEMPERATURES_QUERY,
+                            {**params, "start_date": start_date, "after_id": temperatures_after or 0},
+                        )
+                    with query_timer("fires"):
+                        fire_df = await _read_sql_async(conn, FIRES_QUERY, params)
+                    with query_timer("feature_vectors"):
+                        vectors_df = await _read_sql_async(conn, FEATURE_VECTORS_QUERY, params)
+            
+            return _assemble_stockpiles(
+                shtabel_df, supplies_df, temp_df, fire_df, vectors_df, temperatures_after
+            )
+        
+        except Exception as e:
+            logger.error(f"Error getting stockpile data: {e}")
+            raise
+    
+    def warm_up_pool(self, connections: int) -> int:
+        """
+        Open up to `connections` pooled connections at once and return them to the pool
+        
+        Returns:
+            Number of connections opened
+        """
+        opened = 0
+        with ExitStack() as stack:
+            for _ in range(max(1, connections)):
+                conn = stack.enter_context(self.engine.connect())
+                conn.execute(text("SELECT 1"))
+                opened += 1
+        return opened
+    
+    async def warm_up_pool_async(self, connections: int) -> int:
+        """Async variant of warm_up_pool() for the asyncpg engine"""
+        if self.async_engine is None:
+            return 0
+        opened = 0
+        async with AsyncExitStack() as stack:
+            for _ in range(max(1, connections)):
+                conn = await stack.enter_async_context(self.async_engine.connect())
+                await conn.execute(text("SELECT 1"))
+                opened += 1
+        return opened
+    
+    def get_active_shtabel_ids(self, sklad_id: Optional[int] = None) -> List[int]:
+        """
+        Get IDs of active stockpiles, optionally for one warehouse
+        
+        Returns:
+            Sorted list of stockpile IDs
+        """
+        try:
+            with self.engine.connect() as conn:
+                with query_timer("active_stockpiles"):
+                    df = pd.read_sql(ACTIVE_STOCKPILES_QUERY, conn, params={"sklad_id": sklad_id})
+            return [int(i) for i in df["id"]]
+        
+        except Exception as e:
+            logger.error(f"Error getting active stockpiles: {e}")
+            raise
+    
+    def get_temperature_records(self, since: datetime, after_id: int = 0) -> pd.DataFrame:
+        """
+        Get temperature records of all stockpiles added after a TempRecord id
+        
+        Args:
+            since: Oldest record_date to return
+            after_id: Return only records with a greater id (0 - all)
+        
+        Returns:
+            DataFrame with columns id, shtabel_id, record_date and max_temp,
+            ordered by id
+        """
+        try:
+            with self.engine.connect() as conn:
+                with query_timer("temperature_records"):
+                    df = pd.read_sql(
+                        TEMPERATURE_RECORDS_QUERY, conn, params={"since": since, "after_id": after_id}
+                    )
+            return df
+        
+        except Exception as e:
+            logger.error(f"Error getting temperature records: {e}")
+            raise
+    
+    def save_feature_vectors(self, vectors: List[Dict[str, Any]]) -> int:
+        """
+        Bulk-insert feature vectors into FeatureVector
+        
+        Args:
+            vectors: Dicts with ts, sklad_id, shtabel_id, features (dict) and model_version
+            
+        Returns:
+            Number of inserted rows
+        """
+        if not vectors:
+            return 0
+        
+        rows = [
+            {**vector, "features": json.dumps(vector["features"], ensure_ascii=False)}
+            for vector in vectors
+        ]
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(text(INSERT_FEATURE_VECTOR), rows)
+            return len(rows)
+        
+        except Exception as e:
+            logger.error(f"Error saving feature vectors: {e}")
+            raise
+    
+    def get_stockpile_watermark(self, shtabel_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Cheap check of when a stockpile's temperature data last changed
+        
+        Returns:
+            Dictionary with last_temp_date and last_record_date (latest
+            TempRecord), or None if the stockpile does not exist
+        """
+        try:
+            with stage("db_watermark"), self.engine.connect() as conn:
+                with query_timer("watermark"):
+                    df = pd.read_sql(STOCKPILE_WATERMARK_QUERY, conn, params={"shtabel_id": int(shtabel_id)})
+            return _watermark_record(df)
+        
+        except Exception as e:
+            logger.error(f"Error getting stockpile watermark: {e}")
+            raise
+    
+    async def get_stockpile_watermark_async(self, shtabel_id: int) -> Optional[Dict[str, Any]]:
+        """Async variant of get_stockpile_watermark() using the asyncpg engine"""
+        if self.async_engine is None:
+            raise RuntimeError("Async database engine is not enabled (DB_ASYNC_ENABLED)")
+        
+        try:
+            with stage("db_watermark"):
+                async with self.async_engine.connect() as conn:
+                    with query_timer("watermark"):
+                        df = await _read_sql_async(conn, STOCKPILE_WATERMARK_QUERY, {"shtabel_id": int(shtabel_id)})
+            return _watermark_record(df)
+        
+        except Exception as e:
+            logger.error(f"Error getting stockpile watermark: {e}")
+            raise
+    
+    def save_predictions(self, predictions: List[Dict[str, Any]]) -> int:
+        """
+        Bulk-insert predictions into Prediction
+        
+        Args:
+            predictions: Prediction dicts (as returned by Predictor) with sklad_id
+                and ts added
+            
+        Returns:
+            Number of inserted rows
+        """
+        if not predictions:
+            return 0
+        
+        rows = [
+            {
+                "ts": p["ts"],
+                "sklad_id": p["sklad_id"],
+                "shtabel_id": p["shtabel_id"],
+                "model_name": p["model_name"],
+                "model_version": p.get("model_version"),
+                "predicted_date": p.get("predicted_date"),
+                "prob_event": p.get("prob_event"),
+                "risk_level": p["risk_level"],
+                "horizon_days": p.get("horizon_days", 7),
+                "interval_low": p.get("interval_low"),
+                "interval_high": p.get("interval_high"),
+                "confidence": p.get("confidence"),
+                "meta": json.dumps(p.get("meta"), ensure_ascii=False, default=str),
+            }
+            for p in predictions
+        ]
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(text(INSERT_PREDICTION), rows)
+            return len(rows)
+        
+        except Exception as e:
+            logger.error(f"Error saving predictions: {e}")
+            raise
+    
     def get_weather_data(
         self, start_date: datetime, end_date: datetime
     ) -> pd.DataFrame:
@@ -208,13 +774,44 @@ class DatabaseService:
                 ORDER BY ts ASC
             """
             with self.engine.connect() as conn:
-                df = pd.read_sql(query, conn, params={"start_date": start_date, "end_date": end_date})
+                with query_timer("weather"):
+                    df = pd.read_sql(query, conn, params={"start_date": start_date, "end_date": end_date})
             return df
                 
         except Exception as e:
             logger.error(f"Error getting weather data: {e}")
             raise
     
+    def get_weather_daily(self, since: Optional[date] = None) -> pd.DataFrame:
+        """
+        Get daily weather aggregates, optionally from a given day on
+        
+        Returns:
+            DataFrame with columns day, t_max, humidity_mean, precip_sum,
+            n_rows and last_ts (latest raw timestamp of the day)
+        """
+        try:
+            query = """
+                SELECT
+                    date_trunc('day', ts)::date AS day,
+                    MAX(t) AS t_max,
+                    AVG(humidity) AS humidity_mean,
+                    COALESCE(SUM(precipitation), 0) AS precip_sum,
+                    COUNT(*) AS n_rows,
+                    MAX(ts) AS last_ts
+                FROM "Weather"
+                WHERE %(since)s::date IS NULL OR ts >= %(since)s::date
+                GROUP BY 1
+                ORDER BY 1 ASC
+            """
+            with self.engine.connect() as conn:
+                df = pd.read_sql(query, conn, params={"since": since})
+            return df
+                
+        except Exception as e:
+            logger.error(f"Error getting daily weather aggregates: {e}")
+            raise
+    
     def get_training_data(self) -> pd.DataFrame:
         """
         Get all data needed for model training
@@ -0,0 +1,121 @@
+"""
+Bounded executors for blocking work
+
+Endpoints are async, while SQLAlchemy, pandas and XGBoost are synchronous.
+Blocking DB I/O and light model calls are dispatched to a thread pool; heavy
+pandas/XGBoost jobs (CSV prediction, validation, training) run in a process
+pool, so the event loop (and /health) stays responsive under mixed load.
+"""
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+import logging
+
+from src.config import settings
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_thread_executor: Optional[ThreadPoolExecutor] = None
+_process_executor: Optional[Executor] = None
+
+
+def get_thread_executor() -> ThreadPoolExecutor:
+    """Thread pool for DB I/O and light model calls (created on first use)"""
+    global _thread_executor
+    with _lock:
+        if _thread_executor is None:
+            _thread_executor = ThreadPoolExecutor(
+                max_workers=settings.THREAD_POOL_SIZE,
+                thread_name_prefix="ml-io",
+            )
+        return _thread_executor
+
+
+def get_process_executor() -> Executor:
+    """
+    Process pool for heavy pandas/XGBoost jobs (created on first use)
+
+    Uses the "spawn" start method so workers never inherit the parent's
+    threads or open DB connections. With PROCESS_POOL_SIZE=0 heavy jobs
+    run in a separate bounded thread pool instead.
+    """
+    global _process_executor
+    with _lock:
+        if _process_executor is None:
+            if settings.PROCESS_POOL_SIZE > 0:
+                _process_executor = ProcessPoolExecutor(
+                    max_workers=settings.PROCESS_POOL_SIZE,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            else:
+                _process_executor = ThreadPoolExecutor(
+                    max_workers=max(1, settings.THREAD_POOL_SIZE // 4),
+                    thread_name_prefix="ml-cpu",
+                )
+        return _process_executor
+
+
+async def run_in_thread(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Run a blocking call in the thread pool, preserving context variables"""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+    return await loop.run_in_executor(get_thread_executor(), call)
+
+
+async def run_in_process(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    Run a CPU-heavy job in the process pool
+
+    func and its arguments must be picklable (module-level functions).
+    A broken pool (worker killed, e.g. by the OOM killer) is recreated once.
+    """
+    global _process_executor
+    loop = asyncio.get_running_loop()
+    call = functools.partial(func, *args, **kwargs)
+    try:
+        return await loop.run_in_executor(get_process_executor(), call)
+    except BrokenProcessPool:
+        logger.error("Process pool is broken, recreating it and retrying the job")
+        with _lock:
+            broken, _process_executor = _process_executor, None
+        if broken is not None:
+            broken.shutdown(wait=False, cancel_futures=True)
+        return await loop.run_in_executor(get_process_executor(), call)
+
+
+def get_executor_stats() -> Dict[str, Any]:
+    """Configured sizes and current backlog of the executors"""
+    with _lock:
+        thread_executor = _thread_executor
+        process_executor = _process_executor
+    return {
+        "thread_pool": {
+            "max_workers": settings.THREAD_POOL_SIZE,
+            "started": thread_executor is not None,
+            "queued": thread_executor._work_queue.qsize() if thread_executor is not None else 0,
+        },
+        "process_pool": {
+            "max_workers": settings.PROCESS_POOL_SIZE,
+            "kind": "process" if settings.PROCESS_POOL_SIZE > 0 else "thread",
+            "started": process_executor is not None,
+        },
+    }
+
+
+def shutdown_executors() -> None:
+    """Shut down both pools (called on application shutdown)"""
+    global _thread_executor, _process_executor
+    with _lock:
+        executors = [_thread_executor, _process_executor]
+        _thread_executor = None
+        _process_executor = None
+    for executor in executors:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
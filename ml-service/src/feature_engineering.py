@@ -1,15 +1,40 @@
 """
 Feature engineering for prediction
 Integrated with the actual feature engineering from predict_one.py
+
+prepare_features() handles one stockpile dictionary; prepare_features_batch()
+computes the same features for many stockpiles from columnar inputs.
 """
+import warnings
+import numpy as np
 import pandas as pd
-from typing import Dict, Any, Optional
-from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import date, datetime, timedelta
 import logging
 from src.database import DatabaseService
+from src.weather_index import weather_index
 
 logger = logging.getLogger(__name__)
 
+# Model feature columns, in the order the model was trained on
+FEATURE_COLUMNS = [
+    'Максимальная температура',
+    'age_days',
+    'temp_air',
+    'humidity',
+    'precip',
+    'temp_delta_3d'
+]
+
+# Weather used when there is no data for the target day
+WEATHER_DEFAULTS = {
+    'temp_air': 20.0,
+    'humidity': 60.0,
+    'precip': 0.0,
+}
+
+WEATHER_COLUMNS = list(WEATHER_DEFAULTS)
+
 
 def prepare_features(
     stockpile_data: Dict[str, Any],
@@ -75,7 +100,12 @@ def prepare_features(
         humidity = None
         precip = None
         
-        if db_service:
+        if weather_index.is_loaded:
+            # Daily aggregates from the in-memory index, no query per prediction
+            daily_weather = weather_index.get(target_date_date)
+            if daily_weather is not None:
+                temp_air, humidity, precip = daily_weather
+        elif db_service:
             try:
                 # Get weather data for the date
                 start_date = target_date.replace(hour=0, minute=0, second=0, microsecond=0)
@@ -156,6 +186,259 @@ def prepare_features(
         raise
 
 
+def _naive_datetime(value: Any) -> Any:
+    """One value as a timezone-naive Timestamp (wall time kept), NaT if missing"""
+    if value is None or (not isinstance(value, (str, date)) and pd.isna(value)):
+        return pd.NaT
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    value = pd.Timestamp(value)
+    return value.tz_localize(None) if value.tzinfo else value
+
+
+def to_naive_datetimes(values: Any) -> pd.Series:
+    """
+    Convert a column of dates (strings, datetimes, Timestamps) to datetime64
+    
+    Timezones are dropped keeping the wall time, like
+    datetime.replace(tzinfo=None) in prepare_features(). Mixed timezones
+    fall back to per-value conversion.
+    """
+    values = values if isinstance(values, pd.Series) else pd.Series(values)
+    try:
+        with warnings.catch_warnings():
+            # Mixed timezones give object dtype (handled below) with a FutureWarning
+            warnings.simplefilter("ignore", FutureWarning)
+            result = pd.to_datetime(values, errors="coerce", format="ISO8601")
+    except (ValueError, TypeError):
+        result = None
+    if result is None or result.dtype == object:
+        return pd.Series(
+            [_naive_datetime(value) for value in values], index=values.index, dtype="datetime64[ns]"
+        )
+    if isinstance(result.dtype, pd.DatetimeTZDtype):
+        result = result.dt.tz_localize(None)
+    return result
+
+
+def _daily_weather(
+    days: pd.DatetimeIndex,
+    weather: Optional[pd.DataFrame],
+    db_service: Optional[DatabaseService],
+) -> pd.DataFrame:
+    """
+    Weather aggregates per day, indexed by day
+    
+    Days without data get WEATHER_DEFAULTS. NaN aggregates of days that do
+    have data are kept, as in prepare_features().
+    """
+    daily = pd.DataFrame(np.nan, index=days, columns=WEATHER_COLUMNS)
+    found = pd.Series(False, index=days)
+    
+    if weather is not None:
+        weather = weather.set_axis(pd.to_datetime(weather.index).normalize())
+        weather = weather[~weather.index.duplicated(keep="last")]
+        present = days.isin(weather.index)
+        daily.loc[present] = weather.loc[days[present], WEATHER_COLUMNS].to_numpy()
+        found[present] = True
+    elif weather_index.is_loaded:
+        for day in days:
+            aggregates = weather_index.get(day.date())
+            if aggregates is not None:
+                daily.loc[day] = list(aggregates)
+                found[day] = True
+    elif db_service:
+        for day in days:
+            try:
+                weather_df = db_service.get_weather_data(day.to_pydatetime(), (day + pd.Timedelta(days=1)).to_pydatetime())
+            except Exception as e:
+                logger.warning(f"Error fetching weather data: {e}")
+                continue
+            if not weather_df.empty:
+                daily.loc[day] = [
+                    weather_df['t'].max() if 't' in weather_df.columns else np.nan,
+                    weather_df['humidity'].mean() if 'humidity' in weather_df.columns else np.nan,
+                    weather_df['precipitation'].sum() if 'precipitation' in weather_df.columns else np.nan,
+                ]
+                found[day] = True
+    
+    for column, default in WEATHER_DEFAULTS.items():
+        daily.loc[~found, column] = default
+    return daily
+
+
+def _history_aggregates(
+    stockpiles: pd.DataFrame,
+    temperatures: pd.DataFrame,
+    targets: pd.Series,
+    key: str,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Per-stockpile hottest non-zero temperature and 3-day lag temperature
+    from the temperature history
+    
+    Returns:
+        (hottest, 0 without records; temperature of the latest record in
+        [target - 3 days, target), NaN without one), aligned with stockpiles
+    """
+    n_rows = len(stockpiles)
+    keys = pd.Index(stockpiles[key].to_numpy())
+    if keys.is_unique:
+        # Position of each record's stockpile without a merge
+        record_rows = keys.get_indexer(temperatures[key].to_numpy())
+        linked = record_rows >= 0
+        history = pd.DataFrame({
+            "record_date": temperatures["record_date"].to_numpy()[linked],
+            "max_temp": temperatures["max_temp"].to_numpy()[linked],
+            "_row": record_rows[linked],
+        })
+    else:
+        rows = pd.DataFrame({key: keys, "_row": np.arange(n_rows)})
+        history = temperatures[[key, "record_date", "max_temp"]].merge(rows, on=key)
+    history_temp = pd.to_numeric(history["max_temp"], errors="coerce")
+    
+    valid_temp = history_temp.notna() & (history_temp != 0)
+    hottest = (
+        history_temp[valid_temp].groupby(history["_row"][valid_temp]).max()
+        .reindex(range(n_rows)).fillna(0.0).to_numpy()
+    )
+    
+    record_date = to_naive_datetimes(history["record_date"])
+    row_target = targets.to_numpy()[history["_row"].to_numpy()]
+    in_window = (
+        history_temp.notna().to_numpy()
+        & (record_date.to_numpy() >= row_target - np.timedelta64(3, 'D'))
+        & (record_date.to_numpy() < row_target)
+    )
+    window = pd.DataFrame({
+        "_row": history["_row"].to_numpy()[in_window],
+        "record_date": record_date.to_numpy()[in_window],
+        "max_temp": history_temp.to_numpy()[in_window],
+    })
+    latest = (
+        window.sort_values(["_row", "record_date"], ascending=[True, False], kind="stable")
+        .drop_duplicates("_row")
+        .set_index("_row")["max_temp"]
+        .reindex(range(n_rows))
+        .to_numpy()
+    )
+    return hottest, latest
+
+
+def prepare_features_batch(
+    stockpiles: pd.DataFrame,
+    temperatures: Optional[pd.DataFrame],
+    target_date: Any = None,
+    weather: Optional[pd.DataFrame] = None,
+    db_service: Optional[DatabaseService] = None,
+    key: str = "shtabel_id",
+    history: Optional[pd.DataFrame] = None,
+) -> pd.DataFrame:
+    """
+    Vectorized prepare_features() for many stockpiles
+    
+    The same features are computed with column operations over all
+    stockpiles at once: no per-record loops, date parsing or sorting of
+    dictionaries. Two corner cases that make prepare_features() raise are
+    handled instead: records without max_temp are skipped when looking for
+    the 3-day lag, and a stockpile whose last_temp and history temperatures
+    are all zero/missing gets Максимальная температура = 0.
+    
+    Args:
+        stockpiles: One row per stockpile with columns key, last_temp and formed_at
+        temperatures: Temperature history in long format with columns key,
+            record_date and max_temp (any order)
+        target_date: Prediction date, one for all stockpiles or a sequence
+            with one per stockpile row (default: now)
+        weather: Daily weather indexed by day with columns temp_air,
+            humidity and precip (default: weather index, else db_service)
+        db_service: Database service for weather when the weather index is not loaded
+        key: Column linking temperature records to stockpiles
+        history: Per-stockpile history aggregates aligned with stockpiles,
+            columns hottest and temp_lag_3d (NaN: none), e.g. from the
+            rolling feature state; temperatures is then not scanned
+        
+    Returns:
+        DataFrame with FEATURE_COLUMNS, one row per stockpile in input order
+    """
+    n_rows = len(stockpiles)
+    if target_date is None:
+        target_date = datetime.now()
+    if isinstance(target_date, (str, datetime, date, np.datetime64)):
+        targets = pd.Series(pd.Timestamp(target_date), index=range(n_rows))
+    else:
+        targets = to_naive_datetimes(list(target_date)).set_axis(range(n_rows))
+    
+    # 1. Максимальная температура: last_temp, else the hottest non-zero record
+    last_temp = pd.to_numeric(stockpiles["last_temp"], errors="coerce").fillna(0.0).to_numpy(dtype=float)
+    if history is None:
+        hottest, latest = _history_aggregates(stockpiles, temperatures, targets, key)
+    else:
+        hottest = history["hottest"].fillna(0.0).to_numpy(dtype=float)
+        latest = history["temp_lag_3d"].to_numpy(dtype=float)
+    current_temp = np.where(last_temp == 0, hottest, last_temp)
+    
+    # 2. Возраст штабеля в днях (не меньше 0)
+    formed_at = to_naive_datetimes(stockpiles["formed_at"]).set_axis(range(n_rows))
+    age_days = (targets - formed_at).dt.days.clip(lower=0).fillna(0).astype(int)
+    
+    # 3. Погода на день прогноза
+    days = targets.dt.normalize()
+    daily = _daily_weather(pd.DatetimeIndex(days.unique()), weather, db_service)
+    weather_rows = daily.reindex(days)
+    
+    # 4. temp_delta_3d: current temperature minus the latest record of the 3 days before
+    temp_delta_3d = np.where(np.isnan(latest), 0.0, current_temp - latest)
+    
+    return pd.DataFrame({
+        'Максимальная температура': current_temp,
+        'age_days': age_days.to_numpy(),
+        'temp_air': weather_rows['temp_air'].to_numpy(),
+        'humidity': weather_rows['humidity'].to_numpy(),
+        'precip': weather_rows['precip'].to_numpy(),
+        'temp_delta_3d': temp_delta_3d,
+    }, columns=FEATURE_COLUMNS)
+
+
+def stockpile_frames(
+    stockpiles: List[Dict[str, Any]],
+    with_temperatures: bool = True,
+) -> Tuple[pd.DataFrame, Optional[pd.DataFrame]]:
+    """
+    Columnar inputs for prepare_features_batch() from stockpile dictionaries
+    
+    Both frames are keyed by "stockpile", the position in the list, so
+    duplicate or missing shtabel_id values are handled.
+    
+    Args:
+        stockpiles: Stockpile data dictionaries
+        with_temperatures: Build the temperatures frame (not needed with history=)
+    
+    Returns:
+        (stockpiles frame, temperatures frame or None); use key="stockpile"
+    """
+    stockpiles_df = pd.DataFrame({
+        "stockpile": np.arange(len(stockpiles)),
+        "last_temp": [stockpile_data.get("last_temp") for stockpile_data in stockpiles],
+        "formed_at": [stockpile_data.get("formed_at") for stockpile_data in stockpiles],
+    })
+    if not with_temperatures:
+        return stockpiles_df, None
+    
+    positions, record_dates, max_temps = [], [], []
+    for i, stockpile_data in enumerate(stockpiles):
+        for record in stockpile_data.get("temperatures") or ():
+            positions.append(i)
+            record_dates.append(record.get("record_date"))
+            max_temps.append(record.get("max_temp"))
+    temperatures_df = pd.DataFrame({
+        "stockpile": np.array(positions, dtype=np.int64),
+        "record_date": record_dates,
+        "max_temp": max_temps,
+    })
+    return stockpiles_df, temperatures_df
+
+
 def preprocess_data(raw_data: pd.DataFrame) -> pd.DataFrame:
     """
     Preprocess raw data using the actual preprocessing pipeline
@@ -0,0 +1,239 @@
+"""
+Feature store: materialized feature vectors in the FeatureVector table
+
+refresh() computes feature vectors for stockpiles whose inputs changed
+(new temperature data, new weather, another model version or a new day)
+and bulk-writes them. The predictor reads the latest vector attached by
+DatabaseService.get_stockpiles_data() and computes features live only when
+the vector is missing or stale.
+
+Each FeatureVector.features document holds the feature values and the
+source signature they were computed from:
+    {"values": {...}, "target_day": "...", "source": {...}}
+"""
+import math
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+import logging
+
+import pandas as pd
+
+from src.config import settings
+from src.database import DatabaseService
+from src.feature_engineering import FEATURE_COLUMNS, prepare_features
+from src.model_manager import model_manager
+from src.weather_index import weather_index
+
+logger = logging.getLogger(__name__)
+
+# Stockpiles loaded per bulk query during refresh
+REFRESH_CHUNK_SIZE = 500
+
+
+def _iso(value: Any) -> Optional[str]:
+    """Timestamp as a comparable ISO string (tz-aware values in UTC)"""
+    if value is None:
+        return None
+    value = pd.Timestamp(value)
+    if value.tzinfo is not None:
+        value = value.tz_convert("UTC")
+    return value.isoformat()
+
+
+def source_signature(stockpile_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Inputs a feature vector depends on, besides the target day
+
+    A vector whose signature differs from the current one was computed
+    before new temperature or weather data arrived.
+    """
+    if "last_record_date" in stockpile_data:
+        # Live fetches may carry only the records after the rolling feature watermark
+        last_record_date = stockpile_data["last_record_date"]
+    else:
+        temperatures = stockpile_data.get("temperatures") or []
+        last_record_date = temperatures[0].get("record_date") if temperatures else None
+    return {
+        "last_temp": stockpile_data.get("last_temp"),
+        "last_temp_date": _iso(stockpile_data.get("last_temp_date")),
+        "last_record_date": _iso(last_record_date),
+        "formed_at": _iso(stockpile_data.get("formed_at")),
+        "weather_watermark": _iso(weather_index.watermark),
+    }
+
+
+def _current_model_version() -> str:
+    info = model_manager.get_model_info()
+    return info.get("model_version", "1.0.0") if info else "1.0.0"
+
+
+class FeatureStore:
+    """Computes, writes and serves materialized feature vectors"""
+
+    def __init__(self, max_age_seconds: float = 3600.0):
+        """
+        Args:
+            max_age_seconds: Vectors computed longer ago are treated as stale
+        """
+        self.db_service = DatabaseService()
+        self.max_age_seconds = max_age_seconds
+        self._stats = {"hits": 0, "missing": 0, "stale": 0, "refreshes": 0, "vectors_written": 0}
+
+    def _is_fresh(
+        self,
+        vector: Dict[str, Any],
+        stockpile_data: Dict[str, Any],
+        target_date: datetime,
+        model_version: str,
+    ) -> bool:
+        """Vector matches the model version, target day and current inputs, and is recent"""
+        document = vector.get("features") or {}
+        if vector.get("model_version") != model_version:
+            return False
+        if document.get("target_day") != target_date.date().isoformat():
+            return False
+        if document.get("source") != source_signature(stockpile_data):
+            return False
+        computed_at = pd.Timestamp(vector["ts"])
+        if computed_at.tzinfo is None:
+            computed_at = computed_at.tz_localize("UTC")
+        age = (pd.Timestamp.now(tz="UTC") - computed_at).total_seconds()
+        return age <= self.max_age_seconds
+
+    def lookup(
+        self,
+        stockpile_data: Dict[str, Any],
+        target_date: datetime,
+        model_version: Optional[str] = None,
+    ) -> Optional[pd.DataFrame]:
+        """
+        Feature row from the latest materialized vector
+
+        Args:
+            stockpile_data: Stockpile data with "feature_vector" from get_stockpiles_data()
+            target_date: Prediction time
+            model_version: Version the vector must be computed for (default: loaded model)
+
+        Returns:
+            Single-row DataFrame like prepare_features(), or None if missing or stale
+        """
+        vector = stockpile_data.get("feature_vector")
+        if not vector:
+            self._stats["missing"] += 1
+            return None
+
+        if not self._is_fresh(vector, stockpile_data, target_date, model_version or _current_model_version()):
+            self._stats["stale"] += 1
+            return None
+
+        values = vector["features"].get("values", {})
+        if any(name not in values for name in FEATURE_COLUMNS):
+            self._stats["stale"] += 1
+            return None
+
+        self._stats["hits"] += 1
+        return pd.DataFrame([{
+            name: math.nan if values[name] is None else values[name]
+            for name in FEATURE_COLUMNS
+        }])
+
+    def compute_vector(
+        self,
+        stockpile_data: Dict[str, Any],
+        target_date: datetime,
+        model_version: str,
+    ) -> Dict[str, Any]:
+        """Compute the FeatureVector row for a stockpile"""
+        row = prepare_features(stockpile_data, target_date=target_date, db_service=self.db_service).iloc[0]
+        values = {}
+        for name in FEATURE_COLUMNS:
+            value = row[name].item() if hasattr(row[name], "item") else row[name]
+            # NaN is not valid JSON
+            values[name] = None if isinstance(value, float) and math.isnan(value) else value
+
+        return {
+            "ts": datetime.now(timezone.utc),
+            "sklad_id": stockpile_data["sklad_id"],
+            "shtabel_id": stockpile_data["shtabel_id"],
+            "model_version": model_version,
+            "features": {
+                "values": values,
+                "target_day": target_date.date().isoformat(),
+                "source": source_signature(stockpile_data),
+            },
+        }
+
+    def refresh(
+        self,
+        shtabel_ids: Optional[List[int]] = None,
+        sklad_id: Optional[int] = None,
+        force: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Materialize feature vectors for stockpiles whose inputs changed
+
+        Args:
+            shtabel_ids: Stockpiles to refresh (default: all active, optionally of sklad_id)
+            sklad_id: Warehouse filter when shtabel_ids is not given
+            force: Recompute even fresh vectors
+
+        Returns:
+            Refresh statistics
+        """
+        started = time.perf_counter()
+        target_date = datetime.now()
+        model_version = _current_model_version()
+
+        if shtabel_ids is None:
+            shtabel_ids = self.db_service.get_active_shtabel_ids(sklad_id)
+
+        checked, fresh, written = 0, 0, 0
+        errors = []
+        for start in range(0, len(shtabel_ids), REFRESH_CHUNK_SIZE):
+            stockpiles = self.db_service.get_stockpiles_data(shtabel_ids[start:start + REFRESH_CHUNK_SIZE])
+            vectors = []
+            for stockpile_data in stockpiles.values():
+                checked += 1
+                vector = stockpile_data.get("feature_vector")
+                if not force and vector and self._is_fresh(vector, stockpile_data, target_date, model_version):
+                    fresh += 1
+                    continue
+                try:
+                    vectors.append(self.compute_vector(stockpile_data, target_date, model_version))
+                except Exception as e:
+                    errors.append({"shtabel_id": stockpile_data["shtabel_id"], "error": str(e)})
+            written += self.db_service.save_feature_vectors(vectors)
+
+        self._stats["refreshes"] += 1
+        self._stats["vectors_written"] += written
+        elapsed = time.perf_counter() - started
+        logger.info(
+            f"Feature store refresh: {checked} stockpiles, {written} vectors written, "
+            f"{fresh} fresh, {len(errors)} errors in {elapsed:.2f}s"
+        )
+
+        return {
+            "model_version": model_version,
+            "requested": len(shtabel_ids),
+            "checked": checked,
+            "written": written,
+            "fresh": fresh,
+            "failed": len(errors),
+            "errors": errors,
+            "elapsed_seconds": round(elapsed, 3),
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Lookup hit/miss counters and refresh totals"""
+        lookups = self._stats["hits"] + self._stats["missing"] + self._stats["stale"]
+        return {
+            "enabled": settings.FEATURE_STORE_ENABLED,
+            "max_age_seconds": self.max_age_seconds,
+            "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+            **self._stats,
+        }
+
+
+# Global feature store instance
+feature_store = FeatureStore(max_age_seconds=settings.FEATURE_STORE_MAX_AGE_SECONDS)
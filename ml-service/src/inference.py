@@ -0,0 +1,133 @@
+"""
+Shared inference adapter
+
+All prediction paths score features through predict_positive(). Features are
+converted once into a C-contiguous float32 matrix in the model's feature
+order, and XGBoost models are called via Booster.inplace_predict. This skips
+the sklearn wrapper's column validation and DMatrix construction on every
+call. The compiled NumPy engine (src/tree_engine.py) receives the same
+matrix.
+
+xgboost is not imported here. A model can only be an XGBModel if
+ModelManager already imported xgboost to load it, so replicas serving the
+NumPy engine never pay its import time.
+"""
+import json
+import sys
+import numpy as np
+import pandas as pd
+from typing import Any, List, Optional, Sequence, Tuple
+import logging
+
+from src.feature_engineering import FEATURE_COLUMNS
+from src.perf_metrics import stage
+
+logger = logging.getLogger(__name__)
+
+# Objectives whose inplace_predict output already is the positive-class probability
+PROBABILITY_OBJECTIVES = ("binary:logistic", "reg:logistic")
+
+
+def _is_xgb_model(model: Any) -> bool:
+    xgb = sys.modules.get("xgboost")
+    return xgb is not None and isinstance(model, xgb.XGBModel)
+
+
+def model_feature_names(model: Any) -> List[str]:
+    """Feature order the model was trained with (FEATURE_COLUMNS if unknown)"""
+    names = getattr(model, "feature_names", None)
+    if names:
+        return list(names)
+    if _is_xgb_model(model):
+        names = model.get_booster().feature_names
+        if names:
+            return list(names)
+    return list(FEATURE_COLUMNS)
+
+
+def to_feature_matrix(X: Any, feature_names: Optional[Sequence[str]] = None) -> np.ndarray:
+    """
+    Convert features to a C-contiguous float32 matrix
+
+    Args:
+        X: DataFrame (columns are selected by name), 2-D array or list of rows
+            already in model feature order, or a single row
+        feature_names: Column order for DataFrames (default: FEATURE_COLUMNS)
+
+    Returns:
+        Array of shape (n_rows, n_features), dtype float32
+    """
+    if isinstance(X, pd.DataFrame):
+        names = list(feature_names or FEATURE_COLUMNS)
+        missing = [name for name in names if name not in X.columns]
+        if missing:
+            raise ValueError(f"Missing feature columns: {missing}")
+        # Column selection copies the frame; skip it when the order already matches
+        if list(X.columns) != names:
+            X = X[names]
+        X = X.to_numpy(dtype=np.float32)
+
+    matrix = np.ascontiguousarray(X, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    return matrix
+
+
+def _iteration_range(model: Any) -> Tuple[int, int]:
+    """Trees used by the sklearn wrapper's predict (best_iteration after early stopping)"""
+    try:
+        return 0, model.best_iteration + 1
+    except AttributeError:
+        return 0, 0
+
+
+def _objective(booster: Any) -> str:
+    # Cached on the booster object: save_config() serializes the whole config
+    objective = getattr(booster, "_inference_objective", None)
+    if objective is None:
+        objective = json.loads(booster.save_config())["learner"]["objective"]["name"]
+        booster._inference_objective = objective
+    return objective
+
+
+def predict_positive(model: Any, X: Any, model_version: Optional[str] = None) -> np.ndarray:
+    """
+    Probability of the positive class (fire) for each row
+
+    Args:
+        model: Loaded model (XGBClassifier or CompiledTreeEnsemble)
+        X: Features, see to_feature_matrix()
+        model_version: Label of the "inference" latency stage (default: current model)
+
+    Returns:
+        1-D array of probabilities, same values as model.predict_proba(X)[:, 1]
+    """
+    feature_names = model_feature_names(model)
+    matrix = to_feature_matrix(X, feature_names)
+    if len(matrix) == 0:
+        return np.empty(0, dtype=np.float32)
+
+    with stage("inference", model_version):
+        return _predict_matrix(model, matrix, feature_names)
+
+
+def _predict_matrix(model: Any, matrix: np.ndarray, feature_names: List[str]) -> np.ndarray:
+    if _is_xgb_model(model):
+        booster = model.get_booster()
+        if _objective(booster) in PROBABILITY_OBJECTIVES:
+            return booster.inplace_predict(
+                matrix,
+                iteration_range=_iteration_range(model),
+                validate_features=False,
+            )
+
+        # Other objectives: the sklearn wrapper validates feature names
+        return np.asarray(model.predict_proba(pd.DataFrame(matrix, columns=feature_names)))[:, 1]
+
+    # Compiled NumPy engine
+    return np.asarray(model.predict_proba(matrix))[:, 1]
+
+
+def predict_labels(proba: np.ndarray) -> np.ndarray:
+    """Binary predictions with the 0.5 threshold used by XGBClassifier.predict"""
+    return (np.asarray(proba) > 0.5).astype(int)
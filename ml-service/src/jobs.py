@@ -0,0 +1,84 @@
+"""
+Heavy jobs executed in the process pool (see src/executors.py)
+
+Every job is a module-level function so it can be pickled. Worker processes
+have their own ModelManager; jobs that need a model first make sure the
+worker has loaded the same model as the serving process.
+"""
+from typing import Any, Dict, Optional
+import logging
+
+from src.model_manager import model_manager
+from src.perf_metrics import collect_timing
+from src.profiler import JobProfiler
+
+logger = logging.getLogger(__name__)
+
+
+def current_model_ref() -> Optional[Dict[str, str]]:
+    """Name/version of the model loaded in this process, to hand over to a job"""
+    info = model_manager.get_model_info()
+    if not info or not model_manager.is_model_loaded():
+        return None
+    return {
+        "model_name": info.get("model_name", "coal_fire_model"),
+        "model_version": info.get("model_version", "1.0.0"),
+    }
+
+
+def _ensure_model(model_ref: Optional[Dict[str, str]]) -> None:
+    """Load the referenced model in this worker unless it is already loaded"""
+    if not model_ref:
+        return
+    if model_manager.is_model_loaded() and current_model_ref() == model_ref:
+        return
+    logger.info(f"Worker loading model {model_ref['model_name']} v{model_ref['model_version']}")
+    model_manager.load_model(model_ref["model_name"], model_ref["model_version"])
+
+
+def predict_from_csv_job(
+    model_ref: Optional[Dict[str, str]],
+    timing_request_id: Optional[str] = None,
+    profile_plan: Optional[Dict[str, Any]] = None,
+    **kwargs: Any,
+) -> Dict[str, Any]:
+    """
+    CSVPredictor.predict_from_csv in a worker process
+
+    With timing_request_id the worker's timing breakdown is returned under
+    "timing" (context variables do not cross the process boundary). A kept
+    profile (see JobProfiler.plan) is returned under "profile".
+    """
+    _ensure_model(model_ref)
+    from src.csv_predictor import csv_predictor
+    if timing_request_id is None:
+        result, profile = JobProfiler.run(profile_plan, csv_predictor.predict_from_csv, **kwargs)
+    else:
+        with collect_timing(timing_request_id) as timing:
+            result, profile = JobProfiler.run(profile_plan, csv_predictor.predict_from_csv, **kwargs)
+        result["timing"] = timing.as_dict()
+    result["profile"] = profile
+    return result
+
+
+def validate_from_csv_job(
+    model_ref: Optional[Dict[str, str]],
+    profile_plan: Optional[Dict[str, Any]] = None,
+    **kwargs: Any,
+) -> Dict[str, Any]:
+    """ModelValidator.validate_from_csv in a worker process (kept profile under "profile")"""
+    _ensure_model(model_ref)
+    from src.validator import validator
+    result, profile = JobProfiler.run(profile_plan, validator.validate_from_csv, **kwargs)
+    result["profile"] = profile
+    return result
+
+
+def train_model_job(
+    model_name: str,
+    model_version: str,
+    config: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Trainer.train_model in a worker process"""
+    from src.trainer import trainer
+    return trainer.train_model(model_name, model_version, config)
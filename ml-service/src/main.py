@@ -1,23 +1,43 @@
 """
 FastAPI application for ML Service
 """
+# First import: times every import below (GET /startup)
+from src.startup import startup_report
+
 from fastapi import FastAPI, HTTPException, BackgroundTasks, UploadFile, File, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, AsyncIterator, Iterator
+import asyncio
+import json
+import time
 import uvicorn
 import logging
 from datetime import datetime, timedelta
 
 # Import our modules
-from src.config import settings
-from src.database import DatabaseService, SessionLocal
+from src.config import settings, worker_index
+from src.database import DatabaseService, SessionLocal, get_pool_stats
 from src.model_manager import model_manager
 from src.predictor import predictor
-from src.trainer import trainer
-from src.validator import validator
-from src.csv_predictor import csv_predictor
+from src.batch_predictor import batch_predictor
+from src.feature_engineering import FEATURE_COLUMNS
+from src.micro_batcher import MicroBatcher
+from src.inference import predict_positive
+from src.weather_index import weather_index
+from src.feature_store import feature_store
+from src.rolling_features import rolling_features
+from src.cache import LRUCache
+from src.warmup import warmup, WARMUP_RETRY_MAX_SECONDS
+from src.perf_metrics import (
+    stage, stage_histograms, endpoint_label, request_timing, worker_label, PerfMiddleware, TimedJSONResponse,
+)
+from src.executors import run_in_thread, run_in_process, get_thread_executor, get_executor_stats, shutdown_executors
+from src.jobs import current_model_ref, predict_from_csv_job, validate_from_csv_job, train_model_job
+from src.profiler import job_profiler
 from sqlalchemy import text
+import numpy as np
 
 # Configure logging
 logging.basicConfig(
@@ -30,6 +50,7 @@ app = FastAPI(
     title="Coal Fire Predictor ML Service",
     description="Machine Learning service for predicting coal self-ignition",
     version="1.0.0",
+    default_response_class=TimedJSONResponse,
 )
 
 # CORS - разрешаем все origins для валидации и других операций
@@ -49,10 +70,243 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Stage histograms (GET /perf/metrics) and the per-request X-Timing breakdown
+app.add_middleware(PerfMiddleware)
+
 # Initialize services
 db_service = DatabaseService()
 
 
+def _predict_direct_batch(rows: np.ndarray) -> np.ndarray:
+    """Score a batch of /predict/direct feature vectors with one model call"""
+    model = model_manager.get_model()
+    if not model:
+        raise RuntimeError("Model not available")
+    # Batcher threads do not inherit the request context
+    token = endpoint_label.set("/predict/direct")
+    try:
+        return predict_positive(model, rows)
+    finally:
+        endpoint_label.reset(token)
+
+
+async def _require_model_version(model_version: Optional[str]) -> None:
+    """404 unless the requested registry version can be served (loads it on a miss)"""
+    if model_version is None:
+        return
+    model = await run_in_thread(model_manager.get_model, model_version)
+    if model is None:
+        raise HTTPException(status_code=404, detail=f"Model version {model_version} not found")
+
+
+async def _load_stockpile(shtabel_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Load one stockpile for a live prediction via the async engine if enabled, else in a worker thread
+    
+    With the rolling feature state loaded only temperature records after its
+    watermark are fetched.
+    """
+    after = rolling_features.history_watermark
+    if db_service.async_enabled:
+        return await db_service.get_stockpile_data_async(shtabel_id, after)
+    return await run_in_thread(db_service.get_stockpile_data, shtabel_id, after)
+
+
+async def _load_stockpiles(shtabel_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """Bulk-load stockpiles for live predictions (see _load_stockpile)"""
+    after = rolling_features.history_watermark
+    if db_service.async_enabled:
+        return await db_service.get_stockpiles_data_async(shtabel_ids, after)
+    return await run_in_thread(db_service.get_stockpiles_data, shtabel_ids, after)
+
+
+async def _load_stockpile_watermark(shtabel_id: int) -> Optional[Dict[str, Any]]:
+    """Load the stockpile's temperature watermark via the async engine if enabled, else in a worker thread"""
+    if db_service.async_enabled:
+        return await db_service.get_stockpile_watermark_async(shtabel_id)
+    return await run_in_thread(db_service.get_stockpile_watermark, shtabel_id)
+
+
+def _timing_breakdown() -> Optional[Dict[str, Any]]:
+    """Timing breakdown of the current request (X-Timing header), also written to the log"""
+    timing = request_timing.get()
+    if timing is None:
+        return None
+    breakdown = timing.as_dict()
+    stages = ", ".join(f"{name}={entry['ms']:.1f}ms" for name, entry in breakdown["stages"].items())
+    logger.info(
+        f"Request {breakdown['request_id']} timing: total={breakdown['total_ms']:.1f}ms, "
+        f"{stages or 'no stages'}, {len(breakdown['db_queries'])} DB queries"
+    )
+    return breakdown
+
+
+def _with_timing(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of result with meta["timing"] if timing was requested (cached results stay untouched)"""
+    breakdown = _timing_breakdown()
+    if breakdown is None:
+        return result
+    return {**result, "meta": {**(result.get("meta") or {}), "timing": breakdown}}
+
+
+# ============================================
+# NDJSON streaming (format=ndjson)
+# ============================================
+# One JSON object per line: {"type": "prediction", ...} and {"type": "error", ...}
+# records as they are produced, then a trailing {"type": "summary", ...}.
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def _ndjson(record_type: str, record: Dict[str, Any]) -> bytes:
+    return (json.dumps({"type": record_type, **record}, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+
+
+async def _stream_batch_predictions(
+    shtabel_ids: List[int],
+    horizon_days: int,
+    model_version: Optional[str] = None,
+) -> AsyncIterator[bytes]:
+    """Load and score /predict/batch stockpiles chunk by chunk"""
+    chunk_size = max(1, settings.STREAM_CHUNK_SIZE)
+    success, failed = 0, 0
+    
+    for start in range(0, len(shtabel_ids), chunk_size):
+        chunk_ids = shtabel_ids[start:start + chunk_size]
+        try:
+            stockpiles_data = await _load_stockpiles(chunk_ids)
+        except Exception as e:
+            logger.error(f"Error loading stockpiles for batch prediction: {e}")
+            for shtabel_id in chunk_ids:
+                failed += 1
+                yield _ndjson("error", {"shtabel_id": shtabel_id, "error": str(e)})
+            continue
+        
+        stockpiles = []
+        lines = []
+        for shtabel_id in chunk_ids:
+            stockpile_data = stockpiles_data.get(shtabel_id)
+            if not stockpile_data:
+                failed += 1
+                lines.append(_ndjson("error", {"shtabel_id": shtabel_id, "error": "Stockpile not found"}))
+                continue
+            stockpiles.append(stockpile_data)
+        
+        prediction_results = await run_in_thread(
+            predictor.predict_batch, stockpiles, horizon_days=horizon_days, model_version=model_version
+        )
+        with stage("serialization", model_version):
+            for stockpile_data, prediction_result in zip(stockpiles, prediction_results):
+                try:
+                    lines.append(_ndjson("prediction", PredictionResponse(**prediction_result).dict()))
+                    success += 1
+                except Exception as e:
+                    failed += 1
+                    lines.append(_ndjson("error", {"shtabel_id": stockpile_data.get("shtabel_id"), "error": str(e)}))
+        
+        yield b"".join(lines)
+    
+    yield _ndjson("summary", _with_timing({"total": len(shtabel_ids), "success": success, "failed": failed}))
+
+
+async def _stream_csv_predictions(
+    first_chunk: List[Dict[str, Any]],
+    chunks: Iterator[List[Dict[str, Any]]],
+    prediction_date: datetime,
+    model_version: Optional[str] = None,
+) -> AsyncIterator[bytes]:
+    """Emit CSV prediction chunks as the worker thread scores them, then statistics"""
+    from src.csv_predictor import PredictionStatistics
+    
+    statistics = PredictionStatistics()
+    chunk = first_chunk
+    try:
+        while chunk is not None:
+            statistics.update(chunk)
+            with stage("serialization", model_version):
+                body = b"".join(_ndjson("prediction", p) for p in chunk)
+            yield body
+            chunk = await run_in_thread(next, chunks, None)
+    except Exception as e:
+        logger.error(f"Ошибка при потоковом прогнозировании из CSV: {e}", exc_info=True)
+        yield _ndjson("error", {"detail": str(e)})
+        return
+    
+    yield _ndjson("summary", _with_timing({
+        "success": True,
+        "statistics": statistics.as_dict(),
+        "model_info": model_manager.get_model_info(model_version),
+        "prediction_date": prediction_date.isoformat(),
+    }))
+
+
+# /predict results; keys change whenever the stockpile's temperature data,
+# the weather or the loaded model change, the TTL bounds drift of "now"
+prediction_cache = LRUCache(
+    "predict",
+    max_size=settings.PREDICTION_CACHE_SIZE,
+    ttl_seconds=settings.PREDICTION_CACHE_TTL_SECONDS,
+)
+
+
+# /predict/direct probabilities by normalized feature vector; dates are
+# always recomputed, so entries only depend on the features and the model
+direct_cache = LRUCache("predict_direct", max_size=settings.DIRECT_CACHE_SIZE)
+
+# Drop cached results whenever a model is loaded (/model/load, after /train)
+model_manager.add_reload_listener(prediction_cache.clear)
+model_manager.add_reload_listener(direct_cache.clear)
+# A model loaded after warm-up (/model/load, file watcher) is warmed before /ready counts it
+if settings.WARMUP_ENABLED:
+    model_manager.add_reload_listener(warmup.warm_loaded_model)
+
+
+def _model_cache_fields(model_version: Optional[str]) -> tuple:
+    """
+    Version and the generation of the model serving it, so reloading that
+    version (current or a registry one) changes the key
+    """
+    if model_version is not None:
+        return model_version, model_manager.get_generation(model_version)
+    # One snapshot, so a concurrent reload cannot mix version and generation
+    active = model_manager.get_active()
+    if active is None:
+        return None, 0
+    return active.info.get("model_version"), active.generation
+
+
+def _direct_cache_key(row: List[float], model_version: Optional[str] = None) -> tuple:
+    # float() unifies 12 / 12.0, + 0.0 unifies -0.0 / 0.0
+    return (
+        tuple(float(value) + 0.0 for value in row),
+        *_model_cache_fields(model_version),
+    )
+
+
+def _prediction_cache_key(
+    watermark: Dict[str, Any],
+    horizon_days: int,
+    model_version: Optional[str] = None,
+) -> tuple:
+    return (
+        watermark["shtabel_id"],
+        horizon_days,
+        *_model_cache_fields(model_version),
+        watermark["last_temp_date"],
+        watermark["last_record_date"],
+        weather_index.watermark,
+    )
+
+
+# Coalesces concurrent /predict/direct requests into batched model calls
+direct_batcher = MicroBatcher(
+    _predict_direct_batch,
+    window_ms=settings.DIRECT_BATCH_WINDOW_MS,
+    max_batch_size=settings.DIRECT_BATCH_MAX_SIZE,
+    executor=get_thread_executor,
+)
+
+
 # ============================================
 # Request/Response Models
 # ============================================
@@ -60,6 +314,7 @@ db_service = DatabaseService()
 class PredictionRequest(BaseModel):
     shtabel_id: int
     horizon_days: Optional[int] = 7
+    model_version: Optional[str] = None  # Версия из реестра моделей (по умолчанию текущая)
 
 
 class DirectPredictionRequest(BaseModel):
@@ -71,11 +326,36 @@ class DirectPredictionRequest(BaseModel):
     precip: Optional[float] = 0.0  # Осадки
     temp_delta_3d: Optional[float] = 0.0  # Изменение температуры за 3 дня
     horizon_days: Optional[int] = 7
+    model_version: Optional[str] = None  # Версия из реестра моделей (по умолчанию текущая)
 
 
 class BatchPredictionRequest(BaseModel):
     shtabel_ids: List[int]
     horizon_days: Optional[int] = 7
+    model_version: Optional[str] = None  # Версия из реестра моделей (по умолчанию текущая)
+
+
+class FleetPredictionRequest(BaseModel):
+    sklad_id: Optional[int] = None  # По умолчанию все склады
+    horizon_days: Optional[int] = 7
+    threshold: float = 0.5
+    persist: bool = False  # Сохранить прогнозы в таблицу Prediction
+    model_version: Optional[str] = None  # Версия из реестра моделей (по умолчанию текущая)
+
+
+class FeatureRefreshRequest(BaseModel):
+    shtabel_ids: Optional[List[int]] = None  # По умолчанию все активные штабели
+    sklad_id: Optional[int] = None
+    force: bool = False
+
+
+class ProfilerConfigRequest(BaseModel):
+    """Изменение настроек профилировщика; не переданные поля не меняются"""
+    enabled: Optional[bool] = None
+    every_n: Optional[int] = None  # Сохранять каждый N-й запуск (0 — выключено)
+    threshold_ms: Optional[float] = None  # Сохранять запуски не быстрее порога (0 — выключено)
+    interval_ms: Optional[float] = None  # Интервал между сэмплами стека
+    max_files: Optional[int] = None  # Размер кольца профилей на диске
 
 
 class PredictionResponse(BaseModel):
@@ -123,12 +403,19 @@ class CSVPredictionResponse(BaseModel):
     statistics: Optional[Dict[str, Any]] = None
     model_info: Optional[Dict[str, Any]] = None
     prediction_date: Optional[str] = None
+    meta: Optional[Dict[str, Any]] = None  # {"timing": ...} при заголовке X-Timing
 
 
 # ============================================
 # Health Check
 # ============================================
 
+def _check_database() -> None:
+    """Simple query to check DB connection"""
+    with SessionLocal() as session:
+        session.execute(text("SELECT 1"))
+
+
 @app.get("/health")
 async def health_check():
     """
@@ -139,9 +426,7 @@ async def health_check():
         # Check database connection
         db_status = "connected"
         try:
-            # Simple query to check DB connection
-            with SessionLocal() as session:
-                session.execute(text("SELECT 1"))
+            await run_in_thread(_check_database)
         except Exception as e:
             db_status = f"disconnected: {str(e)}"
             logger.warning(f"Database health check failed: {e}")
@@ -159,6 +444,8 @@ async def health_check():
                 "status": model_status,
                 "info": model_info if model_info else None,
             },
+            "executors": get_executor_stats(),
+            "weather_index": weather_index.get_stats(),
             "timestamp": datetime.now().isoformat(),
         }
     except Exception as e:
@@ -171,6 +458,122 @@ async def health_check():
         }
 
 
+@app.get("/ready")
+async def readiness_check():
+    """
+    Readiness probe for the load balancer
+    
+    503 until startup warm-up (model, inference path, DB pool) has finished,
+    and afterwards while no model is loaded or a warm-up step (DB pool,
+    end-to-end predictions) failed, unless WARMUP_BEST_EFFORT is set;
+    /health stays a liveness check.
+    """
+    status = warmup.get_status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+
+@app.get("/startup")
+async def startup_timing():
+    """
+    Cold-start timing: import time per module, model load, weather index and warm-up
+    """
+    return startup_report.get_report()
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """
+    Hit/miss statistics of the prediction caches
+    """
+    return {
+        "predict": prediction_cache.get_stats(),
+        "predict_direct": direct_cache.get_stats(),
+    }
+
+
+@app.get("/db/pool")
+async def db_pool_stats():
+    """
+    Connection pool status and checkout wait-time metrics
+    """
+    return get_pool_stats()
+
+
+@app.get("/perf/metrics", response_class=PlainTextResponse)
+async def perf_metrics():
+    """
+    Per-stage latency histograms in Prometheus text format
+    
+    Stages: db_fetch, db_watermark, prepare_features, inference, postprocess,
+    serialization and request; labelled by endpoint, model version and
+    worker (serve.py worker index, else the process id).
+    """
+    return PlainTextResponse(
+        stage_histograms.render_prometheus(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+@app.get("/perf/stats")
+async def perf_stats():
+    """
+    Per-stage latency summary: count, mean, max and p50/p95/p99 (ms, bucket estimates)
+    """
+    return {
+        "enabled": stage_histograms.enabled,
+        "worker": worker_label(),
+        "stages": stage_histograms.get_stats(),
+    }
+
+
+@app.get("/admin/profiler")
+async def profiler_status():
+    """
+    Sampling profiler settings, counters and number of stored profiles
+    """
+    return await run_in_thread(job_profiler.get_status)
+
+
+@app.post("/admin/profiler")
+async def configure_profiler(request: ProfilerConfigRequest):
+    """
+    Turn the /predict/csv and /validate job profiler on or off and tune it without a restart
+    """
+    for field in ("every_n", "threshold_ms", "max_files"):
+        value = getattr(request, field)
+        if value is not None and value < 0:
+            raise HTTPException(status_code=400, detail=f"{field} must be >= 0")
+    if request.interval_ms is not None and request.interval_ms <= 0:
+        raise HTTPException(status_code=400, detail="interval_ms must be > 0")
+    return await run_in_thread(job_profiler.configure, **request.dict())
+
+
+@app.get("/admin/profiler/profiles")
+async def list_profiles():
+    """
+    Stored profiles, newest first
+    """
+    return {"profiles": await run_in_thread(job_profiler.list_profiles)}
+
+
+@app.get("/admin/profiler/profiles/{file_name}", response_class=PlainTextResponse)
+async def get_profile(file_name: str):
+    """
+    One profile in collapsed-stack format (input for flamegraph.pl or speedscope)
+    """
+    content = await run_in_thread(job_profiler.read_profile, file_name)
+    if content is None:
+        raise HTTPException(status_code=404, detail=f"Profile {file_name} not found")
+    return PlainTextResponse(content)
+
+
+async def _save_profile(plan: Optional[Dict[str, Any]], result: Dict[str, Any]) -> None:
+    """Store the profile a job returned under "profile" (if its plan kept it)"""
+    capture = result.pop("profile", None)
+    if plan is not None:
+        await run_in_thread(job_profiler.save, capture)
+
+
 # ============================================
 # Prediction Endpoints
 # ============================================
@@ -181,16 +584,33 @@ async def predict(request: PredictionRequest):
     Predict fire date for a single stockpile
     
     Args:
-        request: Prediction request with shtabel_id and optional horizon_days
+        request: Prediction request with shtabel_id, optional horizon_days
+            and optional model_version (served from the model registry)
         
     Returns:
         Prediction response with risk level, predicted date, and confidence
     """
     try:
         logger.info(f"Prediction request for shtabel {request.shtabel_id}")
+        horizon_days = request.horizon_days or 7
+        await _require_model_version(request.model_version)
+        
+        # Cheap watermark query first: unchanged data means a cached result
+        cache_key = None
+        if prediction_cache.enabled:
+            watermark = await _load_stockpile_watermark(request.shtabel_id)
+            if not watermark:
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Stockpile {request.shtabel_id} not found"
+                )
+            cache_key = _prediction_cache_key(watermark, horizon_days, request.model_version)
+            cached = prediction_cache.get(cache_key)
+            if cached is not None:
+                return PredictionResponse(**_with_timing(cached))
         
         # Get stockpile data from database
-        stockpile_data = db_service.get_stockpile_data(request.shtabel_id)
+        stockpile_data = await _load_stockpile(request.shtabel_id)
         
         if not stockpile_data:
             raise HTTPException(
@@ -199,9 +619,11 @@ async def predict(request: PredictionRequest):
             )
         
         # Make prediction
-        prediction_result = predictor.predict(
+        prediction_result = await run_in_thread(
+            predictor.predict,
             stockpile_data,
-            horizon_days=request.horizon_days or 7,
+            horizon_days=horizon_days,
+            model_version=request.model_version,
         )
         
         logger.info(
@@ -209,7 +631,11 @@ async def predict(request: PredictionRequest):
             f"risk={prediction_result['risk_level']}"
         )
         
-        return PredictionResponse(**prediction_result)
+        # Placeholder results (model missing or failed) are not cached
+        if cache_key is not None and not prediction_result.get("meta", {}).get("placeholder"):
+            prediction_cache.put(cache_key, prediction_result)
+        
+        return PredictionResponse(**_with_timing(prediction_result))
         
     except HTTPException:
         raise
@@ -292,6 +718,7 @@ async def predict_direct(request: DirectPredictionRequest):
             - precip: Осадки (мм, опционально, по умолчанию 0.0)
             - temp_delta_3d: Изменение температуры за 3 дня (°C, опционально, по умолчанию 0.0)
             - horizon_days: Горизонт прогнозирования (дни, опционально, по умолчанию 7)
+            - model_version: Версия модели из реестра (опционально, по умолчанию текущая)
         
     Returns:
         Результат прогнозирования с уровнем риска
@@ -299,31 +726,40 @@ async def predict_direct(request: DirectPredictionRequest):
     try:
         logger.info(f"Direct prediction request: max_temp={request.max_temp}, age_days={request.age_days}")
         
-        # Проверяем, загружена ли модель
-        if not model_manager.is_model_loaded():
-            logger.warning("Model not loaded, attempting to load default model...")
-            if not model_manager.load_model("coal_fire_model", "1.0.0"):
-                logger.warning("Model not available, using placeholder prediction")
-                return _get_placeholder_prediction(request)
-        
-        model = model_manager.get_model()
+        # Модель загружается при старте или через /model/load, не во время запроса
+        model, model_info = await run_in_thread(model_manager.get_model_with_info, request.model_version)
         if not model:
+            if request.model_version:
+                raise HTTPException(status_code=404, detail=f"Model version {request.model_version} not found")
             logger.warning("Model not available, using placeholder prediction")
             return _get_placeholder_prediction(request)
         
         # Подготавливаем признаки напрямую из параметров запроса
-        import pandas as pd
-        features_df = pd.DataFrame([{
+        features = {
             'Максимальная температура': request.max_temp,
             'age_days': request.age_days,
             'temp_air': request.temp_air or 20.0,
             'humidity': request.humidity or 60.0,
             'precip': request.precip or 0.0,
             'temp_delta_3d': request.temp_delta_3d or 0.0
-        }])
+        }
         
-        # Делаем предсказание
-        proba = model.predict_proba(features_df)[0][1]
+        # Повторные комбинации параметров формы берём из кэша без вызова модели
+        row = [features[col] for col in FEATURE_COLUMNS]
+        cache_key = _direct_cache_key(row, request.model_version)
+        proba = direct_cache.get(cache_key)
+        
+        # Делаем предсказание (конкурентные запросы объединяются в один вызов модели)
+        if proba is None:
+            if request.model_version is not None:
+                # Batches are scored with the current model; other versions are called directly
+                proba = float((await run_in_thread(predict_positive, model, np.array([row]), request.model_version))[0])
+            elif settings.DIRECT_BATCHING_ENABLED:
+                proba = await direct_batcher.submit(row)
+            else:
+                proba = float((await run_in_thread(_predict_direct_batch, np.array([row])))[0])
+            direct_cache.put(cache_key, proba)
+        postprocess_started = time.perf_counter()
         pred = int(proba >= 0.5)
         
         # Определяем уровень риска
@@ -355,7 +791,7 @@ async def predict_direct(request: DirectPredictionRequest):
         result = {
             "shtabel_id": 0,  # Нет штабеля в БД
             "model_name": "xgboost_v1",
-            "model_version": model_manager.get_model_info().get("model_version", "1.0.0") if model_manager.get_model_info() else "1.0.0",
+            "model_version": model_info.get("model_version", "1.0.0") if model_info else "1.0.0",
             "predicted_date": predicted_date.isoformat() if predicted_date else None,
             "prob_event": float(proba),
             "risk_level": risk_level,
@@ -365,14 +801,16 @@ async def predict_direct(request: DirectPredictionRequest):
             "confidence": float(proba),
             "meta": {
                 "predicted": pred,
-                "features": features_df.iloc[0].to_dict(),
+                "features": features,
                 "target_date": target_date.isoformat(),
             },
         }
         
         logger.info(f"Direct prediction completed: risk={risk_level}, prob={proba:.2f}")
         
-        return PredictionResponse(**result)
+        response = PredictionResponse(**result)
+        stage_histograms.observe("postprocess", time.perf_counter() - postprocess_started, request.model_version)
+        return response
         
     except HTTPException:
         raise
@@ -381,13 +819,32 @@ async def predict_direct(request: DirectPredictionRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/predict/direct/stats")
+async def predict_direct_stats():
+    """
+    Статистика микробатчинга /predict/direct
+    
+    Глубина очереди, размеры батчей и время ожидания — для настройки
+    DIRECT_BATCH_WINDOW_MS / DIRECT_BATCH_MAX_SIZE (пропускная способность против задержки).
+    """
+    return {
+        "enabled": settings.DIRECT_BATCHING_ENABLED,
+        **direct_batcher.get_stats(),
+    }
+
+
 @app.post("/predict/batch")
-async def batch_predict(request: BatchPredictionRequest):
+async def batch_predict(
+    request: BatchPredictionRequest,
+    format: str = Query("json", pattern="^(json|ndjson)$", description="json или ndjson (потоковая выдача)"),
+):
     """
     Predict fire dates for multiple stockpiles
     
     Args:
         request: Batch prediction request with list of shtabel_ids
+        format: "ndjson" streams predictions chunk by chunk (STREAM_CHUNK_SIZE)
+            followed by a summary record
         
     Returns:
         Dictionary with list of predictions
@@ -395,47 +852,220 @@ async def batch_predict(request: BatchPredictionRequest):
     try:
         logger.info(f"Batch prediction request for {len(request.shtabel_ids)} stockpiles")
         
+        await _require_model_version(request.model_version)
+        
+        if format == "ndjson":
+            return StreamingResponse(
+                _stream_batch_predictions(request.shtabel_ids, request.horizon_days or 7, request.model_version),
+                media_type=NDJSON_MEDIA_TYPE,
+            )
+        
         results = []
         errors = []
+        stockpiles = []
+        
+        # One bulk fetch for all requested stockpiles
+        load_error = None
+        try:
+            stockpiles_data = await _load_stockpiles(request.shtabel_ids)
+        except Exception as e:
+            logger.error(f"Error loading stockpiles for batch prediction: {e}")
+            stockpiles_data = {}
+            load_error = str(e)
         
         for shtabel_id in request.shtabel_ids:
+            if load_error:
+                errors.append({
+                    "shtabel_id": shtabel_id,
+                    "error": load_error,
+                })
+                continue
+            
+            stockpile_data = stockpiles_data.get(shtabel_id)
+            
+            if not stockpile_data:
+                errors.append({
+                    "shtabel_id": shtabel_id,
+                    "error": "Stockpile not found",
+                })
+                continue
+            
+            stockpiles.append(stockpile_data)
+        
+        # One model call for all stockpiles found
+        prediction_results = await run_in_thread(
+            predictor.predict_batch,
+            stockpiles,
+            horizon_days=request.horizon_days or 7,
+            model_version=request.model_version,
+        )
+        
+        for stockpile_data, prediction_result in zip(stockpiles, prediction_results):
             try:
-                stockpile_data = db_service.get_stockpile_data(shtabel_id)
-                
-                if not stockpile_data:
-                    errors.append({
-                        "shtabel_id": shtabel_id,
-                        "error": "Stockpile not found",
-                    })
-                    continue
-                
-                prediction_result = predictor.predict(
-                    stockpile_data,
-                    horizon_days=request.horizon_days or 7,
-                )
-                
                 results.append(PredictionResponse(**prediction_result))
-                
             except Exception as e:
+                shtabel_id = stockpile_data.get("shtabel_id")
                 logger.error(f"Error predicting for shtabel {shtabel_id}: {e}")
                 errors.append({
                     "shtabel_id": shtabel_id,
                     "error": str(e),
                 })
         
-        return {
+        return _with_timing({
             "predictions": [r.dict() for r in results],
             "errors": errors,
             "total": len(request.shtabel_ids),
             "success": len(results),
             "failed": len(errors),
-        }
+        })
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Batch prediction error: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/predict/fleet")
+async def fleet_predict(request: FleetPredictionRequest):
+    """
+    Predict fire risk for every ACTIVE stockpile in one server-side pass
+    
+    Stockpiles (optionally of one sklad) are bulk-loaded and scored with a
+    single model call; with persist=true predictions are saved to Prediction.
+    
+    Returns:
+        Predictions, high-risk stockpiles (prob_event >= threshold) and errors
+    """
+    try:
+        logger.info(f"Fleet prediction request (sklad_id={request.sklad_id}, persist={request.persist})")
+        await _require_model_version(request.model_version)
+        return await run_in_thread(
+            batch_predictor.predict_fleet,
+            sklad_id=request.sklad_id,
+            horizon_days=request.horizon_days or 7,
+            threshold=request.threshold,
+            persist=request.persist,
+            model_version=request.model_version,
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Fleet prediction error: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# ============================================
+# Feature Store Endpoints
+# ============================================
+
+@app.post("/features/refresh")
+async def refresh_features(request: FeatureRefreshRequest):
+    """
+    Materialize feature vectors for stockpiles with new temperature or weather data
+    
+    Vectors that are still fresh for the loaded model version are skipped
+    unless force=true.
+    """
+    try:
+        return await run_in_thread(
+            feature_store.refresh,
+            shtabel_ids=request.shtabel_ids,
+            sklad_id=request.sklad_id,
+            force=request.force,
+        )
+    except Exception as e:
+        logger.error(f"Feature refresh error: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/features/stats")
+async def feature_store_stats():
+    """
+    Feature store lookup hit/miss statistics
+    """
+    return feature_store.get_stats()
+
+
+@app.get("/features/rolling/stats")
+async def rolling_features_stats():
+    """
+    Rolling feature state: stockpiles, windows, watermark and update counters
+    """
+    return rolling_features.get_stats()
+
+
+@app.get("/features/rolling/{shtabel_id}")
+async def get_rolling_features(shtabel_id: int):
+    """
+    Current rolling-window values of a stockpile
+    
+    Newest reading, the reading temp_delta_3d is computed against
+    (temp_lag_3d), temp_delta_lag{k} for ROLLING_LAGS and count/mean/min/max
+    per window (history window and ROLLING_WINDOWS_DAYS).
+    """
+    if not rolling_features.is_loaded:
+        raise HTTPException(status_code=503, detail="Rolling features are not loaded")
+    features = await run_in_thread(rolling_features.features, shtabel_id)
+    if features is None:
+        raise HTTPException(status_code=404, detail=f"No temperature readings for stockpile {shtabel_id}")
+    return features
+
+
+async def _refresh_features_periodically(interval: float) -> None:
+    """Background loop refreshing the feature store (FEATURE_STORE_REFRESH_SECONDS)"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_thread(feature_store.refresh)
+        except Exception as e:
+            logger.warning(f"Periodic feature refresh failed: {e}")
+
+
+def _refreshes_feature_store() -> bool:
+    """
+    Whether this process materializes feature vectors
+    
+    Under serve.py only worker 0 does, so N workers do not write N copies.
+    """
+    return settings.FEATURE_STORE_ENABLED and (worker_index() or 0) == 0
+
+
+async def _refresh_weather_periodically(interval: float) -> None:
+    """
+    Background loop merging new Weather rows into the weather index (WEATHER_INDEX_REFRESH_SECONDS)
+    
+    New weather makes every stored feature vector stale, so the feature
+    store is refreshed when the watermark moves.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            watermark = weather_index.watermark
+            await run_in_thread(weather_index.refresh)
+            if weather_index.watermark != watermark and _refreshes_feature_store():
+                await run_in_thread(feature_store.refresh)
+        except Exception as e:
+            logger.warning(f"Periodic weather index refresh failed: {e}")
+
+
+async def _refresh_rolling_periodically(interval: float) -> None:
+    """
+    Background loop applying new TempRecord rows to the rolling state (ROLLING_REFRESH_SECONDS)
+    
+    Feature vectors of the stockpiles that received readings are recomputed.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_thread(rolling_features.refresh)
+            changed = rolling_features.pop_changed()
+            if changed and _refreshes_feature_store():
+                await run_in_thread(feature_store.refresh, changed)
+        except Exception as e:
+            logger.warning(f"Periodic rolling feature refresh failed: {e}")
+
+
 # ============================================
 # Training Endpoint
 # ============================================
@@ -459,15 +1089,16 @@ async def train_model(request: TrainRequest, background_tasks: BackgroundTasks):
             f"Training request: {request.model_name} v{request.model_version}"
         )
         
-        # Train model
-        training_result = trainer.train_model(
+        # Train model in a worker process
+        training_result = await run_in_process(
+            train_model_job,
             request.model_name,
             request.model_version,
             request.config,
         )
         
         # Load the newly trained model
-        model_manager.load_model(request.model_name, request.model_version)
+        await run_in_thread(model_manager.load_model, request.model_name, request.model_version)
         
         logger.info(
             f"Model training completed: {request.model_name} v{request.model_version}"
@@ -512,7 +1143,8 @@ async def get_metrics():
         
         # Получаем предсказания с фактическими датами возгорания из БД
         db_service = DatabaseService()
-        predictions_df = db_service.get_predictions_with_actual_fires(
+        predictions_df = await run_in_thread(
+            db_service.get_predictions_with_actual_fires,
             model_name=model_name if model_name != "unknown" else None,
             model_version=model_version if model_version != "unknown" else None
         )
@@ -554,7 +1186,7 @@ async def load_model(model_name: str, model_version: str):
         Status of model loading
     """
     try:
-        success = model_manager.load_model(model_name, model_version)
+        success = await run_in_thread(model_manager.load_model, model_name, model_version)
         
         if success:
             return {
@@ -602,6 +1234,20 @@ async def get_model_info():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/model/registry")
+async def get_model_registry():
+    """
+    Model versions resident in memory
+    
+    Any of them can be requested via model_version without a reload;
+    other versions are loaded from {name}_v{version}.json on first use.
+    """
+    return {
+        "models": model_manager.list_models(),
+        **model_manager.get_registry_stats(),
+    }
+
+
 # ============================================
 # Validation Endpoint
 # ============================================
@@ -673,11 +1319,16 @@ async def validate_model(
         logger.info(f"Файл загружен: {len(csv_content)} байт")
         
         # Выполняем валидацию
-        validation_result = validator.validate_from_csv(
+        profile_plan = job_profiler.plan("validate")
+        validation_result = await run_in_process(
+            validate_from_csv_job,
+            current_model_ref(),
+            profile_plan=profile_plan,
             csv_content=csv_content,
             model_name=model_name,
             model_version=model_version,
         )
+        await _save_profile(profile_plan, validation_result)
         
         logger.info("Валидация завершена успешно")
         
@@ -701,6 +1352,8 @@ async def predict_from_csv(
     temperature: UploadFile = File(..., description="CSV файл с данными о температурах"),
     weather: Optional[UploadFile] = File(None, description="CSV файл с погодными данными (опционально)"),
     horizon_days: int = Query(7, description="Горизонт прогнозирования в днях", ge=1, le=30),
+    format: str = Query("json", pattern="^(json|ndjson)$", description="json или ndjson (потоковая выдача)"),
+    model_version: Optional[str] = Query(None, description="Версия модели из реестра (по умолчанию текущая)"),
 ):
     """
     Прогнозирование на основе CSV файлов
@@ -719,6 +1372,9 @@ async def predict_from_csv(
         temperature: CSV файл с данными о температурах
         weather: CSV файл с погодными данными (опционально)
         horizon_days: Горизонт прогнозирования в днях (1-30, по умолчанию 7)
+        format: "ndjson" — прогнозы отдаются построчно по мере расчёта порций
+            (STREAM_CHUNK_SIZE), последней строкой идёт статистика
+        model_version: Версия модели из реестра (опционально, по умолчанию текущая)
         
     Returns:
         Результаты прогнозирования для каждой записи:
@@ -759,18 +1415,55 @@ async def predict_from_csv(
             )
         
         logger.info(f"Файлы загружены: fires={len(fires_content)} байт, supplies={len(supplies_content)} байт, temperature={len(temperature_content)} байт")
+        await _require_model_version(model_version)
+        
+        if format == "ndjson":
+            # CSV-подсистема загружается при первом использовании
+            from src.csv_predictor import csv_predictor
+            
+            # Порции считаются в пуле потоков по мере отправки; ошибки
+            # предобработки возникают на первой порции и дают обычный HTTP-ответ
+            prediction_date = datetime.now()
+            chunks = csv_predictor.iter_predictions_from_csv(
+                fires_content,
+                supplies_content,
+                temperature_content,
+                weather_csv=weather_content,
+                horizon_days=horizon_days,
+                target_date=prediction_date,
+                chunk_size=max(1, settings.STREAM_CHUNK_SIZE),
+                model_version=model_version,
+            )
+            first_chunk = await run_in_thread(next, chunks, None)
+            return StreamingResponse(
+                _stream_csv_predictions(first_chunk, chunks, prediction_date, model_version),
+                media_type=NDJSON_MEDIA_TYPE,
+            )
         
         # Выполняем прогнозирование
-        prediction_result = csv_predictor.predict_from_csv(
+        timing = request_timing.get()
+        profile_plan = job_profiler.plan("predict_csv")
+        prediction_result = await run_in_process(
+            predict_from_csv_job,
+            current_model_ref(),
+            timing_request_id=timing.request_id if timing else None,
+            profile_plan=profile_plan,
             fires_csv=fires_content,
             supplies_csv=supplies_content,
             temperature_csv=temperature_content,
             weather_csv=weather_content,
             horizon_days=horizon_days,
+            model_version=model_version,
         )
+        await _save_profile(profile_plan, prediction_result)
         
         logger.info(f"Прогнозирование завершено: {len(prediction_result['predictions'])} предсказаний")
         
+        # Разбивка времени из процесса-воркера добавляется к разбивке запроса
+        if timing is not None:
+            timing.merge(prediction_result.pop("timing", {}))
+            prediction_result = _with_timing(prediction_result)
+        
         return CSVPredictionResponse(**prediction_result)
         
     except HTTPException:
@@ -780,6 +1473,48 @@ async def predict_from_csv(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _run_warmup() -> None:
+    """Warm the inference path and DB pools, then report ready"""
+    try:
+        with startup_report.phase("warmup"):
+            try:
+                if db_service.async_enabled:
+                    await db_service.warm_up_pool_async(max(1, settings.DB_POOL_SIZE))
+            except Exception as e:
+                logger.warning(f"Async pool warm-up failed: {e}")
+            await run_in_thread(warmup.run, db_service, predictor)
+    finally:
+        # The startup summary was logged before warm-up ran in the background
+        startup_report.finish_warmup()
+    
+    if settings.WARMUP_RETRY_SECONDS > 0:
+        await _retry_warmup(settings.WARMUP_RETRY_SECONDS)
+
+
+async def _retry_warmup(interval: float) -> None:
+    """Re-run failed warm-up steps (e.g. the DB was down at boot) with a doubling delay until they pass"""
+    delay = interval
+    while warmup.failed_steps():
+        await asyncio.sleep(delay)
+        try:
+            await run_in_thread(warmup.retry_failed, db_service, predictor)
+        except Exception as e:
+            logger.error(f"Warm-up retry error: {e}", exc_info=True)
+        delay = min(delay * 2, WARMUP_RETRY_MAX_SECONDS)
+
+
+async def _watch_models_periodically(interval: float) -> None:
+    """Reload models whose files changed on disk (MODEL_WATCH_SECONDS)"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            reloaded = await run_in_thread(model_manager.reload_changed)
+            for model_name, model_version in reloaded:
+                logger.info(f"Model reloaded from disk: {model_name} v{model_version}")
+        except Exception as e:
+            logger.error(f"Model watcher error: {e}", exc_info=True)
+
+
 # ============================================
 # Startup Event
 # ============================================
@@ -790,18 +1525,88 @@ async def startup_event():
     logger.info("ML Service starting up...")
     
     # Try to load default model if exists
-    try:
-        # Try to load coal_fire_model.json
-        success = model_manager.load_model("coal_fire_model", "1.0.0")
-        if success:
-            logger.info("Default model (coal_fire_model.json) loaded successfully")
-        else:
-            logger.warning("Could not load default model - will use placeholder predictions")
-    except Exception as e:
-        logger.warning(f"Could not load default model: {e}")
+    if model_manager.is_model_loaded():
+        # serve.py loads it in the parent process; workers share it copy-on-write
+        logger.info("Model preloaded by the parent process")
+    else:
+        try:
+            # Try to load coal_fire_model.json
+            with startup_report.phase("model_load"):
+                success = model_manager.load_model("coal_fire_model", "1.0.0")
+            if success:
+                logger.info("Default model (coal_fire_model.json) loaded successfully")
+            else:
+                logger.warning("Could not load default model - will use placeholder predictions")
+        except Exception as e:
+            logger.warning(f"Could not load default model: {e}")
+    
+    if settings.WEATHER_INDEX_ENABLED and not weather_index.is_loaded:
+        # Falls back to per-prediction weather queries if the index cannot load
+        with startup_report.phase("weather_index"):
+            loaded = await run_in_thread(weather_index.load, db_service)
+        if not loaded:
+            logger.warning("Weather index not loaded - weather is queried per prediction")
+    
+    if weather_index.is_loaded and settings.WEATHER_INDEX_REFRESH_SECONDS > 0:
+        app.state.weather_refresh_task = asyncio.create_task(
+            _refresh_weather_periodically(settings.WEATHER_INDEX_REFRESH_SECONDS)
+        )
+    
+    if settings.ROLLING_FEATURES_ENABLED and not rolling_features.is_loaded:
+        # Falls back to scanning the fetched history if the state cannot load
+        with startup_report.phase("rolling_features"):
+            loaded = await run_in_thread(rolling_features.load, db_service)
+        if not loaded:
+            logger.warning("Rolling features not loaded - temperature history is scanned per prediction")
+    
+    if rolling_features.is_loaded and settings.ROLLING_REFRESH_SECONDS > 0:
+        app.state.rolling_refresh_task = asyncio.create_task(
+            _refresh_rolling_periodically(settings.ROLLING_REFRESH_SECONDS)
+        )
     
+    if settings.FEATURE_STORE_REFRESH_SECONDS > 0 and _refreshes_feature_store():
+        app.state.feature_refresh_task = asyncio.create_task(
+            _refresh_features_periodically(settings.FEATURE_STORE_REFRESH_SECONDS)
+        )
+    
+    if settings.WARMUP_ENABLED:
+        # Runs in the background: /health answers meanwhile, /ready returns 503
+        app.state.warmup_task = asyncio.create_task(_run_warmup())
+    else:
+        warmup.finish("warm-up disabled")
+    
+    if settings.MODEL_WATCH_SECONDS > 0:
+        app.state.model_watch_task = asyncio.create_task(
+            _watch_models_periodically(settings.MODEL_WATCH_SECONDS)
+        )
+    
+    startup_report.finish()
     logger.info("ML Service started")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release resources on shutdown"""
+    await direct_batcher.stop()
+    warmup_task = getattr(app.state, "warmup_task", None)
+    if warmup_task is not None:
+        warmup_task.cancel()
+    feature_refresh_task = getattr(app.state, "feature_refresh_task", None)
+    if feature_refresh_task is not None:
+        feature_refresh_task.cancel()
+    weather_refresh_task = getattr(app.state, "weather_refresh_task", None)
+    if weather_refresh_task is not None:
+        weather_refresh_task.cancel()
+    rolling_refresh_task = getattr(app.state, "rolling_refresh_task", None)
+    if rolling_refresh_task is not None:
+        rolling_refresh_task.cancel()
+    model_watch_task = getattr(app.state, "model_watch_task", None)
+    if model_watch_task is not None:
+        model_watch_task.cancel()
+    shutdown_executors()
+    if db_service.async_engine is not None:
+        await db_service.async_engine.dispose()
+
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,186 @@
+"""
+Adaptive micro-batching of concurrent single-row predictions
+
+Concurrent requests submit one feature vector each. The batcher waits up to
+a short window (or until max_batch_size rows are queued), runs one batched
+model call and resolves every waiting request with its own probability.
+"""
+import asyncio
+import time
+from concurrent.futures import Executor
+import numpy as np
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the batch-size histogram buckets
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class MicroBatcher:
+    """Coalesces concurrent single-row predictions into batched model calls"""
+
+    def __init__(
+        self,
+        predict_fn: Callable[[np.ndarray], Sequence[float]],
+        window_ms: float = 2.0,
+        max_batch_size: int = 64,
+        executor: Optional[Callable[[], Executor]] = None,
+    ):
+        """
+        Args:
+            predict_fn: Function scoring a (n_rows, n_features) matrix, returns n_rows probabilities
+            window_ms: Maximum time to wait for more rows after the first one arrives
+            max_batch_size: Flush immediately once this many rows are queued
+            executor: Factory of the executor running predict_fn (default: event loop thread)
+        """
+        self.predict_fn = predict_fn
+        self.executor = executor
+        self.window = max(0.0, window_ms) / 1000.0
+        self.max_batch_size = max(1, int(max_batch_size))
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._full: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+
+        self._stats: Dict[str, Any] = {}
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        """Reset accumulated statistics"""
+        self._stats = {
+            "requests": 0,
+            "rows_scored": 0,
+            "batches": 0,
+            "failed_batches": 0,
+            "flush_full": 0,
+            "flush_window": 0,
+            "max_batch_size_seen": 0,
+            "max_queue_depth": 0,
+            "total_wait_s": 0.0,
+            "max_wait_s": 0.0,
+            "total_model_s": 0.0,
+            "batch_size_histogram": {**{str(b): 0 for b in BATCH_SIZE_BUCKETS}, "+Inf": 0},
+        }
+
+    def _ensure_started(self) -> None:
+        """Start the worker task in the running event loop on first use"""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._full = asyncio.Event()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, row: Sequence[float]) -> float:
+        """
+        Queue one feature vector and wait for its probability
+
+        Args:
+            row: Feature values in model feature order
+
+        Returns:
+            Probability of the positive class for this row
+        """
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((row, future, time.perf_counter()))
+
+        depth = self._queue.qsize()
+        self._stats["requests"] += 1
+        self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], depth)
+        if depth >= self.max_batch_size:
+            self._full.set()
+
+        return await future
+
+    async def _run(self) -> None:
+        """Worker loop: collect a batch, score it, resolve the futures"""
+        while True:
+            batch = [await self._queue.get()]
+
+            flushed_full = self._queue.qsize() + 1 >= self.max_batch_size
+            if not flushed_full and self.window > 0:
+                self._full.clear()
+                try:
+                    await asyncio.wait_for(self._full.wait(), timeout=self.window)
+                    flushed_full = True
+                except asyncio.TimeoutError:
+                    pass
+
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            await self._score(batch, flushed_full)
+
+    async def _score(self, batch: List[Tuple[Sequence[float], asyncio.Future, float]], flushed_full: bool) -> None:
+        """Run one model call for the batch and resolve waiting requests"""
+        pending = [item for item in batch if not item[1].done()]
+        if not pending:
+            return
+
+        started = time.perf_counter()
+        try:
+            rows = np.asarray([item[0] for item in pending], dtype=np.float64)
+            if self.executor is not None:
+                # Rows keep queueing for the next batch while this one is scored
+                probabilities = await asyncio.get_running_loop().run_in_executor(
+                    self.executor(), self.predict_fn, rows
+                )
+            else:
+                probabilities = self.predict_fn(rows)
+        except Exception as e:
+            logger.error(f"Micro-batch prediction failed for {len(pending)} rows: {e}", exc_info=True)
+            self._stats["failed_batches"] += 1
+            for _, future, _ in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finished = time.perf_counter()
+
+        for (_, future, submitted), probability in zip(pending, probabilities):
+            if not future.done():
+                future.set_result(float(probability))
+            wait = finished - submitted
+            self._stats["total_wait_s"] += wait
+            self._stats["max_wait_s"] = max(self._stats["max_wait_s"], wait)
+
+        size = len(pending)
+        self._stats["batches"] += 1
+        self._stats["rows_scored"] += size
+        self._stats["flush_full" if flushed_full else "flush_window"] += 1
+        self._stats["max_batch_size_seen"] = max(self._stats["max_batch_size_seen"], size)
+        self._stats["total_model_s"] += finished - started
+        bucket = next((str(b) for b in BATCH_SIZE_BUCKETS if size <= b), "+Inf")
+        self._stats["batch_size_histogram"][bucket] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Queue depth and batch-size statistics for tuning window/max size"""
+        stats = self._stats
+        batches = stats["batches"]
+        return {
+            "window_ms": self.window * 1000.0,
+            "max_batch_size": self.max_batch_size,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue_depth": stats["max_queue_depth"],
+            "requests": stats["requests"],
+            "batches": batches,
+            "failed_batches": stats["failed_batches"],
+            "avg_batch_size": round(stats["rows_scored"] / batches, 2) if batches else 0.0,
+            "max_batch_size_seen": stats["max_batch_size_seen"],
+            "flush_full": stats["flush_full"],
+            "flush_window": stats["flush_window"],
+            "avg_wait_ms": round(stats["total_wait_s"] / stats["rows_scored"] * 1000.0, 3) if stats["rows_scored"] else 0.0,
+            "max_wait_ms": round(stats["max_wait_s"] * 1000.0, 3),
+            "avg_model_ms": round(stats["total_model_s"] / batches * 1000.0, 3) if batches else 0.0,
+            "batch_size_histogram": dict(stats["batch_size_histogram"]),
+        }
+
+    async def stop(self) -> None:
+        """Cancel the worker task"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
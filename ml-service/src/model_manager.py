@@ -1,22 +1,66 @@
 """
 Model management: loading, saving, and versioning
+
+Besides the current model, several versions can stay resident in an LRU
+registry (bounded by MODEL_REGISTRY_MAX_MODELS and MODEL_REGISTRY_MAX_MB),
+so prediction requests can name a model_version without a reload.
+
+Loading never touches the serving model: the new model is built off to the
+side and published as an immutable LoadedModel with a single reference
+assignment. Requests take one snapshot, so in-flight requests finish on the
+version they started with. reload_changed() (polled when MODEL_WATCH_SECONDS
+is set) reloads resident models whose files changed on disk.
+
+Every load, current or registry version, gets a new generation number, so
+caches keyed by get_generation() never serve results of a replaced model.
 """
 import os
 import json
-import xgboost as xgb
+import itertools
+import threading
+from collections import OrderedDict
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Callable, List, NamedTuple, Tuple
 import logging
 from datetime import datetime
 from src.config import settings
+from src.tree_engine import compile_model_file
 
 logger = logging.getLogger(__name__)
 
 
+class LoadedModel(NamedTuple):
+    """Immutable snapshot of the current model, replaced as a whole on reload"""
+    model: Any
+    info: Dict[str, Any]
+    key: Tuple[str, str]
+    # New on every successful load, so caches can tell reloads apart
+    generation: int
+
+
+def _file_signature(model_file: Path) -> Optional[Tuple[int, int, Optional[int]]]:
+    """(mtime_ns, size) of a model file plus mtime_ns of its _info.json; None if missing"""
+    try:
+        stat = model_file.stat()
+    except OSError:
+        return None
+    info_file = model_file.parent / f"{model_file.stem}_info.json"
+    try:
+        info_mtime = info_file.stat().st_mtime_ns
+    except OSError:
+        info_mtime = None
+    return stat.st_mtime_ns, stat.st_size, info_mtime
+
+
 class ModelManager:
     """Manages ML model loading and saving"""
     
-    def __init__(self, model_path: Optional[str] = None):
+    def __init__(
+        self,
+        model_path: Optional[str] = None,
+        max_models: int = 4,
+        max_memory_mb: float = 512.0,
+    ):
         # Default to models directory in project root
         if model_path:
             self.model_path = Path(model_path)
@@ -26,12 +70,122 @@ class ModelManager:
             self.model_path = base_path / "models"
         
         self.model_path.mkdir(parents=True, exist_ok=True)
-        self.current_model: Optional[Any] = None
-        self.current_model_info: Optional[Dict[str, Any]] = None
+        # Published with a single assignment; never mutated in place
+        self._active: Optional[LoadedModel] = None
+        # Serializes loads, so concurrent reloads cannot publish out of order
+        self._load_lock = threading.Lock()
+        self._reload_listeners: List[Callable[[], None]] = []
+        # Generation numbers shared by the current model and registry entries (never reused)
+        self._generations = itertools.count(1)
+        
+        # Resident versions by (name, version), least recently used first
+        self.max_models = max(1, int(max_models))
+        self.max_memory_bytes = max_memory_mb * 2 ** 20
+        self._registry: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._registry_lock = threading.RLock()
+        self._registry_stats = {"hits": 0, "misses": 0, "evictions": 0, "reloads": 0}
+        
+        # File watcher state: signatures seen on the previous poll / that failed to load
+        self._watch_pending: Dict[Tuple[str, str], Tuple] = {}
+        self._watch_failed: Dict[Tuple[str, str], Tuple] = {}
+    
+    @property
+    def current_model(self) -> Optional[Any]:
+        active = self._active
+        return active.model if active else None
+    
+    @property
+    def current_model_info(self) -> Optional[Dict[str, Any]]:
+        active = self._active
+        return active.info if active else None
+    
+    @property
+    def model_generation(self) -> int:
+        active = self._active
+        return active.generation if active else 0
+    
+    @property
+    def _current_key(self) -> Optional[Tuple[str, str]]:
+        active = self._active
+        return active.key if active else None
+    
+    def get_active(self) -> Optional[LoadedModel]:
+        """Snapshot of the current model, info and generation (None if not loaded)"""
+        return self._active
+    
+    def _model_dirs(self) -> List[Path]:
+        """Directories searched for model files, in order"""
+        dirs = [
+            self.model_path,
+            Path("/app/models"),
+            Path(__file__).parent.parent.parent / "models",
+        ]
+        return list(dict.fromkeys(dirs))
+    
+    def _find_model_file(self, model_name: str, model_version: str, fallback: bool = True) -> Optional[Path]:
+        """
+        Locate the model file for a name/version
+        
+        Versioned files written by save_model ({name}_v{version}.json) are
+        preferred. With fallback, {name}.json and the default
+        coal_fire_model.json are accepted as well.
+        """
+        possible_paths = [d / f"{model_name}_v{model_version}.json" for d in self._model_dirs()]
+        if fallback:
+            for d in self._model_dirs():
+                possible_paths.append(d / f"{model_name}.json")
+                possible_paths.append(d / "coal_fire_model.json")
+        
+        for path in possible_paths:
+            if path.exists():
+                return path
+        
+        logger.warning(f"Model file not found. Tried: {[str(p) for p in possible_paths]}")
+        return None
+    
+    def _read_model(self, model_file: Path, model_name: str, model_version: str) -> Tuple[Any, Dict[str, Any]]:
+        """Build a model object and its info from a JSON file"""
+        inference_backend = "xgboost"
+        model = None
+        if settings.INFERENCE_BACKEND == "numpy":
+            model = compile_model_file(model_file)
+        
+        if model is not None:
+            # Compiled NumPy engine: no xgboost calls at request time
+            inference_backend = "numpy"
+        else:
+            # Imported on first use: NumPy-backend replicas never load xgboost
+            import xgboost as xgb
+            model = xgb.XGBClassifier()
+            model.load_model(str(model_file))
+        
+        # Get file size
+        file_size = model_file.stat().st_size if model_file.exists() else 0
+        
+        # Load model info if exists
+        info_file = model_file.parent / f"{model_file.stem}_info.json"
+        if info_file.exists():
+            with open(info_file, 'r', encoding='utf-8') as f:
+                model_info = json.load(f)
+        else:
+            model_info = {
+                "model_name": model_name,
+                "model_version": model_version,
+                "loaded_at": datetime.now().isoformat(),
+                "file_path": str(model_file),
+                "file_size": file_size,
+            }
+        model_info["inference_backend"] = inference_backend
+        return model, model_info
     
     def load_model(self, model_name: str = "coal_fire_model", model_version: str = "1.0.0") -> bool:
         """
-        Load XGBoost model from JSON file
+        Load XGBoost model from JSON file and make it the current model
+        
+        The model is always re-read from disk (e.g. after retraining the same
+        version) and also kept in the registry. Requests keep being served by
+        the previous model until the new one is fully loaded and published;
+        if loading fails, the previous model stays current.
         
         Args:
             model_name: Name of the model (default: "coal_fire_model")
@@ -41,53 +195,236 @@ class ModelManager:
             True if model loaded successfully, False otherwise
         """
         try:
-            # Try different possible paths for the model
-            possible_paths = [
-                self.model_path / f"{model_name}.json",
-                self.model_path / "coal_fire_model.json",
-                Path("/app/models") / f"{model_name}.json",
-                Path("/app/models") / "coal_fire_model.json",
-                Path(__file__).parent.parent.parent / "models" / "coal_fire_model.json",
-                Path(__file__).parent.parent.parent / "models" / f"{model_name}.json",
-            ]
+            with self._load_lock:
+                model_file = self._find_model_file(model_name, model_version)
+                if not model_file:
+                    return False
+                
+                # Build the new model completely before anything can see it
+                signature = _file_signature(model_file)
+                model, model_info = self._read_model(model_file, model_name, model_version)
+                
+                key = (model_name, model_version)
+                generation = next(self._generations)
+                # Atomic swap: readers see either the old or the new snapshot
+                self._active = LoadedModel(
+                    model=model,
+                    info=model_info,
+                    key=key,
+                    generation=generation,
+                )
+                self._register(key, model, model_info, model_file, signature, generation)
             
-            model_file = None
-            for path in possible_paths:
-                if path.exists():
-                    model_file = path
-                    break
+            logger.info(f"Model loaded successfully: {model_file} (backend: {model_info['inference_backend']})")
+            self._notify_reload()
+            return True
             
-            if not model_file:
-                logger.warning(f"Model file not found. Tried: {[str(p) for p in possible_paths]}")
-                return False
+        except Exception as e:
+            logger.error(f"Error loading model: {e}", exc_info=True)
+            return False
+    
+    # ============================================
+    # Registry of resident model versions
+    # ============================================
+    
+    def _register(
+        self,
+        key: Tuple[str, str],
+        model: Any,
+        model_info: Dict[str, Any],
+        model_file: Path,
+        signature: Optional[Tuple],
+        generation: int,
+    ) -> None:
+        """Add a model to the registry and evict least recently used versions over the limits"""
+        entry = {
+            "model": model,
+            "info": model_info,
+            "generation": generation,
+            # JSON size approximates the resident size of the trees
+            "size_bytes": signature[1] if signature else 0,
+            "file_path": str(model_file),
+            "signature": signature,
+            "loaded_at": datetime.now().isoformat(),
+        }
+        with self._registry_lock:
+            self._registry[key] = entry
+            self._registry.move_to_end(key)
+            self._evict()
+    
+    def _evict(self) -> None:
+        """Drop least recently used versions; the current model is never evicted"""
+        while len(self._registry) > 1 and (
+            len(self._registry) > self.max_models
+            or sum(e["size_bytes"] for e in self._registry.values()) > self.max_memory_bytes
+        ):
+            victim = next((key for key in self._registry if key != self._current_key), None)
+            if victim is None:
+                break
+            del self._registry[victim]
+            self._registry_stats["evictions"] += 1
+            logger.info(f"Model registry: evicted {victim[0]} v{victim[1]}")
+    
+    def _resolve(self, model_version: Optional[str], model_name: Optional[str]) -> Optional[Tuple[str, str]]:
+        """Registry key for a request (None: the current model)"""
+        if model_version is None:
+            return None
+        if model_name is None:
+            model_name = self._current_key[0] if self._current_key else "coal_fire_model"
+        key = (model_name, model_version)
+        return None if key == self._current_key else key
+    
+    def _get_entry(self, key: Tuple[str, str]) -> Optional[Dict[str, Any]]:
+        """Registry entry for a name/version, loading {name}_v{version}.json on a miss"""
+        with self._registry_lock:
+            entry = self._registry.get(key)
+            if entry is not None:
+                self._registry.move_to_end(key)
+                self._registry_stats["hits"] += 1
+                return entry
+            self._registry_stats["misses"] += 1
+        
+        model_name, model_version = key
+        model_file = self._find_model_file(model_name, model_version, fallback=False)
+        if not model_file or not self._load_entry(key, model_file):
+            return None
+        with self._registry_lock:
+            return self._registry.get(key)
+    
+    def _load_entry(self, key: Tuple[str, str], model_file: Path) -> bool:
+        """Read a non-current version into the registry (replacing a resident entry)"""
+        model_name, model_version = key
+        signature = _file_signature(model_file)
+        try:
+            model, model_info = self._read_model(model_file, model_name, model_version)
+        except Exception as e:
+            logger.error(f"Error loading model {model_name} v{model_version}: {e}", exc_info=True)
+            return False
+        
+        self._register(key, model, model_info, model_file, signature, next(self._generations))
+        logger.info(f"Model registry: loaded {model_file}")
+        return True
+    
+    def get_model_with_info(
+        self,
+        model_version: Optional[str] = None,
+        model_name: Optional[str] = None,
+    ) -> Tuple[Optional[Any], Optional[Dict[str, Any]]]:
+        """
+        Model and its info for a request
+        
+        Args:
+            model_version: Version to serve (default: the current model)
+            model_name: Model name (default: name of the current model)
             
-            # Load XGBoost model from JSON
-            self.current_model = xgb.XGBClassifier()
-            self.current_model.load_model(str(model_file))
+        Returns:
+            (model, info), or (None, None) if the version cannot be loaded
+        """
+        active = self._active
+        key = self._resolve(model_version, model_name)
+        if key is None or (active is not None and key == active.key):
+            # One snapshot: model and info always belong together
+            return (active.model, active.info) if active else (None, None)
+        entry = self._get_entry(key)
+        if entry is None:
+            return None, None
+        return entry["model"], entry["info"]
+    
+    def get_generation(
+        self,
+        model_version: Optional[str] = None,
+        model_name: Optional[str] = None,
+    ) -> int:
+        """
+        Generation of the model serving a request (0 if it is not loaded)
+        
+        Changes whenever that version is reloaded, including registry versions
+        reloaded by the file watcher, so it can be part of cache keys.
+        """
+        active = self._active
+        key = self._resolve(model_version, model_name)
+        if key is None or (active is not None and key == active.key):
+            return active.generation if active else 0
+        with self._registry_lock:
+            entry = self._registry.get(key)
+            return entry["generation"] if entry else 0
+    
+    def reload_changed(self) -> List[Tuple[str, str]]:
+        """
+        Reload resident models whose files changed on disk
+        
+        A change is acted upon once the file signature is the same on two
+        consecutive calls, so files that are still being written are not
+        loaded. A file that fails to load is not retried until it changes
+        again; the previously loaded model keeps serving meanwhile.
+        
+        Returns:
+            (name, version) keys that were reloaded
+        """
+        with self._registry_lock:
+            resident = [
+                (key, Path(entry["file_path"]), entry["signature"])
+                for key, entry in self._registry.items()
+            ]
+        
+        reloaded = []
+        for key, model_file, loaded_signature in resident:
+            signature = _file_signature(model_file)
+            if signature is None or signature == loaded_signature or signature == self._watch_failed.get(key):
+                self._watch_pending.pop(key, None)
+                continue
+            if self._watch_pending.get(key) != signature:
+                # Changed since the last poll: wait until the file settles
+                self._watch_pending[key] = signature
+                continue
+            self._watch_pending.pop(key, None)
             
-            # Get file size
-            file_size = model_file.stat().st_size if model_file.exists() else 0
+            logger.info(f"Model file changed on disk: {model_file}")
+            if key == self._current_key:
+                ok = self.load_model(*key)
+            else:
+                ok = self._load_entry(key, model_file)
             
-            # Load model info if exists
-            info_file = model_file.parent / f"{model_file.stem}_info.json"
-            if info_file.exists():
-                with open(info_file, 'r', encoding='utf-8') as f:
-                    self.current_model_info = json.load(f)
+            if ok:
+                self._watch_failed.pop(key, None)
+                self._registry_stats["reloads"] += 1
+                reloaded.append(key)
             else:
-                self.current_model_info = {
-                    "model_name": model_name,
-                    "model_version": model_version,
-                    "loaded_at": datetime.now().isoformat(),
-                    "file_path": str(model_file),
-                    "file_size": file_size,
+                self._watch_failed[key] = signature
+        
+        return reloaded
+    
+    def list_models(self) -> List[Dict[str, Any]]:
+        """Resident model versions, most recently used last"""
+        current_key = self._current_key
+        with self._registry_lock:
+            return [
+                {
+                    "model_name": name,
+                    "model_version": version,
+                    "current": (name, version) == current_key,
+                    "size_bytes": entry["size_bytes"],
+                    "file_path": entry["file_path"],
+                    "loaded_at": entry["loaded_at"],
+                    "inference_backend": entry["info"].get("inference_backend"),
                 }
-            
-            logger.info(f"Model loaded successfully: {model_file}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error loading model: {e}", exc_info=True)
-            return False
+                for (name, version), entry in self._registry.items()
+            ]
+    
+    def get_registry_stats(self) -> Dict[str, Any]:
+        """Registry limits, usage and hit/miss/eviction counters"""
+        with self._registry_lock:
+            total_bytes = sum(e["size_bytes"] for e in self._registry.values())
+            size = len(self._registry)
+            stats = dict(self._registry_stats)
+        return {
+            "size": size,
+            "max_models": self.max_models,
+            "memory_mb": round(total_bytes / 2 ** 20, 3),
+            "max_memory_mb": round(self.max_memory_bytes / 2 ** 20, 3),
+            "generation": self.model_generation,
+            **stats,
+        }
     
     def save_model(
         self,
@@ -134,18 +471,44 @@ class ModelManager:
             logger.error(f"Error saving model: {e}", exc_info=True)
             raise
     
-    def get_model_info(self) -> Optional[Dict[str, Any]]:
-        """Get information about currently loaded model"""
-        return self.current_model_info
+    def add_reload_listener(self, listener: Callable[[], None]) -> None:
+        """Register a callback invoked after every successful model load (e.g. cache clear)"""
+        self._reload_listeners.append(listener)
+    
+    def _notify_reload(self) -> None:
+        for listener in self._reload_listeners:
+            try:
+                listener()
+            except Exception as e:
+                logger.warning(f"Model reload listener failed: {e}")
+    
+    def get_model_info(
+        self,
+        model_version: Optional[str] = None,
+        model_name: Optional[str] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """Get information about the currently loaded model (or a registry version)"""
+        if model_version is None:
+            return self.current_model_info
+        return self.get_model_with_info(model_version, model_name)[1]
     
     def is_model_loaded(self) -> bool:
         """Check if model is loaded"""
         return self.current_model is not None
     
-    def get_model(self) -> Optional[Any]:
-        """Get the currently loaded model"""
-        return self.current_model
+    def get_model(
+        self,
+        model_version: Optional[str] = None,
+        model_name: Optional[str] = None,
+    ) -> Optional[Any]:
+        """Get the currently loaded model (or a registry version, loaded on demand)"""
+        if model_version is None:
+            return self.current_model
+        return self.get_model_with_info(model_version, model_name)[0]
 
 
 # Global model manager instance
-model_manager = ModelManager()
+model_manager = ModelManager(
+    max_models=settings.MODEL_REGISTRY_MAX_MODELS,
+    max_memory_mb=settings.MODEL_REGISTRY_MAX_MB,
+)
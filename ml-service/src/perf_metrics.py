@@ -0,0 +1,305 @@
+"""
+Per-stage latency histograms for the prediction hot path
+
+Stages record into fixed-bucket histograms labelled by stage, endpoint and
+model version:
+- db_fetch, prepare_features, inference, postprocess and serialization;
+- request, the whole HTTP request.
+
+The endpoint label comes from a context variable. PerfMiddleware
+sets it, and run_in_thread() carries it into worker threads. The model
+version label is passed where the model is resolved; otherwise it defaults
+to the current model.
+
+One observation costs two perf_counter() calls, a bisect and a short
+locked update, so the instrumentation stays on in production
+(PERF_METRICS_ENABLED). GET /perf/metrics renders Prometheus text format
+and GET /perf/stats returns a JSON summary. Every serve.py worker keeps
+its own histograms, so each series also carries a worker label: the
+serve.py worker index (stable across restarts), or the process id outside
+serve.py. A scrape through the shared port reaches one worker at a time;
+sum by the other labels to aggregate.
+
+A single request can also collect its own breakdown: with the X-Timing
+header, PerfMiddleware installs a RequestTiming. The same stages and the
+individual DB queries (query_timer()) then add to it, and the prediction
+endpoints return it in meta["timing"].
+"""
+import contextvars
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import logging
+
+from starlette.responses import JSONResponse
+
+from src.config import settings, worker_index
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+METRIC_NAME = "ml_stage_latency_seconds"
+
+# Request header that turns on the per-request breakdown, and the request id header
+TIMING_HEADER = "x-timing"
+REQUEST_ID_HEADER = "x-request-id"
+
+endpoint_label: contextvars.ContextVar[str] = contextvars.ContextVar("endpoint_label", default="")
+
+_model_manager = None
+
+
+def worker_label() -> str:
+    """worker label of this process's series (read per call: serve.py sets the index after fork)"""
+    index = worker_index()
+    return str(index) if index is not None else f"pid{os.getpid()}"
+
+
+def _current_model_version() -> str:
+    global _model_manager
+    if _model_manager is None:
+        # Imported lazily: model_manager is not needed to import this module
+        from src.model_manager import model_manager
+        _model_manager = model_manager
+    active = _model_manager.get_active()
+    return str(active.info.get("model_version", "")) if active else "none"
+
+
+class StageHistograms:
+    """Thread-safe latency histograms keyed by (stage, endpoint, model_version)"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        # key -> [bucket counts (last: +Inf), sum, count, max]
+        self._series: Dict[Tuple[str, str, str], List[Any]] = {}
+
+    def observe(self, stage: str, seconds: float, model_version: Optional[str] = None) -> None:
+        """Record one duration for stage under the current endpoint/model labels"""
+        timing = request_timing.get()
+        if timing is not None:
+            timing.add_stage(stage, seconds)
+        if not self.enabled:
+            return
+        version = model_version or _current_model_version()
+        key = (stage, endpoint_label.get() or "none", version)
+        index = bisect_left(LATENCY_BUCKETS, seconds)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0, 0, 0.0]
+            series[0][index] += 1
+            series[1] += seconds
+            series[2] += 1
+            if seconds > series[3]:
+                series[3] = seconds
+
+    @contextmanager
+    def stage(self, name: str, model_version: Optional[str] = None) -> Iterator[None]:
+        """Time the enclosed block as one observation of stage name"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, model_version)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+    def _copy(self) -> Dict[Tuple[str, str, str], List[Any]]:
+        with self._lock:
+            return {key: [list(s[0]), s[1], s[2], s[3]] for key, s in self._series.items()}
+
+    def render_prometheus(self) -> str:
+        """All series in Prometheus text exposition format"""
+        lines = [
+            f"# HELP {METRIC_NAME} Latency of prediction hot-path stages",
+            f"# TYPE {METRIC_NAME} histogram",
+        ]
+        bounds = [repr(b) for b in LATENCY_BUCKETS] + ["+Inf"]
+        worker = _escape(worker_label())
+        for (stage, endpoint, version), (buckets, total, count, _) in sorted(self._copy().items()):
+            labels = (
+                f'stage="{_escape(stage)}",endpoint="{_escape(endpoint)}",'
+                f'model_version="{_escape(version)}",worker="{worker}"'
+            )
+            cumulative = 0
+            for bound, bucket in zip(bounds, buckets):
+                cumulative += bucket
+                lines.append(f'{METRIC_NAME}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{METRIC_NAME}_sum{{{labels}}} {total!r}")
+            lines.append(f"{METRIC_NAME}_count{{{labels}}} {count}")
+        return "\n".join(lines) + "\n"
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        """Per-series count, mean, max and bucket-estimated p50/p95/p99 (ms)"""
+        stats = []
+        for (stage, endpoint, version), (buckets, total, count, maximum) in sorted(self._copy().items()):
+            stats.append({
+                "stage": stage,
+                "endpoint": endpoint,
+                "model_version": version,
+                "count": count,
+                "avg_ms": round(total / count * 1000, 3) if count else 0.0,
+                "max_ms": round(maximum * 1000, 3),
+                "p50_ms": _quantile_ms(buckets, count, 0.50, maximum),
+                "p95_ms": _quantile_ms(buckets, count, 0.95, maximum),
+                "p99_ms": _quantile_ms(buckets, count, 0.99, maximum),
+            })
+        return stats
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _quantile_ms(buckets: List[int], count: int, q: float, maximum: float) -> float:
+    """Upper bound of the bucket holding the q-quantile (capped by the observed max)"""
+    if not count:
+        return 0.0
+    rank = q * count
+    cumulative = 0
+    for bound, bucket in zip(LATENCY_BUCKETS, buckets):
+        cumulative += bucket
+        if cumulative >= rank:
+            return round(min(bound, maximum) * 1000, 3)
+    return round(maximum * 1000, 3)
+
+
+class RequestTiming:
+    """Timing breakdown of one request: summed stage durations and every DB query"""
+
+    def __init__(self, request_id: Optional[str] = None):
+        self.request_id = request_id or uuid.uuid4().hex
+        self.started = time.perf_counter()
+        self._stages: Dict[str, List[float]] = {}
+        self._queries: List[Dict[str, Any]] = []
+
+    def add_stage(self, stage: str, seconds: float) -> None:
+        totals = self._stages.setdefault(stage, [0.0, 0])
+        totals[0] += seconds
+        totals[1] += 1
+
+    def add_query(self, name: str, seconds: float) -> None:
+        self._queries.append({"query": name, "ms": round(seconds * 1000, 3)})
+
+    def merge(self, other: Dict[str, Any]) -> None:
+        """Add a breakdown collected elsewhere (as_dict() of a process-pool job)"""
+        for stage, entry in other.get("stages", {}).items():
+            totals = self._stages.setdefault(stage, [0.0, 0])
+            totals[0] += entry["ms"] / 1000
+            totals[1] += entry["count"]
+        self._queries.extend(other.get("db_queries", []))
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Request id, elapsed time so far, per-stage totals (ms, calls) and DB queries"""
+        return {
+            "request_id": self.request_id,
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            "stages": {
+                stage: {"ms": round(seconds * 1000, 3), "count": count}
+                for stage, (seconds, count) in self._stages.items()
+            },
+            "db_queries": list(self._queries),
+        }
+
+
+request_timing: contextvars.ContextVar[Optional[RequestTiming]] = contextvars.ContextVar("request_timing", default=None)
+
+
+@contextmanager
+def collect_timing(request_id: Optional[str] = None) -> Iterator[RequestTiming]:
+    """Collect a RequestTiming for the enclosed block (and threads started via run_in_thread)"""
+    timing = RequestTiming(request_id)
+    token = request_timing.set(timing)
+    try:
+        yield timing
+    finally:
+        request_timing.reset(token)
+
+
+@contextmanager
+def query_timer(name: str) -> Iterator[None]:
+    """Time one DB query into the current RequestTiming (no-op without one)"""
+    timing = request_timing.get()
+    if timing is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add_query(name, time.perf_counter() - started)
+
+
+def _header(scope, name: str) -> Optional[str]:
+    encoded = name.encode("latin-1")
+    for key, value in scope.get("headers", ()):
+        if key.lower() == encoded:
+            return value.decode("latin-1")
+    return None
+
+
+class PerfMiddleware:
+    """
+    ASGI middleware for the latency instrumentation
+
+    - Sets the endpoint label and records the "request" stage. Paths that
+      are not routes of the app are labelled "other", so unknown URLs
+      cannot create new series.
+    - With "X-Timing: 1" (or true), collects a RequestTiming for the request,
+      keyed by X-Request-ID when the client sends one.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._paths: Optional[frozenset] = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timing_token = None
+        if (_header(scope, TIMING_HEADER) or "").lower() in ("1", "true", "yes"):
+            timing_token = request_timing.set(RequestTiming(_header(scope, REQUEST_ID_HEADER)))
+
+        label_token = None
+        if stage_histograms.enabled:
+            if self._paths is None:
+                self._paths = frozenset(getattr(route, "path", "") for route in scope["app"].routes)
+            path = scope["path"]
+            label_token = endpoint_label.set(path if path in self._paths else "other")
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if label_token is not None:
+                stage_histograms.observe("request", time.perf_counter() - started)
+                endpoint_label.reset(label_token)
+            if timing_token is not None:
+                request_timing.reset(timing_token)
+
+
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse whose rendering is recorded as the "serialization" stage"""
+
+    def render(self, content: Any) -> bytes:
+        with stage_histograms.stage("serialization"):
+            return super().render(content)
+
+
+# Global histograms; stage() is the instrumentation entry point
+stage_histograms = StageHistograms(enabled=settings.PERF_METRICS_ENABLED)
+stage = stage_histograms.stage
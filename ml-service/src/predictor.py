@@ -2,13 +2,19 @@
 Prediction logic using the trained XGBoost model
 Integrated with predict_one.py logic
 """
+import numpy as np
 import pandas as pd
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, Tuple
 from datetime import datetime, timedelta
 import logging
 from src.model_manager import model_manager
-from src.feature_engineering import prepare_features
+from src.feature_engineering import prepare_features, prepare_features_batch, stockpile_frames
 from src.database import DatabaseService
+from src.config import settings
+from src.feature_store import feature_store
+from src.rolling_features import rolling_features
+from src.inference import predict_positive
+from src.perf_metrics import stage
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +31,7 @@ class Predictor:
         stockpile_data: Dict[str, Any],
         horizon_days: int = 7,
         target_date: Optional[datetime] = None,
+        model_version: Optional[str] = None,
     ) -> Dict[str, Any]:
         """
         Make prediction for a stockpile using the actual XGBoost model
@@ -35,88 +42,37 @@ class Predictor:
             stockpile_data: Dictionary with stockpile data
             horizon_days: Prediction horizon in days
             target_date: Target date for prediction (default: now)
+            model_version: Registry version to use (default: current model)
             
         Returns:
             Dictionary with prediction results
         """
         try:
+            live = target_date is None
             if target_date is None:
                 target_date = datetime.now()
             
-            # Check if model is loaded
-            if not self.model_manager.is_model_loaded():
-                logger.warning("Model not loaded, attempting to load default model...")
-                # Try to load default model
-                if not self.model_manager.load_model("coal_fire_model", "1.0.0"):
-                    logger.warning("Could not load model, using placeholder prediction")
-                    return self._placeholder_prediction(stockpile_data, horizon_days, target_date)
-            
-            # Prepare features using actual feature engineering
-            features_df = prepare_features(
-                stockpile_data,
-                target_date=target_date,
-                db_service=self.db_service
-            )
-            
-            # Get the model
-            model = self.model_manager.get_model()
+            # Get the model (loaded at startup or via /model/load, never inside a request)
+            model, model_info = self.model_manager.get_model_with_info(model_version)
             if not model:
                 logger.warning("Model not available, using placeholder")
                 return self._placeholder_prediction(stockpile_data, horizon_days, target_date)
+            version = _version_of(model_info)
+            
+            # Prepare features (materialized vector or actual feature engineering)
+            features_df = self._features_for(stockpile_data, target_date, live, version)
             
             # Make prediction using XGBoost model
-            proba = model.predict_proba(features_df)[0][1]  # Probability of fire
-            pred = int(proba >= 0.5)  # Binary prediction
-            
-            # Calculate risk level based on probability
-            if proba >= 0.8:
-                risk_level = "CRITICAL"
-            elif proba >= 0.6:
-                risk_level = "HIGH"
-            elif proba >= 0.4:
-                risk_level = "MEDIUM"
-            else:
-                risk_level = "LOW"
-            
-            # Calculate predicted date (simplified - can be improved)
-            # If prediction is positive, estimate days to fire based on probability
-            if pred == 1:
-                # Higher probability = sooner fire
-                days_to_fire = max(1, int(horizon_days * (1 - proba)))
-                predicted_date = target_date + timedelta(days=days_to_fire)
-            else:
-                # No fire predicted in horizon
-                predicted_date = None
-            
-            # Calculate confidence interval (±2 days as per requirements)
-            if predicted_date:
-                interval_low = predicted_date - timedelta(days=2)
-                interval_high = predicted_date + timedelta(days=2)
-            else:
-                interval_low = None
-                interval_high = None
-            
-            result = {
-                "shtabel_id": stockpile_data.get("shtabel_id"),
-                "model_name": "xgboost_v1",
-                "model_version": self.model_manager.get_model_info().get("model_version", "1.0.0") if self.model_manager.get_model_info() else "1.0.0",
-                "predicted_date": predicted_date.isoformat() if predicted_date else None,
-                "prob_event": float(proba),
-                "risk_level": risk_level,
-                "horizon_days": horizon_days,
-                "interval_low": interval_low.isoformat() if interval_low else None,
-                "interval_high": interval_high.isoformat() if interval_high else None,
-                "confidence": float(proba),  # Use probability as confidence
-                "meta": {
-                    "predicted": pred,
-                    "features": features_df.iloc[0].to_dict(),
-                    "target_date": target_date.isoformat(),
-                },
-            }
+            proba = predict_positive(model, features_df, version)  # Probability of fire
+            
+            result = self._build_results(
+                [stockpile_data], features_df, proba, horizon_days, target_date, version
+            )[0]
             
             logger.info(
                 f"Prediction for shtabel {stockpile_data.get('shtabel_id')}: "
-                f"risk={risk_level}, prob={proba:.2f}, pred={pred}"
+                f"risk={result['risk_level']}, prob={result['prob_event']:.2f}, "
+                f"pred={result['meta']['predicted']}"
             )
             
             return result
@@ -126,6 +82,251 @@ class Predictor:
             # Fallback to placeholder on error
             return self._placeholder_prediction(stockpile_data, horizon_days, target_date)
     
+    def predict_batch(
+        self,
+        stockpiles: List[Dict[str, Any]],
+        horizon_days: int = 7,
+        target_date: Optional[datetime] = None,
+        model_version: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Make predictions for many stockpiles with a single model call
+        
+        Features for all stockpiles are prepared in one vectorized pass
+        (prepare_features_batch), the model is invoked once and risk level /
+        predicted date / interval are derived vectorized. Stockpiles whose
+        features cannot be prepared fall back to the placeholder prediction,
+        exactly as predict() does for one stockpile.
+        
+        Args:
+            stockpiles: List of stockpile data dictionaries
+            horizon_days: Prediction horizon in days
+            target_date: Target date for prediction (default: now)
+            model_version: Registry version to use (default: current model)
+            
+        Returns:
+            List of prediction dictionaries in the same order as stockpiles
+        """
+        live = target_date is None
+        if target_date is None:
+            target_date = datetime.now()
+        
+        if not stockpiles:
+            return []
+        
+        model, model_info = self.model_manager.get_model_with_info(model_version)
+        if not model:
+            logger.warning("Model not available, using placeholder")
+            return [
+                self._placeholder_prediction(data, horizon_days, target_date)
+                for data in stockpiles
+            ]
+        
+        version = _version_of(model_info)
+        results: List[Optional[Dict[str, Any]]] = [None] * len(stockpiles)
+        features_df, positions = self._batch_features(stockpiles, target_date, live, version)
+        
+        prepared = set(positions)
+        for i, stockpile_data in enumerate(stockpiles):
+            if i not in prepared:
+                results[i] = self._placeholder_prediction(stockpile_data, horizon_days, target_date)
+        
+        if positions:
+            batch = [stockpiles[i] for i in positions]
+            
+            try:
+                proba = predict_positive(model, features_df, version)
+                batch_results = self._build_results(
+                    batch, features_df, proba, horizon_days, target_date, version
+                )
+            except Exception as e:
+                logger.error(f"Error making batch prediction: {e}", exc_info=True)
+                batch_results = [
+                    self._placeholder_prediction(data, horizon_days, target_date)
+                    for data in batch
+                ]
+            
+            for i, result in zip(positions, batch_results):
+                results[i] = result
+        
+        logger.info(f"Batch prediction completed for {len(stockpiles)} stockpiles")
+        
+        return results
+    
+    def _features_for(
+        self,
+        stockpile_data: Dict[str, Any],
+        target_date: datetime,
+        live: bool,
+        model_version: str,
+    ) -> pd.DataFrame:
+        """
+        Feature row for a stockpile
+        
+        Live predictions (no explicit target date) use the latest materialized
+        feature vector when it is fresh; otherwise features are computed, from
+        the rolling feature state when it is loaded.
+        """
+        with stage("prepare_features", model_version):
+            if live and settings.FEATURE_STORE_ENABLED:
+                features_df = feature_store.lookup(stockpile_data, target_date, model_version)
+                if features_df is not None:
+                    return features_df
+            
+            if live and rolling_features.is_loaded:
+                try:
+                    return self._prepare_batch([stockpile_data], target_date, live)
+                except Exception as e:
+                    logger.warning(f"Rolling feature preparation failed, scanning history: {e}")
+            
+            return prepare_features(
+                self._with_full_history([stockpile_data])[0],
+                target_date=target_date,
+                db_service=self.db_service
+            )
+    
+    def _batch_features(
+        self,
+        stockpiles: List[Dict[str, Any]],
+        target_date: datetime,
+        live: bool,
+        model_version: str,
+    ) -> Tuple[Optional[pd.DataFrame], List[int]]:
+        """
+        Feature rows for many stockpiles
+        
+        Fresh materialized vectors are used for live predictions; all other
+        stockpiles go through one prepare_features_batch() call (stockpile by
+        stockpile if the vectorized pass fails), with the history aggregates
+        of the rolling feature state for live predictions when it is loaded.
+        
+        Returns:
+            (feature rows in position order or None, positions of the stockpiles
+            they belong to); stockpiles whose features failed are left out
+        """
+        with stage("prepare_features", model_version):
+            frames = []
+            positions = []
+            pending = []
+            for i, stockpile_data in enumerate(stockpiles):
+                if live and settings.FEATURE_STORE_ENABLED:
+                    stored = feature_store.lookup(stockpile_data, target_date, model_version)
+                    if stored is not None:
+                        frames.append(stored)
+                        positions.append(i)
+                        continue
+                pending.append(i)
+            
+            if pending:
+                try:
+                    frames.append(self._prepare_batch([stockpiles[i] for i in pending], target_date, live))
+                    positions.extend(pending)
+                except Exception as e:
+                    logger.warning(f"Vectorized feature preparation failed, preparing per stockpile: {e}")
+                    full = dict(zip(pending, self._with_full_history([stockpiles[i] for i in pending])))
+                    for i in pending:
+                        try:
+                            frames.append(prepare_features(
+                                full[i], target_date=target_date, db_service=self.db_service
+                            ))
+                            positions.append(i)
+                        except Exception as e:
+                            logger.error(
+                                f"Error preparing features for shtabel {stockpiles[i].get('shtabel_id')}: {e}"
+                            )
+            
+            if not frames:
+                return None, []
+            order = np.argsort(positions, kind="stable")
+            features_df = pd.concat(frames, ignore_index=True).iloc[order].reset_index(drop=True)
+            return features_df, [positions[i] for i in order]
+    
+    def _prepare_batch(
+        self,
+        stockpiles: List[Dict[str, Any]],
+        target_date: datetime,
+        live: bool,
+    ) -> pd.DataFrame:
+        """prepare_features_batch() over stockpile dictionaries"""
+        if live and rolling_features.is_loaded:
+            # Hottest record and 3-day lag from the rolling state, no history scan
+            stockpiles_df, temperatures_df = stockpile_frames(stockpiles, with_temperatures=False)
+            history = rolling_features.history_frame(stockpiles, target_date)
+        else:
+            stockpiles_df, temperatures_df = stockpile_frames(self._with_full_history(stockpiles))
+            history = None
+        return prepare_features_batch(
+            stockpiles_df,
+            temperatures_df,
+            target_date,
+            db_service=self.db_service,
+            key="stockpile",
+            history=history,
+        )
+    
+    def _with_full_history(self, stockpiles: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Stockpiles with their full temperature history
+        
+        Live fetches carry only the records after the rolling feature
+        watermark ("temperatures_after"); paths that scan the history
+        refetch those stockpiles.
+        """
+        partial = [
+            int(data["shtabel_id"]) for data in stockpiles
+            if data.get("temperatures_after") is not None
+        ]
+        if not partial:
+            return stockpiles
+        try:
+            refetched = self.db_service.get_stockpiles_data(partial)
+        except Exception as e:
+            logger.warning(f"Could not refetch temperature history, using the fetched records: {e}")
+            return stockpiles
+        return [
+            refetched.get(int(data["shtabel_id"]), data) if data.get("temperatures_after") is not None else data
+            for data in stockpiles
+        ]
+    
+    def _build_results(
+        self,
+        stockpiles: List[Dict[str, Any]],
+        features_df: pd.DataFrame,
+        proba: np.ndarray,
+        horizon_days: int,
+        target_date: datetime,
+        model_version: str,
+    ) -> List[Dict[str, Any]]:
+        """
+        Build prediction dictionaries from model probabilities (vectorized)
+        """
+        with stage("postprocess", model_version):
+            fields = build_prediction_fields(proba, horizon_days, target_date)
+            
+            target_date_iso = target_date.isoformat()
+            features = features_df.to_dict(orient="records")
+            
+            return [
+                {
+                    "shtabel_id": stockpile_data.get("shtabel_id"),
+                    "model_name": "xgboost_v1",
+                    "model_version": model_version,
+                    "predicted_date": fields["predicted_date"][i],
+                    "prob_event": float(proba[i]),
+                    "risk_level": fields["risk_level"][i],
+                    "horizon_days": horizon_days,
+                    "interval_low": fields["interval_low"][i],
+                    "interval_high": fields["interval_high"][i],
+                    "confidence": float(proba[i]),  # Use probability as confidence
+                    "meta": {
+                        "predicted": int(fields["predicted"][i]),
+                        "features": features[i],
+                        "target_date": target_date_iso,
+                    },
+                }
+                for i, stockpile_data in enumerate(stockpiles)
+            ]
+    
     def _placeholder_prediction(
         self,
         stockpile_data: Dict[str, Any],
@@ -182,6 +383,64 @@ class Predictor:
         }
 
 
+def _version_of(model_info: Optional[Dict[str, Any]]) -> str:
+    return model_info.get("model_version", "1.0.0") if model_info else "1.0.0"
+
+
+def build_prediction_fields(
+    proba: np.ndarray,
+    horizon_days: int,
+    target_date: datetime,
+) -> Dict[str, List[Any]]:
+    """
+    Derive risk level, predicted date and ±2 day interval from probabilities
+    
+    Vectorized over the whole batch. Dates are formatted once per distinct
+    days-to-fire value, which is bounded by horizon_days.
+    
+    Args:
+        proba: Array of fire probabilities
+        horizon_days: Prediction horizon in days
+        target_date: Date the prediction is made for
+        
+    Returns:
+        Dictionary of per-row lists: predicted, risk_level, predicted_date,
+        interval_low, interval_high
+    """
+    proba = np.asarray(proba)
+    predicted = (proba >= 0.5).astype(int)
+    
+    # Calculate risk level based on probability
+    risk_level = np.select(
+        [proba >= 0.8, proba >= 0.6, proba >= 0.4],
+        ["CRITICAL", "HIGH", "MEDIUM"],
+        default="LOW",
+    )
+    
+    # Higher probability = sooner fire; no fire predicted in horizon when pred == 0
+    days_to_fire = np.maximum(1, (horizon_days * (1 - proba)).astype(int))
+    days_to_fire = np.where(predicted == 1, days_to_fire, 0)
+    
+    # Confidence interval ±2 days as per requirements
+    formatted = {0: (None, None, None)}
+    for days in np.unique(days_to_fire[days_to_fire > 0]).tolist():
+        predicted_date = target_date + timedelta(days=days)
+        formatted[days] = (
+            predicted_date.isoformat(),
+            (predicted_date - timedelta(days=2)).isoformat(),
+            (predicted_date + timedelta(days=2)).isoformat(),
+        )
+    dates = [formatted[days] for days in days_to_fire.tolist()]
+    
+    return {
+        "predicted": predicted.tolist(),
+        "risk_level": risk_level.tolist(),
+        "predicted_date": [d[0] for d in dates],
+        "interval_low": [d[1] for d in dates],
+        "interval_high": [d[2] for d in dates],
+    }
+
+
 def _calculate_days_since(date_value: Optional[Any]) -> float:
     """Calculate days since a given date"""
     if date_value is None:
@@ -0,0 +1,252 @@
+"""
+Общая предобработка CSV-данных: возгорания, поставки, температуры, погода
+
+Один конвейер для всех путей, которые строят признаки из выгрузок:
+- обучение (train_from_csv.py);
+- прогноз по CSV (CSVPredictor);
+- models/data_processing.make_dataset;
+- валидация сырого файла температур (ModelValidator).
+
+Даты хранятся как datetime64, усечённые до дня; объекты datetime.date
+не создаются. Погода агрегируется по дням и присоединяется по индексу дня,
+без слияния таблиц. Входные таблицы не изменяются.
+"""
+import numpy as np
+import pandas as pd
+from typing import Dict, Optional
+import logging
+
+from src.feature_engineering import WEATHER_DEFAULTS
+
+logger = logging.getLogger(__name__)
+
+TEMP_COLUMN = 'Максимальная температура'
+
+# Переименование колонок исходных выгрузок (применяется, если целевой колонки нет)
+FIRES_RENAME = {
+    'Груз': 'Марка',
+    'Дата начала': 'Дата возгорания',
+    'Нач.форм.штабеля': 'Формирование штабеля',
+}
+SUPPLIES_RENAME = {
+    'ВыгрузкаНаСклад': 'Дата поступления',
+    'Наим. ЕТСНГ': 'Марка',
+    'ПогрузкаНаСудно': 'Дата отправления',
+}
+WEATHER_RENAME = {
+    't': 'temp_air',
+    'p': 'pressure',
+    'precipitation': 'precip',
+}
+
+# Агрегация почасовой погоды до дня
+WEATHER_AGGREGATIONS = {
+    'temp_air': 'max',
+    'humidity': 'mean',
+    'precip': 'sum',
+}
+
+# Метка: возгорание того же штабеля в окне ±FIRE_WINDOW_DAYS дней от даты замера
+FIRE_WINDOW_DAYS = 2
+
+
+def _rename_missing(df: pd.DataFrame, mapping: Dict[str, str]) -> pd.DataFrame:
+    """Переименовать колонки, если колонки с новым именем ещё нет"""
+    renames = {old: new for old, new in mapping.items() if old in df.columns and new not in df.columns}
+    return df.rename(columns=renames) if renames else df
+
+
+def _column(df: pd.DataFrame, *names: str) -> pd.Series:
+    """Первая из имеющихся колонок"""
+    for name in names:
+        if name in df.columns:
+            return df[name]
+    raise ValueError(f"Отсутствует колонка {' / '.join(names)}")
+
+
+def parse_days(values: pd.Series) -> pd.Series:
+    """Даты, усечённые до дня (datetime64 без часового пояса), NaT для нераспознанных"""
+    days = pd.to_datetime(values, errors='coerce')
+    if isinstance(days.dtype, pd.DatetimeTZDtype):
+        days = days.dt.tz_localize(None)
+    return days.dt.normalize()
+
+
+def day_numbers(days: pd.Series) -> np.ndarray:
+    """Номера дней от эпохи (int64) для дат, усечённых до дня"""
+    return days.to_numpy(dtype='datetime64[ns]').astype('datetime64[D]').astype(np.int64)
+
+
+def stack_ids(df: pd.DataFrame) -> pd.Series:
+    """Идентификатор штабеля "Склад_Штабель\""""
+    return df['Склад'].astype(str) + '_' + df['Штабель'].astype(str)
+
+
+def prepare_temperature(temp: pd.DataFrame) -> pd.DataFrame:
+    """
+    Замеры температуры с колонками date (день замера) и stack_id
+    
+    Строки с нераспознанной датой отбрасываются.
+    """
+    days = parse_days(_column(temp, 'Дата акта', 'Дата'))
+    valid = days.notna()
+    temp = temp[valid]
+    return temp.assign(date=days[valid], stack_id=stack_ids(temp))
+
+
+def stack_start_days(supplies: pd.DataFrame) -> pd.Series:
+    """День формирования штабеля (первая поставка), индекс — stack_id"""
+    supplies = _rename_missing(supplies, SUPPLIES_RENAME)
+    days = parse_days(_column(supplies, 'Дата поступления'))
+    valid = days.notna()
+    start = days[valid].groupby([supplies.loc[valid, 'Склад'], supplies.loc[valid, 'Штабель']]).min()
+    start.index = (
+        start.index.get_level_values(0).astype(str) + '_' + start.index.get_level_values(1).astype(str)
+    )
+    return start
+
+
+def fire_days(fires: pd.DataFrame) -> pd.DataFrame:
+    """Возгорания с колонками stack_id и date_fire (день начала); строки без даты отбрасываются"""
+    fires = _rename_missing(fires, FIRES_RENAME)
+    days = parse_days(_column(fires, 'Дата возгорания'))
+    valid = days.notna()
+    return pd.DataFrame({
+        'stack_id': stack_ids(fires[valid]),
+        'date_fire': days[valid],
+    })
+
+
+def fire_labels(temp: pd.DataFrame, fires: pd.DataFrame, window: int = FIRE_WINDOW_DAYS) -> np.ndarray:
+    """
+    Метка для каждого замера: 1, если у того же штабеля есть возгорание
+    в окне ±window дней от дня замера
+    
+    Штабель и день кодируются одним целым ключом так, что дни разных штабелей
+    не пересекаются даже со сдвигом на window; наличие возгорания в окне —
+    два searchsorted по отсортированным ключам возгораний.
+    
+    Args:
+        temp: Замеры с колонками stack_id и date (prepare_temperature)
+        fires: Возгорания с колонками stack_id и date_fire (fire_days)
+        window: Полуширина окна в днях
+    """
+    if len(temp) == 0 or len(fires) == 0:
+        return np.zeros(len(temp), dtype=np.int64)
+    
+    codes, _ = pd.factorize(pd.concat([temp['stack_id'], fires['stack_id']], ignore_index=True))
+    days = np.concatenate([day_numbers(temp['date']), day_numbers(fires['date_fire'])])
+    first_day = days.min()
+    span = int(days.max() - first_day) + 2 * window + 1
+    keys = codes.astype(np.int64) * span + (days - first_day + window)
+    
+    temp_keys = keys[:len(temp)]
+    fire_keys = np.sort(keys[len(temp):])
+    lo = np.searchsorted(fire_keys, temp_keys - window, side='left')
+    hi = np.searchsorted(fire_keys, temp_keys + window, side='right')
+    return (hi > lo).astype(np.int64)
+
+
+def daily_weather(weather: Optional[pd.DataFrame]) -> Optional[pd.DataFrame]:
+    """
+    Суточные агрегаты погоды (max температуры, средняя влажность, сумма осадков)
+    
+    Returns:
+        DataFrame с индексом — днём и имеющимися колонками WEATHER_AGGREGATIONS,
+        или None, если погоды нет или в ней нет нужных колонок
+    """
+    if weather is None or weather.empty:
+        return None
+    weather = _rename_missing(weather, WEATHER_RENAME)
+    aggregations = {col: how for col, how in WEATHER_AGGREGATIONS.items() if col in weather.columns}
+    if not aggregations:
+        logger.warning("В погодных данных нет нужных колонок, используем значения по умолчанию")
+        return None
+    
+    days = parse_days(_column(weather, 'date', 'datetime'))
+    return weather[list(aggregations)].groupby(days.to_numpy()).agg(aggregations)
+
+
+def build_features(
+    temp: pd.DataFrame,
+    stack_start: Optional[pd.Series] = None,
+    weather: Optional[pd.DataFrame] = None,
+) -> pd.DataFrame:
+    """
+    Признаки модели для замеров температуры
+    
+    Args:
+        temp: Замеры с колонками date и stack_id (prepare_temperature)
+        stack_start: День формирования по stack_id (stack_start_days); без него age_days = 0
+        weather: Суточная погода (daily_weather); без неё значения по умолчанию
+    
+    Returns:
+        Замеры, отсортированные по штабелю и дате, с колонками stack_start,
+        age_days, temp_air, humidity, precip, temp_lag3, temp_delta_3d;
+        строки без максимальной температуры отброшены
+    """
+    temp = temp.copy()
+    
+    # Возраст штабеля в днях (не меньше 0)
+    if stack_start is not None:
+        temp['stack_start'] = pd.to_datetime(temp['stack_id'].map(stack_start))
+        temp['age_days'] = (temp['date'] - temp['stack_start']).dt.days.clip(lower=0).fillna(0)
+    else:
+        temp['age_days'] = 0
+    
+    # Погода на день замера
+    for col, default in WEATHER_DEFAULTS.items():
+        if weather is not None and col in weather.columns:
+            temp[col] = weather[col].reindex(temp['date']).to_numpy()
+        else:
+            temp[col] = default
+    
+    # Динамика температуры: рост за 3 замера штабеля
+    temp = temp.sort_values(['stack_id', 'date']).reset_index(drop=True)
+    temp['temp_lag3'] = temp.groupby('stack_id', sort=False)[TEMP_COLUMN].shift(3)
+    temp['temp_delta_3d'] = (temp[TEMP_COLUMN] - temp['temp_lag3']).fillna(0)
+    
+    temp = temp[temp[TEMP_COLUMN].notna()]
+    
+    # Пропуски погоды: соседние значения, иначе значения по умолчанию
+    for col, default in WEATHER_DEFAULTS.items():
+        if temp[col].isna().any():
+            temp[col] = temp[col].ffill().bfill().fillna(default)
+    
+    return temp
+
+
+def build_dataset(
+    fires: pd.DataFrame,
+    supplies: pd.DataFrame,
+    temp: pd.DataFrame,
+    weather: Optional[pd.DataFrame] = None,
+    with_target: bool = True,
+) -> pd.DataFrame:
+    """
+    Полная предобработка выгрузок: даты, stack_id, метка, возраст, погода, динамика
+    
+    Args:
+        fires: Возгорания (fires.csv)
+        supplies: Поставки (supplies.csv)
+        temp: Замеры температуры (temperature.csv)
+        weather: Почасовая погода (weather_data_*.csv), опционально
+        with_target: Добавить метку target (возгорание в окне ±FIRE_WINDOW_DAYS дней)
+    
+    Returns:
+        Набор данных с FEATURE_COLUMNS (и target), по строке на замер
+    """
+    temp = prepare_temperature(temp)
+    fires = fire_days(fires)
+    stack_start = stack_start_days(supplies)
+    if len(fires) == 0 or len(temp) == 0 or len(stack_start) == 0:
+        raise ValueError("Один или несколько CSV файлов пусты после обработки дат")
+    
+    if with_target:
+        temp['target'] = fire_labels(temp, fires)
+    
+    daily = daily_weather(weather)
+    if daily is None:
+        logger.info("Погодные данные отсутствуют, используем значения по умолчанию")
+    
+    return build_features(temp, stack_start, daily)
@@ -0,0 +1,260 @@
+"""
+On-demand sampling profiler for heavy jobs
+
+A wall-clock sampler thread reads the job thread's stack with
+sys._current_frames() every PROFILER_INTERVAL_MS and counts identical
+stacks. Nothing is injected into the profiled code, so the job runs at
+full speed apart from the GIL taken by the sampler for each sample.
+
+Which runs are kept:
+- every N-th run (PROFILER_EVERY_N), and
+- any run slower than PROFILER_THRESHOLD_MS.
+
+Kept profiles are written in collapsed-stack format ("frame;frame;frame
+count" per line), which flamegraph.pl, speedscope and inferno read
+directly. The directory is a bounded ring: the oldest files are deleted
+beyond PROFILER_MAX_FILES.
+
+The serving process decides with plan() and passes the plan to the job.
+The job samples itself in the worker process via run() and returns the
+capture, and the serving process writes it with save(). Settings can be
+changed at runtime through /admin/profiler.
+"""
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import logging
+
+from src.config import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SUFFIX = ".folded"
+
+# Deepest stack recorded per sample (deeper frames are cut at the root side)
+MAX_STACK_DEPTH = 128
+
+
+def _frame_label(frame: Any) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame: Any) -> str:
+    """Stack of frame as "root;...;leaf" (collapsed-stack format)"""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class StackSampler:
+    """Samples one thread's stack at a fixed interval from a daemon thread"""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.samples[collapse_stack(frame)] += 1
+            del frame
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+
+class JobProfiler:
+    """Runtime-configurable sampling of jobs with a bounded on-disk profile ring"""
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        every_n: int = 0,
+        threshold_ms: float = 2000.0,
+        interval_ms: float = 10.0,
+        directory: str = "./profiles",
+        max_files: int = 50,
+    ):
+        """
+        Args:
+            enabled: Profile jobs at all
+            every_n: Keep every N-th run (0: only slow runs)
+            threshold_ms: Keep runs at least this slow (0: no threshold)
+            interval_ms: Sampling interval
+            directory: Directory of the profile ring
+            max_files: Profiles kept in the ring
+        """
+        self.enabled = enabled
+        self.every_n = every_n
+        self.threshold_ms = threshold_ms
+        self.interval_ms = interval_ms
+        self.directory = directory
+        self.max_files = max_files
+        self._lock = threading.Lock()
+        self._runs = 0
+        self._stats = {"planned": 0, "saved": 0, "discarded": 0}
+
+    def configure(self, **changes: Any) -> Dict[str, Any]:
+        """Change settings at runtime (None values are ignored); returns get_status()"""
+        with self._lock:
+            for name in ("enabled", "every_n", "threshold_ms", "interval_ms", "max_files"):
+                if changes.get(name) is not None:
+                    setattr(self, name, changes[name])
+        logger.info(
+            f"Profiler configured: enabled={self.enabled}, every_n={self.every_n}, "
+            f"threshold_ms={self.threshold_ms}, interval_ms={self.interval_ms}"
+        )
+        return self.get_status()
+
+    def plan(self, name: str) -> Optional[Dict[str, Any]]:
+        """
+        Profiling plan for one job run, to pass to run() (None when disabled)
+
+        Args:
+            name: Job name used in the profile file name (e.g. "predict_csv")
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._runs += 1
+            self._stats["planned"] += 1
+            sampled = self.every_n > 0 and self._runs % self.every_n == 0
+        return {
+            "name": name,
+            "sampled": sampled,
+            "threshold_ms": self.threshold_ms,
+            "interval_ms": self.interval_ms,
+        }
+
+    @staticmethod
+    def run(plan: Optional[Dict[str, Any]], func: Callable[..., Any], *args: Any, **kwargs: Any) -> Tuple[Any, Optional[Dict[str, Any]]]:
+        """
+        Call func, sampling the calling thread according to plan
+
+        Works in any process: the capture is plain data for save().
+
+        Returns:
+            (result of func, capture or None if the run is not kept)
+        """
+        if plan is None:
+            return func(*args, **kwargs), None
+
+        sampler = StackSampler(threading.get_ident(), max(0.001, plan["interval_ms"] / 1000))
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            samples = sampler.stop()
+        duration_ms = (time.perf_counter() - started) * 1000
+
+        if plan["sampled"]:
+            reason = "every_n"
+        elif plan["threshold_ms"] > 0 and duration_ms >= plan["threshold_ms"]:
+            reason = "threshold"
+        else:
+            return result, None
+
+        return result, {
+            "name": plan["name"],
+            "reason": reason,
+            "duration_ms": round(duration_ms, 1),
+            "samples": dict(samples),
+        }
+
+    def save(self, capture: Optional[Dict[str, Any]]) -> Optional[str]:
+        """Write a capture from run() to the ring; returns the file name"""
+        if capture is None:
+            with self._lock:
+                self._stats["discarded"] += 1
+            return None
+
+        os.makedirs(self.directory, exist_ok=True)
+        file_name = (
+            f"{datetime.now().strftime('%Y%m%dT%H%M%S_%f')}_{capture['name']}_"
+            f"{int(capture['duration_ms'])}ms_{capture['reason']}{PROFILE_SUFFIX}"
+        )
+        with open(os.path.join(self.directory, file_name), "w", encoding="utf-8") as f:
+            for stack, count in sorted(capture["samples"].items()):
+                f.write(f"{stack} {count}\n")
+
+        with self._lock:
+            self._stats["saved"] += 1
+        self._trim()
+        logger.info(f"Profile saved: {file_name} ({sum(capture['samples'].values())} samples)")
+        return file_name
+
+    def _trim(self) -> None:
+        """Delete the oldest profiles beyond max_files"""
+        for profile in self.list_profiles()[self.max_files:]:
+            try:
+                os.remove(os.path.join(self.directory, profile["file"]))
+            except FileNotFoundError:
+                pass
+
+    def list_profiles(self) -> List[Dict[str, Any]]:
+        """Profiles in the ring, newest first"""
+        try:
+            names = [name for name in os.listdir(self.directory) if name.endswith(PROFILE_SUFFIX)]
+        except FileNotFoundError:
+            return []
+        names.sort(reverse=True)
+        return [
+            {"file": name, "size_bytes": os.path.getsize(os.path.join(self.directory, name))}
+            for name in names
+            if os.path.exists(os.path.join(self.directory, name))
+        ]
+
+    def read_profile(self, file_name: str) -> Optional[str]:
+        """Collapsed stacks of one profile (None if it does not exist)"""
+        if not re.fullmatch(r"[\w.-]+", file_name) or not file_name.endswith(PROFILE_SUFFIX):
+            return None
+        path = os.path.join(self.directory, file_name)
+        if not os.path.isfile(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+
+    def get_status(self) -> Dict[str, Any]:
+        """Current settings, counters and ring size"""
+        with self._lock:
+            stats = dict(self._stats)
+        return {
+            "enabled": self.enabled,
+            "every_n": self.every_n,
+            "threshold_ms": self.threshold_ms,
+            "interval_ms": self.interval_ms,
+            "directory": os.path.abspath(self.directory),
+            "max_files": self.max_files,
+            "profiles": len(self.list_profiles()),
+            **stats,
+        }
+
+
+# Global profiler
+job_profiler = JobProfiler(
+    enabled=settings.PROFILER_ENABLED,
+    every_n=settings.PROFILER_EVERY_N,
+    threshold_ms=settings.PROFILER_THRESHOLD_MS,
+    interval_ms=settings.PROFILER_INTERVAL_MS,
+    directory=settings.PROFILER_DIR,
+    max_files=settings.PROFILER_MAX_FILES,
+)
@@ -0,0 +1,566 @@
+"""
+Incremental rolling-window temperature state per stockpile
+
+prepare_features() finds the hottest record and the 3-day lag reading by
+scanning the stockpile's temperature history on every call, and the CSV
+paths recompute groupby().shift(3) over whole files. The engine keeps the
+state these features need and updates it reading by reading:
+
+- the readings of each stockpile in a ring buffer: every reading still
+  inside a window and at least the last ROLLING_CAPACITY ones. The ring
+  doubles when a reading inside a window would be overwritten, so windows
+  are bounded by time, not by a reading count;
+- for the history window (TEMPERATURE_HISTORY_DAYS) and every window of
+  ROLLING_WINDOWS_DAYS: a running sum and count plus monotonic deques for
+  the minimum and maximum.
+
+Appending a reading and evicting readings that left a window are O(1)
+amortized; a reading older than the stockpile's newest one rebuilds only
+that stockpile's state from its ring. Current values are read without
+touching history:
+- temp_lag_3d: the reading prepare_features() subtracts for temp_delta_3d;
+- temp_delta_lag{k} for each of ROLLING_LAGS: newest reading minus the
+  reading k readings back, as groupby().shift(k) in the CSV paths;
+- count/mean/min/max per window.
+
+Readings are identified by their TempRecord id, not by value: two pickets
+reporting the same temperature at the same time are two readings. The
+state is loaded from TempRecord at startup and then advanced from its
+watermark (the highest TempRecord id applied) by a background task every
+ROLLING_REFRESH_SECONDS. Lookups never query the database. The predictor
+also feeds it the records it has just fetched (sync()), so live features
+never lag behind the stockpile data they are combined with.
+
+Sequence ids are handed out at insert time but become visible at commit,
+so under concurrent writers a row with a lower id can appear after a
+refresh has moved past it. Refreshes and live fetches therefore re-read
+the last ROLLING_ID_OVERLAP ids below the watermark; applying a row twice
+is a no-op, so the overlap only costs the re-read rows. A row committed
+after more than ROLLING_ID_OVERLAP newer ids is still missed.
+"""
+import math
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import logging
+
+import numpy as np
+import pandas as pd
+
+from src.config import settings
+from src.database import DatabaseService, TEMPERATURE_HISTORY_DAYS
+from src.feature_engineering import _naive_datetime, to_naive_datetimes
+
+logger = logging.getLogger(__name__)
+
+NANOS_PER_DAY = 86_400 * 10**9
+
+# Lag window of temp_delta_3d in prepare_features()
+DELTA_DAYS = 3
+
+
+def _parse_ints(value: str) -> List[int]:
+    """Parse a comma-separated list of positive integers, e.g. "1,7" -> [1, 7]"""
+    return sorted({int(part) for part in value.split(",") if part.strip().isdigit() and int(part) > 0})
+
+
+def _nanos(value: Any) -> Optional[int]:
+    """Timestamp as naive wall-time nanoseconds (as prepare_features() compares dates), None if missing"""
+    value = _naive_datetime(value)
+    return None if value is pd.NaT else value.value
+
+
+def _timestamp(nanos: int) -> str:
+    return pd.Timestamp(nanos).isoformat()
+
+
+class _Window:
+    """Running aggregates of the readings newer than a time span"""
+
+    __slots__ = ("nanos", "start", "total", "count", "maxima", "minima")
+
+    def __init__(self, days: int):
+        self.nanos = days * NANOS_PER_DAY
+        # Sequence number of the oldest reading in the window
+        self.start = 0
+        self.total = 0.0
+        self.count = 0
+        # (sequence number, temperature) with decreasing / increasing temperatures
+        self.maxima: deque = deque()
+        self.minima: deque = deque()
+
+    def push(self, seq: int, temp: float) -> None:
+        self.total += temp
+        self.count += 1
+        while self.maxima and self.maxima[-1][1] <= temp:
+            self.maxima.pop()
+        self.maxima.append((seq, temp))
+        while self.minima and self.minima[-1][1] >= temp:
+            self.minima.pop()
+        self.minima.append((seq, temp))
+
+    def pop(self, temp: float) -> None:
+        """Remove the oldest reading (its temperature is temp)"""
+        self.start += 1
+        self.count -= 1
+        # Reset instead of accumulating rounding errors
+        self.total = self.total - temp if self.count else 0.0
+        while self.maxima and self.maxima[0][0] < self.start:
+            self.maxima.popleft()
+        while self.minima and self.minima[0][0] < self.start:
+            self.minima.popleft()
+
+    def values(self) -> Dict[str, Any]:
+        if not self.count:
+            return {"count": 0, "mean": None, "min": None, "max": None}
+        return {
+            "count": self.count,
+            # The running sum carries rounding errors of evicted readings
+            "mean": round(self.total / self.count, 6),
+            "min": self.minima[0][1],
+            "max": self.maxima[0][1],
+        }
+
+
+class StockpileState:
+    """Ring buffer of one stockpile's readings and its window aggregates"""
+
+    __slots__ = ("capacity", "window_days", "times", "temps", "ids", "known", "seq", "windows")
+
+    def __init__(self, capacity: int, window_days: Sequence[int]):
+        """
+        Args:
+            capacity: Readings kept; older ones also leave every window
+            window_days: Window lengths, the first one is the history window
+        """
+        self.capacity = capacity
+        self.window_days = tuple(window_days)
+        self.times = [0] * capacity
+        self.temps = [0.0] * capacity
+        # TempRecord id per slot (None for readings without one) and the ids kept
+        self.ids: List[Optional[int]] = [None] * capacity
+        self.known = set()
+        # Readings appended so far; reading n is in slot n % capacity
+        self.seq = 0
+        self.windows = [_Window(days) for days in self.window_days]
+
+    @property
+    def size(self) -> int:
+        return min(self.seq, self.capacity)
+
+    @property
+    def latest(self) -> Optional[int]:
+        """Time of the newest reading (ns)"""
+        return self.times[(self.seq - 1) % self.capacity] if self.seq else None
+
+    def _evict(self, window: _Window, cutoff: int) -> None:
+        """Drop readings older than cutoff"""
+        while window.start < self.seq:
+            slot = window.start % self.capacity
+            if self.times[slot] >= cutoff:
+                break
+            window.pop(self.temps[slot])
+
+    def _grow(self) -> None:
+        """Double the ring; every reading keeps its sequence number"""
+        capacity = self.capacity * 2
+        times, temps, ids = [0] * capacity, [0.0] * capacity, [None] * capacity
+        for seq in range(self.seq - self.size, self.seq):
+            old, new = seq % self.capacity, seq % capacity
+            times[new], temps[new], ids[new] = self.times[old], self.temps[old], self.ids[old]
+        self.capacity, self.times, self.temps, self.ids = capacity, times, temps, ids
+
+    def append(self, nanos: int, temp: float, record_id: Optional[int] = None) -> bool:
+        """
+        Add one reading
+
+        Args:
+            nanos: Reading time (ns)
+            temp: Temperature
+            record_id: TempRecord id; without one the reading is always added
+
+        Returns:
+            False if the reading with this record_id is already kept
+        """
+        if record_id is not None and record_id in self.known:
+            return False
+        latest = self.latest
+        if latest is not None and nanos < latest:
+            self._rebuild([(nanos, temp, record_id)])
+            return True
+
+        for window in self.windows:
+            self._evict(window, nanos - window.nanos)
+        # The slot is reused only once its reading has left every window
+        if self.seq >= self.capacity and min(window.start for window in self.windows) <= self.seq - self.capacity:
+            self._grow()
+        slot = self.seq % self.capacity
+        if self.seq >= self.capacity:
+            self.known.discard(self.ids[slot])
+        self.times[slot] = nanos
+        self.temps[slot] = temp
+        self.ids[slot] = record_id
+        if record_id is not None:
+            self.known.add(record_id)
+        for window in self.windows:
+            window.push(self.seq, temp)
+        self.seq += 1
+        return True
+
+    def readings(self) -> List[Tuple[int, float, Optional[int]]]:
+        """Kept readings as (time, temperature, record id), oldest first"""
+        return [
+            (self.times[seq % self.capacity], self.temps[seq % self.capacity], self.ids[seq % self.capacity])
+            for seq in range(self.seq - self.size, self.seq)
+        ]
+
+    def _rebuild(self, extra: List[Tuple[int, float, Optional[int]]]) -> None:
+        """Re-append the kept readings with out-of-order ones in time order"""
+        readings = sorted(self.readings() + extra, key=lambda reading: reading[0])
+        self.seq = 0
+        self.known = set()
+        self.windows = [_Window(days) for days in self.window_days]
+        for nanos, temp, record_id in readings:
+            self.append(nanos, temp, record_id)
+
+    def advance(self, now: int) -> None:
+        """Evict readings that left the windows by time now (ns)"""
+        for window in self.windows:
+            self._evict(window, now - window.nanos)
+
+    def lag_reading(self, at: int, days: int = DELTA_DAYS) -> Optional[float]:
+        """Temperature of the newest reading in [at - days, at), as temp_delta_3d uses"""
+        cutoff = at - days * NANOS_PER_DAY
+        for seq in range(self.seq - 1, self.seq - 1 - self.size, -1):
+            slot = seq % self.capacity
+            if self.times[slot] >= at:
+                continue
+            return self.temps[slot] if self.times[slot] >= cutoff else None
+        return None
+
+    def lag_delta(self, lag: int) -> Optional[float]:
+        """Newest reading minus the reading lag readings back"""
+        if self.size <= lag:
+            return None
+        return self.temps[(self.seq - 1) % self.capacity] - self.temps[(self.seq - 1 - lag) % self.capacity]
+
+
+class RollingFeatureEngine:
+    """Thread-safe per-stockpile rolling state, advanced from TempRecord"""
+
+    def __init__(
+        self,
+        window_days: Sequence[int] = (1, 7),
+        lags: Sequence[int] = (3,),
+        capacity: int = 256,
+        id_overlap: int = 1000,
+    ):
+        """
+        Args:
+            window_days: Extra aggregate windows (days) besides the history window
+            lags: Lags (in readings) for temp_delta_lag{k}
+            capacity: Minimum readings kept per stockpile (the ring grows to hold the windows)
+            id_overlap: TempRecord ids below the watermark re-read by refreshes and live
+                fetches, for rows committed out of id order (0: a single writer is assumed)
+        """
+        self.window_days = [TEMPERATURE_HISTORY_DAYS] + [d for d in window_days if d != TEMPERATURE_HISTORY_DAYS]
+        self.lags = list(lags)
+        self.capacity = max(1, capacity, *[lag + 1 for lag in self.lags])
+        self.id_overlap = max(0, id_overlap)
+        self.db_service: Optional[DatabaseService] = None
+
+        self._states: Dict[int, StockpileState] = {}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        # Highest TempRecord id applied by load()/refresh() and the newest record_date seen
+        self._watermark_id = 0
+        self._watermark: Optional[datetime] = None
+        self._loaded = False
+        self._refreshed_at = 0.0
+        # Stockpiles that received new readings since the last pop_changed()
+        self._changed = set()
+        self._stats = {
+            "readings": 0, "duplicates": 0, "synced": 0, "lookups": 0,
+            "refreshes": 0, "failed_refreshes": 0, "last_refresh_ms": 0.0,
+        }
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._loaded
+
+    @property
+    def _fetch_after(self) -> int:
+        """TempRecord id fetches start after: the watermark minus the re-read overlap"""
+        return max(0, self._watermark_id - self.id_overlap)
+
+    @property
+    def history_watermark(self) -> Optional[int]:
+        """
+        TempRecord id live fetches can start after (get_stockpiles_data(temperatures_after=...))
+
+        Lies id_overlap ids below the highest id applied, so rows that committed
+        after a refresh passed their id are still fetched and applied by sync().
+        None while the state is not loaded: the full history is needed then.
+        """
+        return self._fetch_after if self._loaded else None
+
+    def _state(self, shtabel_id: int) -> StockpileState:
+        state = self._states.get(shtabel_id)
+        if state is None:
+            state = self._states[shtabel_id] = StockpileState(self.capacity, self.window_days)
+        return state
+
+    def update(self, shtabel_id: int, record_date: Any, max_temp: Any, record_id: Optional[int] = None) -> bool:
+        """
+        Apply one temperature reading in O(1) (records without a date or temperature are skipped)
+
+        Returns:
+            True if the reading was new
+        """
+        nanos = _nanos(record_date)
+        if nanos is None or max_temp is None or (isinstance(max_temp, float) and math.isnan(max_temp)):
+            return False
+        with self._lock:
+            return self._apply(int(shtabel_id), nanos, float(max_temp), record_id)
+
+    def _apply(self, shtabel_id: int, nanos: int, temp: float, record_id: Optional[int] = None) -> bool:
+        """Add a reading (caller holds the lock)"""
+        if self._state(shtabel_id).append(nanos, temp, record_id):
+            self._stats["readings"] += 1
+            self._changed.add(shtabel_id)
+            return True
+        self._stats["duplicates"] += 1
+        return False
+
+    def update_records(self, records: pd.DataFrame) -> int:
+        """
+        Apply records with columns shtabel_id, record_date, max_temp and
+        optionally id (TempRecord id), in any order
+
+        Returns:
+            Number of new readings
+        """
+        if records.empty:
+            return 0
+        times = to_naive_datetimes(records["record_date"]).to_numpy().astype("datetime64[ns]")
+        temps = pd.to_numeric(records["max_temp"], errors="coerce").to_numpy(dtype=float)
+        valid = ~(np.isnat(times) | np.isnan(temps))
+        # In time order, so no reading takes the out-of-order path
+        order = np.argsort(times[valid], kind="stable")
+        if "id" in records.columns:
+            record_ids = records["id"].to_numpy()[valid][order].tolist()
+        else:
+            record_ids = [None] * len(order)
+        applied = 0
+        with self._lock:
+            for shtabel_id, nanos, temp, record_id in zip(
+                records["shtabel_id"].to_numpy()[valid][order].tolist(),
+                times[valid][order].astype("int64").tolist(),
+                temps[valid][order].tolist(),
+                record_ids,
+            ):
+                applied += self._apply(int(shtabel_id), nanos, temp, record_id)
+        return applied
+
+    def load(self, db_service: Optional[DatabaseService] = None) -> bool:
+        """
+        Build the state from the temperature history of all stockpiles (called at startup)
+
+        Args:
+            db_service: Database service used for this and later refreshes
+
+        Returns:
+            True if the state was loaded
+        """
+        if db_service is not None:
+            self.db_service = db_service
+        if self.db_service is None:
+            self.db_service = DatabaseService()
+
+        with self._refresh_lock:
+            with self._lock:
+                self._states = {}
+                self._watermark_id = 0
+                self._watermark = None
+            loaded = self._refresh()
+            with self._lock:
+                self._changed = set()
+            return loaded
+
+    def refresh(self) -> bool:
+        """Apply records added since the watermark"""
+        if not self._loaded:
+            return self.load()
+        with self._refresh_lock:
+            return self._refresh()
+
+    def _refresh(self) -> bool:
+        """Query and apply records with ids above the watermark minus the overlap (caller holds the refresh lock)"""
+        started = time.perf_counter()
+        full = not self._loaded
+        try:
+            records = self.db_service.get_temperature_records(
+                since=datetime.now() - timedelta(days=TEMPERATURE_HISTORY_DAYS),
+                after_id=self._fetch_after,
+            )
+        except Exception as e:
+            self._stats["failed_refreshes"] += 1
+            logger.warning(f"Rolling feature refresh failed: {e}")
+            return False
+
+        applied = self.update_records(records)
+        if len(records):
+            self._watermark_id = max(self._watermark_id, int(records["id"].max()))
+            last_ts = records["record_date"].max()
+            if hasattr(last_ts, "to_pydatetime"):
+                last_ts = last_ts.to_pydatetime()
+            self._watermark = last_ts if self._watermark is None else max(self._watermark, last_ts)
+        self._loaded = True
+        self._refreshed_at = time.monotonic()
+        self._stats["refreshes"] += 1
+        self._stats["last_refresh_ms"] = round((time.perf_counter() - started) * 1000.0, 3)
+
+        if full:
+            logger.info(
+                f"Rolling features loaded: {len(self._states)} stockpiles, {applied} readings, "
+                f"watermark {self._watermark}"
+            )
+        return True
+
+    def pop_changed(self) -> List[int]:
+        """Stockpiles that received new readings since the last call (not counting load())"""
+        with self._lock:
+            changed, self._changed = self._changed, set()
+        return sorted(changed)
+
+    def sync(self, stockpile_data: Dict[str, Any]) -> int:
+        """
+        Apply the stockpile's fetched records the state does not have yet
+
+        Records are matched by TempRecord id: ids already kept are skipped,
+        so readings sharing a timestamp with the newest one are not lost, and
+        rows below the watermark that committed late are applied. Ids under
+        the re-read overlap are not fetched by refreshes either and are
+        skipped. Records without an id are applied only if newer than the
+        newest reading.
+
+        Args:
+            stockpile_data: Stockpile data from get_stockpiles_data()
+
+        Returns:
+            Number of readings applied
+        """
+        shtabel_id = int(stockpile_data["shtabel_id"])
+        with self._lock:
+            state = self._states.get(shtabel_id)
+            latest = state.latest if state is not None else None
+            new = []
+            for record in stockpile_data.get("temperatures") or ():
+                nanos = _nanos(record.get("record_date"))
+                if nanos is None or record.get("max_temp") is None:
+                    continue
+                record_id = record.get("id")
+                if record_id is None:
+                    if latest is not None and nanos <= latest:
+                        continue
+                elif record_id <= self._fetch_after or (state is not None and record_id in state.known):
+                    continue
+                new.append((nanos, float(record["max_temp"]), record_id))
+            new.sort(key=lambda reading: reading[0])
+            applied = 0
+            for nanos, temp, record_id in new:
+                applied += self._apply(shtabel_id, nanos, temp, record_id)
+            self._stats["synced"] += applied
+        return applied
+
+    def history_frame(self, stockpiles: List[Dict[str, Any]], at: datetime) -> pd.DataFrame:
+        """
+        History aggregates prepare_features_batch() takes instead of a temperature scan
+
+        Each stockpile is synced with its fetched records first.
+
+        Args:
+            stockpiles: Stockpile data dictionaries
+            at: Prediction time
+
+        Returns:
+            DataFrame with columns hottest (max over the history window) and
+            temp_lag_3d, one row per stockpile (NaN without readings)
+        """
+        for stockpile_data in stockpiles:
+            self.sync(stockpile_data)
+
+        now = _nanos(at)
+        hottest, lag_temps = [], []
+        with self._lock:
+            self._stats["lookups"] += len(stockpiles)
+            for stockpile_data in stockpiles:
+                state = self._states.get(int(stockpile_data["shtabel_id"]))
+                if state is None:
+                    hottest.append(math.nan)
+                    lag_temps.append(math.nan)
+                    continue
+                state.advance(max(now, state.latest))
+                history = state.windows[0]
+                hottest.append(history.maxima[0][1] if history.count else math.nan)
+                lag_temp = state.lag_reading(now)
+                lag_temps.append(math.nan if lag_temp is None else lag_temp)
+        return pd.DataFrame({"hottest": hottest, "temp_lag_3d": lag_temps})
+
+    def features(self, shtabel_id: int, at: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+        """
+        Current rolling values of a stockpile
+
+        Args:
+            shtabel_id: Stockpile ID
+            at: Time the windows end at (default: now)
+
+        Returns:
+            Newest reading, temp_lag_3d, temp_delta_lag{k} and per-window
+            aggregates, or None if the stockpile has no readings
+        """
+        now = _nanos(at or datetime.now())
+        with self._lock:
+            self._stats["lookups"] += 1
+            state = self._states.get(int(shtabel_id))
+            if state is None or not state.seq:
+                return None
+            state.advance(max(now, state.latest))
+            return {
+                "shtabel_id": int(shtabel_id),
+                "readings": state.size,
+                "last_record_date": _timestamp(state.latest),
+                "last_temp": state.temps[(state.seq - 1) % state.capacity],
+                "temp_lag_3d": state.lag_reading(now),
+                **{f"temp_delta_lag{lag}": state.lag_delta(lag) for lag in self.lags},
+                "windows": {
+                    f"{days}d": window.values()
+                    for days, window in zip(state.window_days, state.windows)
+                },
+            }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """State size, configuration, watermark and counters"""
+        return {
+            "enabled": self._loaded,
+            "stockpiles": len(self._states),
+            "window_days": self.window_days,
+            "lags": self.lags,
+            "capacity": self.capacity,
+            "watermark": self._watermark.isoformat() if self._watermark else None,
+            "watermark_id": self._watermark_id,
+            "id_overlap": self.id_overlap,
+            "seconds_since_refresh": round(time.monotonic() - self._refreshed_at, 1) if self._loaded else None,
+            **self._stats,
+        }
+
+
+# Global rolling feature engine
+rolling_features = RollingFeatureEngine(
+    window_days=_parse_ints(settings.ROLLING_WINDOWS_DAYS),
+    lags=_parse_ints(settings.ROLLING_LAGS),
+    capacity=settings.ROLLING_CAPACITY,
+    id_overlap=settings.ROLLING_ID_OVERLAP,
+)
@@ -0,0 +1,197 @@
+"""
+Startup timing report
+
+Importing this module installs an import timer. The timer records how long
+each module takes to import, both inclusive and self time (like
+python -X importtime), until startup finishes.
+
+Startup phases (model load, weather index, warm-up) are timed with
+startup_report.phase(). finish() logs a one-line summary when the app
+starts serving. Warm-up runs in the background after that, so
+finish_warmup() logs a second summary that includes it. GET /startup
+returns the full report, so cold-start regressions show up in logs and
+monitoring.
+
+Under serve.py the parent times its preloading as preload.* phases and
+calls preloaded(). Forked workers inherit those timings and call forked(),
+so each worker's report shows the parent's preload next to its own startup,
+timed from the fork.
+
+src/main.py imports this module before anything else.
+"""
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from importlib.abc import MetaPathFinder
+from importlib.machinery import ModuleSpec
+from typing import Any, Dict, Iterator, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Modules reported individually (others only count towards their importer)
+REPORT_MIN_MS = 1.0
+REPORT_MAX_MODULES = 30
+
+
+class _TimedLoader:
+    """Wraps a loader and records exec_module time; the module only ever sees the original loader"""
+
+    def __init__(self, loader: Any, report: "StartupReport"):
+        self.loader = loader
+        self.report = report
+
+    def create_module(self, spec: ModuleSpec) -> Any:
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module: Any) -> None:
+        module.__loader__ = self.loader
+        if module.__spec__ is not None:
+            module.__spec__.loader = self.loader
+        self.report._enter(module.__name__)
+        try:
+            self.loader.exec_module(module)
+        finally:
+            self.report._exit(module.__name__)
+
+
+class _ImportTimer(MetaPathFinder):
+    """Meta path finder that delegates to the other finders and wraps their loaders"""
+
+    def __init__(self, report: "StartupReport"):
+        self.report = report
+
+    def find_spec(self, fullname: str, path: Any, target: Any = None) -> Optional[ModuleSpec]:
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is None:
+                continue
+            if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                spec.loader = _TimedLoader(spec.loader, self.report)
+            return spec
+        return None
+
+
+class StartupReport:
+    """Import times per module and durations of startup phases"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self.warmed: Optional[float] = None
+        # Set by the serve.py parent before forking workers
+        self.preload_seconds: Optional[float] = None
+        self._timer: Optional[_ImportTimer] = None
+        self._lock = threading.Lock()
+        # Per-thread stack of [name, started, child_seconds]
+        self._local = threading.local()
+        self._imports: Dict[str, Dict[str, float]] = {}
+        self._phases: Dict[str, float] = {}
+
+    def install(self) -> None:
+        """Start recording imports"""
+        if self._timer is None:
+            self._timer = _ImportTimer(self)
+            sys.meta_path.insert(0, self._timer)
+
+    def uninstall(self) -> None:
+        """Stop recording imports (modules imported later load untimed)"""
+        if self._timer is not None:
+            try:
+                sys.meta_path.remove(self._timer)
+            except ValueError:
+                pass
+            self._timer = None
+
+    def _enter(self, name: str) -> None:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append([name, time.perf_counter(), 0.0])
+
+    def _exit(self, name: str) -> None:
+        stack = self._local.stack
+        _, started, children = stack.pop()
+        inclusive = time.perf_counter() - started
+        if stack:
+            stack[-1][2] += inclusive
+        with self._lock:
+            self._imports[name] = {
+                "inclusive_ms": round(inclusive * 1000, 2),
+                "self_ms": round((inclusive - children) * 1000, 2),
+            }
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time a startup phase (e.g. model load)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._phases[name] = round(time.perf_counter() - started, 3)
+
+    def preloaded(self) -> None:
+        """Record the time spent preloading in the serve.py parent (called before forking)"""
+        self.preload_seconds = round(time.perf_counter() - self.started, 3)
+
+    def forked(self) -> None:
+        """Time a forked worker's own startup from the fork; preload phases and imports are kept"""
+        self.started = time.perf_counter()
+
+    def finish(self) -> None:
+        """Stop recording imports and log the summary"""
+        self.uninstall()
+        self.finished = time.perf_counter()
+        self._log_summary("Startup finished", self.finished)
+
+    def finish_warmup(self) -> None:
+        """Log a second summary once the background warm-up has finished"""
+        self.warmed = time.perf_counter()
+        self._log_summary("Startup and warm-up finished", self.warmed)
+
+    def _log_summary(self, event: str, at: float) -> None:
+        top = ", ".join(
+            f"{entry['module']} {entry['inclusive_ms'] / 1000:.2f}s"
+            for entry in self.slowest_imports(5)
+        )
+        phases = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self._phases.items())
+        preload = f" after {self.preload_seconds:.2f}s of preloading in the parent" if self.preload_seconds else ""
+        logger.info(
+            f"{event} in {at - self.started:.2f}s{preload} "
+            f"(phases: {phases or 'none'}; slowest imports: {top or 'none'})"
+        )
+
+    def slowest_imports(self, limit: int = REPORT_MAX_MODULES) -> List[Dict[str, Any]]:
+        """Top-level packages and src.* modules by inclusive import time"""
+        with self._lock:
+            imports = dict(self._imports)
+        entries = [
+            {"module": name, **times}
+            for name, times in imports.items()
+            if ("." not in name or name.startswith("src.")) and times["inclusive_ms"] >= REPORT_MIN_MS
+        ]
+        entries.sort(key=lambda entry: entry["inclusive_ms"], reverse=True)
+        return entries[:limit]
+
+    def get_report(self) -> Dict[str, Any]:
+        """Startup duration, phase durations and slowest imports"""
+        with self._lock:
+            modules = len(self._imports)
+        return {
+            "finished": self.finished is not None,
+            "startup_seconds": round(self.finished - self.started, 3) if self.finished else None,
+            "warmup_finished": self.warmed is not None,
+            "ready_seconds": round(self.warmed - self.started, 3) if self.warmed else None,
+            "preload_seconds": self.preload_seconds,
+            "phases": dict(self._phases),
+            "modules_imported": modules,
+            "imports": self.slowest_imports(),
+        }
+
+
+# Global startup report; records imports from here on
+startup_report = StartupReport()
+startup_report.install()
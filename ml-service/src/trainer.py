@@ -12,6 +12,7 @@ from sklearn.metrics import classification_report, f1_score, accuracy_score, pre
 from src.model_manager import model_manager
 from src.database import DatabaseService
 from src.feature_engineering import preprocess_data
+from src.inference import predict_positive, predict_labels
 
 logger = logging.getLogger(__name__)
 
@@ -120,8 +121,8 @@ class Trainer:
             model.fit(X_train, y_train)
             
             # Evaluate model
-            y_pred = model.predict(X_test)
-            y_pred_proba = model.predict_proba(X_test)[:, 1]
+            y_pred_proba = predict_positive(model, X_test)
+            y_pred = predict_labels(y_pred_proba)
             
             # Calculate metrics
             accuracy = accuracy_score(y_test, y_pred)
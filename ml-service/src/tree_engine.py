@@ -0,0 +1,219 @@
+"""
+Compiled NumPy evaluation of XGBoost tree ensembles
+
+Parses a model saved with XGBModel.save_model() (JSON format) into flat
+NumPy arrays and evaluates single rows and batches without xgboost at
+request time. Exposes the same predict / predict_proba interface as
+XGBClassifier, so it can be used wherever the loaded model is used.
+
+The engine targets single rows and small batches (the /predict and
+/predict/direct paths), where DMatrix construction dominates. For very large
+batches multi-threaded xgboost remains faster; see benchmarks/bench_tree_engine.py.
+"""
+import json
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Rows evaluated at once; bounds the (rows x trees) node-index matrix
+DEFAULT_CHUNK_SIZE = 4096
+
+SUPPORTED_OBJECTIVES = ("binary:logistic", "reg:logistic", "binary:logitraw")
+
+
+class CompiledTreeEnsemble:
+    """XGBoost gbtree binary classifier compiled to flat NumPy arrays"""
+
+    def __init__(
+        self,
+        feature_names: List[str],
+        roots: np.ndarray,
+        split_feature: np.ndarray,
+        threshold: np.ndarray,
+        left: np.ndarray,
+        right: np.ndarray,
+        default_left: np.ndarray,
+        leaf_value: np.ndarray,
+        max_depth: int,
+        base_margin: float,
+        objective: str,
+    ):
+        self.feature_names = feature_names
+        self.n_features = len(feature_names)
+        self.roots = roots
+        self.split_feature = split_feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        # Interleaved [left, right] pairs: child of node n is children[2n + went_right]
+        self.children = np.column_stack([left, right]).ravel()
+        self.default_left = default_left
+        self.leaf_value = leaf_value
+        self.max_depth = max_depth
+        self.base_margin = base_margin
+        self.objective = objective
+        self.classes_ = np.array([0, 1])
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @classmethod
+    def from_json_file(cls, path: Union[str, Path]) -> "CompiledTreeEnsemble":
+        """Compile a model from an XGBoost JSON model file"""
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_json(json.load(f))
+
+    @classmethod
+    def from_json(cls, model: Dict[str, Any]) -> "CompiledTreeEnsemble":
+        """
+        Compile a model from the parsed XGBoost JSON document
+
+        All trees are concatenated into one node table. Leaves point to
+        themselves, so every row can be advanced a fixed number of steps
+        (the maximum tree depth) without per-row branching.
+        """
+        learner = model["learner"]
+        objective = learner["objective"]["name"]
+        if objective not in SUPPORTED_OBJECTIVES:
+            raise ValueError(f"Unsupported objective for compiled engine: {objective}")
+
+        booster = learner["gradient_booster"]
+        if booster.get("name") != "gbtree":
+            raise ValueError(f"Unsupported booster for compiled engine: {booster.get('name')}")
+
+        params = learner["learner_model_param"]
+        if int(params.get("num_class", "0")) > 1 or int(params.get("num_target", "1")) > 1:
+            raise ValueError("Compiled engine supports single-output models only")
+
+        n_features = int(params["num_feature"])
+        feature_names = learner.get("feature_names") or [f"f{i}" for i in range(n_features)]
+
+        base_score = float(str(params["base_score"]).strip("[]"))
+        if objective == "binary:logitraw":
+            base_margin = base_score
+        else:
+            base_margin = float(np.log(base_score / (1.0 - base_score)))
+
+        roots, split_feature, threshold = [], [], []
+        left, right, default_left, leaf_value = [], [], [], []
+        max_depth = 0
+        offset = 0
+
+        for tree in booster["model"]["trees"]:
+            if any(int(t) != 0 for t in tree.get("split_type", [])):
+                raise ValueError("Categorical splits are not supported by compiled engine")
+
+            tree_left = np.asarray(tree["left_children"], dtype=np.int64)
+            tree_right = np.asarray(tree["right_children"], dtype=np.int64)
+            conditions = np.asarray(tree["split_conditions"], dtype=np.float32)
+            n_nodes = len(tree_left)
+            node_ids = np.arange(n_nodes, dtype=np.int64)
+            is_leaf = tree_left == -1
+
+            roots.append(offset)
+            split_feature.append(np.where(is_leaf, 0, tree["split_indices"]))
+            # Leaf nodes store their value in split_conditions
+            threshold.append(np.where(is_leaf, np.float32(0), conditions))
+            leaf_value.append(np.where(is_leaf, conditions, np.float32(0)))
+            left.append(np.where(is_leaf, node_ids, tree_left) + offset)
+            right.append(np.where(is_leaf, node_ids, tree_right) + offset)
+            default_left.append(np.asarray(tree["default_left"], dtype=bool))
+            max_depth = max(max_depth, _tree_depth(tree_left, tree_right))
+            offset += n_nodes
+
+        return cls(
+            feature_names=list(feature_names),
+            roots=np.asarray(roots, dtype=np.int32),
+            split_feature=np.concatenate(split_feature).astype(np.int32),
+            threshold=np.concatenate(threshold).astype(np.float32),
+            left=np.concatenate(left).astype(np.int32),
+            right=np.concatenate(right).astype(np.int32),
+            default_left=np.concatenate(default_left),
+            leaf_value=np.concatenate(leaf_value).astype(np.float32),
+            max_depth=max_depth,
+            base_margin=base_margin,
+            objective=objective,
+        )
+
+    def _to_matrix(self, X: Any) -> np.ndarray:
+        """Convert input to a float32 matrix in the model's feature order"""
+        if isinstance(X, pd.DataFrame):
+            missing = [name for name in self.feature_names if name not in X.columns]
+            if missing:
+                raise ValueError(f"Missing feature columns: {missing}")
+            X = X[self.feature_names].to_numpy(dtype=np.float32)
+        else:
+            X = np.asarray(X, dtype=np.float32)
+
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"Expected {self.n_features} features, got {X.shape[1]}")
+        return X
+
+    def predict_margin(self, X: Any, chunk_size: int = DEFAULT_CHUNK_SIZE) -> np.ndarray:
+        """Raw margin (sum of leaf values plus base margin) for each row"""
+        X = self._to_matrix(X)
+        margin = np.empty(len(X), dtype=np.float64)
+
+        for start in range(0, len(X), chunk_size):
+            chunk = X[start:start + chunk_size]
+            flat = chunk.ravel()
+            row_offsets = (np.arange(len(chunk), dtype=np.int32) * self.n_features)[:, None]
+            has_missing = bool(np.isnan(chunk).any())
+            node = np.broadcast_to(self.roots, (len(chunk), self.n_trees))
+
+            for _ in range(self.max_depth):
+                values = flat.take(row_offsets + self.split_feature.take(node))
+                go_right = values >= self.threshold.take(node)
+                if has_missing:
+                    missing = np.isnan(values)
+                    go_right[missing] = ~self.default_left.take(node[missing])
+                node = self.children.take(2 * node + go_right)
+
+            margin[start:start + len(chunk)] = (
+                self.leaf_value.take(node).sum(axis=1, dtype=np.float64) + self.base_margin
+            )
+
+        return margin
+
+    def predict_proba(self, X: Any) -> np.ndarray:
+        """Class probabilities, shape (n_rows, 2), like XGBClassifier.predict_proba"""
+        margin = self.predict_margin(X)
+        if self.objective == "binary:logitraw":
+            positive = margin
+        else:
+            positive = 1.0 / (1.0 + np.exp(-margin))
+        positive = positive.astype(np.float32)
+        return np.column_stack([1.0 - positive, positive])
+
+    def predict(self, X: Any) -> np.ndarray:
+        """Binary predictions with 0.5 threshold, like XGBClassifier.predict"""
+        return (self.predict_proba(X)[:, 1] > 0.5).astype(int)
+
+
+def _tree_depth(left: np.ndarray, right: np.ndarray) -> int:
+    """Maximum number of splits from root to any leaf"""
+    depth = 0
+    level = [0]
+    while level:
+        children = [c for node in level for c in (left[node], right[node]) if c != -1]
+        if not children:
+            break
+        depth += 1
+        level = children
+    return depth
+
+
+def compile_model_file(path: Union[str, Path]) -> Optional[CompiledTreeEnsemble]:
+    """Compile a model file, returning None if it cannot be compiled"""
+    try:
+        return CompiledTreeEnsemble.from_json_file(path)
+    except Exception as e:
+        logger.warning(f"Could not compile model {path} to NumPy engine: {e}")
+        return None
@@ -11,6 +11,8 @@ import io
 
 from src.model_manager import model_manager
 from src.feature_engineering import preprocess_data
+from src.preprocessing import build_features, parse_days, prepare_temperature
+from src.inference import predict_positive, predict_labels
 from sklearn.metrics import (
     classification_report, 
     f1_score, 
@@ -132,8 +134,8 @@ class ModelValidator:
             
             # Делаем предсказания
             logger.info("Выполнение предсказаний...")
-            y_pred = model.predict(X)
-            y_pred_proba = model.predict_proba(X)[:, 1]
+            y_pred_proba = predict_positive(model, X)
+            y_pred = predict_labels(y_pred_proba)
             
             # Рассчитываем метрики
             metrics = {}
@@ -218,6 +220,17 @@ class ModelValidator:
             logger.info("Обнаружен предобработанный файл с признаками")
             return df.copy()
         
+        # Сырой файл температур (как temperature.csv): признаки общим конвейером предобработки,
+        # возраст — от колонки 'Дата начала', если она есть
+        raw_cols = ['Дата акта', 'Склад', 'Штабель', 'Максимальная температура']
+        if all(col in df.columns for col in raw_cols):
+            logger.info("Обнаружен сырой файл температур, признаки строятся общим конвейером предобработки")
+            temp = prepare_temperature(df)
+            stack_start = None
+            if 'Дата начала' in temp.columns:
+                stack_start = parse_days(temp['Дата начала']).groupby(temp['stack_id']).min()
+            return build_features(temp, stack_start)
+        
         # Иначе пытаемся обработать как сырые данные
         # Это упрощенная версия - в реальности нужна полная предобработка как в train_from_csv.py
         logger.warning("Файл не содержит предобработанных признаков. Используется упрощенная предобработка.")
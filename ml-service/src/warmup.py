@@ -0,0 +1,261 @@
+"""
+Startup warm-up and readiness gating
+
+Several costs are paid lazily on the first requests after startup:
+- XGBoost sets up its predictor on the first inplace_predict.
+- pandas and NumPy initialize code paths on first use.
+- The DB pool opens connections on demand.
+
+Warmup.run() absorbs these costs before traffic arrives. It:
+- pushes synthetic batches of several sizes through the inference path;
+- opens pool connections;
+- scores a few real stockpiles end to end (DB loaders, feature
+  engineering, weather index and feature store).
+
+GET /ready reports ready only after run() has finished, a model is loaded
+and every step succeeded, so a load balancer never routes traffic to a cold
+instance or to one without a model or database. WARMUP_BEST_EFFORT=true
+reports ready once warm-up has finished, whatever its outcome. GET /health
+stays a liveness check.
+
+A failed step does not keep the instance out for good: retry_failed() re-runs
+failed steps (main.py calls it with a doubling delay, WARMUP_RETRY_SECONDS),
+so an instance that booted during a short database outage becomes ready once
+the database is back. A model loaded after the inference step ran (e.g. via
+/model/load) is warmed by warm_loaded_model(), a model reload listener.
+"""
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence
+import logging
+
+import numpy as np
+import pandas as pd
+
+from src.config import settings
+from src.database import DatabaseService
+from src.feature_engineering import FEATURE_COLUMNS
+from src.inference import predict_positive
+from src.model_manager import model_manager
+from src.perf_metrics import endpoint_label
+from src.predictor import Predictor, build_prediction_fields
+from src.rolling_features import rolling_features
+
+logger = logging.getLogger(__name__)
+
+# Upper bound of the delay between retries of failed steps
+WARMUP_RETRY_MAX_SECONDS = 60.0
+
+
+def parse_batch_sizes(value: str) -> List[int]:
+    """Parse WARMUP_BATCH_SIZES, e.g. "1,8,64" -> [1, 8, 64] (invalid entries are skipped)"""
+    sizes = []
+    for part in value.split(","):
+        part = part.strip()
+        if part.isdigit() and int(part) > 0:
+            sizes.append(int(part))
+    return sizes
+
+
+def synthetic_features(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    """Feature rows in realistic ranges, in the layout prepare_features() produces"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Максимальная температура': rng.uniform(0, 150, n_rows),
+        'age_days': rng.integers(0, 400, n_rows),
+        'temp_air': rng.uniform(-25, 35, n_rows),
+        'humidity': rng.uniform(20, 100, n_rows),
+        'precip': rng.exponential(1.0, n_rows),
+        'temp_delta_3d': rng.normal(0, 10, n_rows),
+    }, columns=FEATURE_COLUMNS)
+
+
+class Warmup:
+    """Runs the warm-up steps once and tracks readiness"""
+
+    def __init__(
+        self,
+        batch_sizes: Sequence[int] = (1, 8, 64, 512),
+        stockpiles: int = 32,
+        best_effort: bool = False,
+    ):
+        """
+        Args:
+            batch_sizes: Synthetic batch sizes pushed through the model
+            stockpiles: Active stockpiles scored end to end (0 skips the step)
+            best_effort: Ready once warm-up has finished, even without a model or with failed steps
+        """
+        self.batch_sizes = list(batch_sizes)
+        self.stockpiles = stockpiles
+        self.best_effort = best_effort
+        self._finished = False
+        self._status: Dict[str, Any] = {"state": "pending", "steps": {}}
+
+    def _not_ready_reason(self) -> Optional[str]:
+        """Why the service must not receive traffic (None if it may)"""
+        if not self._finished:
+            return "warm-up not finished"
+        if self.best_effort:
+            return None
+        # Checked on every call: a model loaded later via /model/load makes the service ready
+        if not model_manager.is_model_loaded():
+            return "model not loaded"
+        failed = self.failed_steps()
+        if failed:
+            return f"warm-up steps failed: {', '.join(failed)}"
+        return None
+
+    @property
+    def ready(self) -> bool:
+        return self._not_ready_reason() is None
+
+    def failed_steps(self) -> List[str]:
+        """Names of the steps whose last attempt failed"""
+        return [name for name, step in list(self._status["steps"].items()) if not step["ok"]]
+
+    def _step(self, name: str, func: Callable[[], Any]) -> None:
+        """Run one step, recording its duration and result; failures do not abort warm-up"""
+        started = time.perf_counter()
+        try:
+            result = func()
+            self._status["steps"][name] = {"ok": True, "result": result}
+        except Exception as e:
+            logger.warning(f"Warm-up step {name} failed: {e}")
+            self._status["steps"][name] = {"ok": False, "error": str(e)}
+        self._status["steps"][name]["seconds"] = round(time.perf_counter() - started, 3)
+
+    def _steps(self, db_service: DatabaseService, predictor: Predictor) -> Dict[str, Callable[[], Any]]:
+        """Warm-up steps by name, in the order run() executes them"""
+        return {
+            "inference": self._warm_inference,
+            "database_pool": lambda: {
+                "connections": db_service.warm_up_pool(max(1, settings.DB_POOL_SIZE)),
+            },
+            "predictions": lambda: self._warm_predictions(db_service, predictor),
+        }
+
+    def _run_steps(self, steps: Dict[str, Callable[[], Any]]) -> None:
+        # Latency histograms: keep warm-up timings apart from real traffic
+        token = endpoint_label.set("warmup")
+        try:
+            for name, func in steps.items():
+                self._step(name, func)
+        finally:
+            endpoint_label.reset(token)
+
+    def _warm_inference(self) -> Dict[str, Any]:
+        active = model_manager.get_active()
+        if active is None:
+            return {"skipped": "model not loaded"}
+
+        timings = {}
+        now = datetime.now()
+        for size in self.batch_sizes:
+            features = synthetic_features(size)
+            started = time.perf_counter()
+            # DataFrame input (Predictor, CSV) and raw rows (/predict/direct)
+            proba = predict_positive(active.model, features)
+            predict_positive(active.model, features.to_numpy())
+            build_prediction_fields(proba, 7, now)
+            timings[str(size)] = round((time.perf_counter() - started) * 1000, 2)
+
+        return {
+            "model_version": active.info.get("model_version"),
+            "batch_ms": timings,
+        }
+
+    def _warm_predictions(self, db_service: DatabaseService, predictor: Predictor) -> Dict[str, Any]:
+        if self.stockpiles <= 0:
+            return {"skipped": "WARMUP_STOCKPILES=0"}
+        shtabel_ids = db_service.get_active_shtabel_ids()[:self.stockpiles]
+        stockpiles = list(db_service.get_stockpiles_data(
+            shtabel_ids, rolling_features.history_watermark
+        ).values())
+        predictions = predictor.predict_batch(stockpiles)
+        return {"stockpiles": len(predictions)}
+
+    def run(self, db_service: DatabaseService, predictor: Predictor) -> Dict[str, Any]:
+        """
+        Run all warm-up steps and mark the service ready
+
+        Args:
+            db_service: Database service whose pool is warmed
+            predictor: Predictor used for the end-to-end step
+
+        Returns:
+            Warm-up status (see get_status())
+        """
+        started = time.perf_counter()
+        self._status["state"] = "running"
+        logger.info("Warm-up started")
+
+        self._run_steps(self._steps(db_service, predictor))
+
+        elapsed = time.perf_counter() - started
+        self._status["seconds"] = round(elapsed, 3)
+        self.finish(f"warm-up finished in {elapsed:.2f}s")
+        return self.get_status()
+
+    def retry_failed(self, db_service: DatabaseService, predictor: Predictor) -> List[str]:
+        """
+        Re-run the steps that failed; a step that succeeds no longer blocks readiness
+
+        Returns:
+            Names of the steps that still fail
+        """
+        failed = self.failed_steps()
+        if not failed:
+            return []
+        steps = self._steps(db_service, predictor)
+        self._run_steps({name: steps[name] for name in failed})
+        self._status.setdefault("retries", 0)
+        self._status["retries"] += 1
+
+        still_failed = self.failed_steps()
+        if still_failed:
+            logger.warning(f"Warm-up steps still failing: {', '.join(still_failed)}")
+        else:
+            logger.info(f"Warm-up steps succeeded on retry: {', '.join(failed)}")
+            if self._not_ready_reason() is None:
+                logger.info("Service ready: failed warm-up steps recovered")
+        return still_failed
+
+    def warm_loaded_model(self) -> None:
+        """
+        Model reload listener: warm a model loaded after the inference step ran
+
+        Models loaded before warm-up (startup, serve.py preload) are warmed by
+        run() itself.
+        """
+        if "inference" not in self._status["steps"]:
+            return
+        self._run_steps({"inference": self._warm_inference})
+
+    def finish(self, reason: str) -> None:
+        """Mark warm-up finished (also used when it is disabled); readiness is then checked per request"""
+        self._status["reason"] = reason
+        self._status["finished_at"] = datetime.now().isoformat()
+        self._finished = True
+        not_ready = self._not_ready_reason()
+        if not_ready is None:
+            logger.info(f"Service ready: {reason}")
+        else:
+            logger.warning(f"Service not ready after warm-up: {not_ready}")
+
+    def get_status(self) -> Dict[str, Any]:
+        """Readiness flag, the reason it is not ready and per-step results"""
+        not_ready = self._not_ready_reason()
+        status = {"ready": not_ready is None, **self._status}
+        if self._finished:
+            status["state"] = "ready" if not_ready is None else "not_ready"
+        if not_ready is not None:
+            status["not_ready_reason"] = not_ready
+        return status
+
+
+# Global warm-up instance
+warmup = Warmup(
+    batch_sizes=parse_batch_sizes(settings.WARMUP_BATCH_SIZES),
+    stockpiles=settings.WARMUP_STOCKPILES,
+    best_effort=settings.WARMUP_BEST_EFFORT,
+)
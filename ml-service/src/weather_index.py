@@ -0,0 +1,163 @@
+"""
+In-memory index of daily weather aggregates
+
+Weather is global to the site and changes at most hourly, while every
+prediction needs the aggregates (max t, mean humidity, total precipitation)
+of its target day. The index loads all days once at startup and afterwards
+a background task (WEATHER_INDEX_REFRESH_SECONDS) re-aggregates only the
+days from its watermark on, so lookups are plain dictionary reads and
+predictions never query the Weather table on the hot path.
+"""
+import math
+import threading
+import time
+from datetime import date, datetime
+from typing import Any, Dict, NamedTuple, Optional
+import logging
+
+from src.database import DatabaseService
+
+logger = logging.getLogger(__name__)
+
+
+class DailyWeather(NamedTuple):
+    """Aggregates of one day of hourly Weather rows"""
+    temp_air: float
+    humidity: float
+    precip: float
+
+
+class WeatherIndex:
+    """Thread-safe daily weather aggregates keyed by date"""
+
+    def __init__(self):
+        self.db_service: Optional[DatabaseService] = None
+
+        # Replaced as a whole on refresh, so readers never need the lock
+        self._days: Dict[date, DailyWeather] = {}
+        self._watermark: Optional[datetime] = None
+        self._last_day: Optional[date] = None
+        self._loaded = False
+        self._refreshed_at = 0.0
+        self._refresh_lock = threading.Lock()
+
+        self._stats = {"lookups": 0, "hits": 0, "refreshes": 0, "failed_refreshes": 0, "last_refresh_ms": 0.0}
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._loaded
+
+    @property
+    def watermark(self) -> Optional[datetime]:
+        """Latest Weather timestamp seen by the index (changes when new rows arrive)"""
+        return self._watermark
+
+    def load(self, db_service: Optional[DatabaseService] = None) -> bool:
+        """
+        Load aggregates for all days (called at startup)
+
+        Args:
+            db_service: Database service used for this and later refreshes
+
+        Returns:
+            True if the index was loaded
+        """
+        if db_service is not None:
+            self.db_service = db_service
+        if self.db_service is None:
+            self.db_service = DatabaseService()
+
+        with self._refresh_lock:
+            return self._refresh(full=True)
+
+    def refresh(self) -> bool:
+        """Re-aggregate days from the watermark day on and merge them into the index"""
+        if not self._loaded:
+            return self.load()
+        with self._refresh_lock:
+            return self._refresh(full=False)
+
+    def _refresh(self, full: bool) -> bool:
+        """Query daily aggregates and swap in the updated index (caller holds the lock)"""
+        started = time.perf_counter()
+        # The watermark day may have been partial, so it is aggregated again
+        since = None if full else self._last_day
+        try:
+            daily = self.db_service.get_weather_daily(since)
+        except Exception as e:
+            self._stats["failed_refreshes"] += 1
+            logger.warning(f"Weather index refresh failed: {e}")
+            return False
+
+        days = {} if full else dict(self._days)
+        for row in daily.itertuples(index=False):
+            days[_to_date(row.day)] = DailyWeather(
+                temp_air=_to_float(row.t_max),
+                humidity=_to_float(row.humidity_mean),
+                precip=_to_float(row.precip_sum),
+            )
+
+        if len(daily):
+            last_ts = daily["last_ts"].max()
+            self._watermark = last_ts.to_pydatetime() if hasattr(last_ts, "to_pydatetime") else last_ts
+        if days:
+            self._last_day = max(days)
+        self._days = days
+        self._loaded = True
+        self._refreshed_at = time.monotonic()
+        self._stats["refreshes"] += 1
+        self._stats["last_refresh_ms"] = round((time.perf_counter() - started) * 1000.0, 3)
+
+        if full:
+            logger.info(f"Weather index loaded: {len(days)} days, watermark {self._watermark}")
+        return True
+
+    def get(self, day: date) -> Optional[DailyWeather]:
+        """
+        Aggregates for a day
+
+        Args:
+            day: Calendar day (datetime values are truncated to their date)
+
+        Returns:
+            DailyWeather, or None if there are no Weather rows for the day
+        """
+        if isinstance(day, datetime):
+            day = day.date()
+
+        self._stats["lookups"] += 1
+        weather = self._days.get(day)
+        if weather is not None:
+            self._stats["hits"] += 1
+        return weather
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Index size, watermark and lookup statistics"""
+        return {
+            "enabled": self._loaded,
+            "days": len(self._days),
+            "last_day": self._last_day.isoformat() if self._last_day else None,
+            "watermark": self._watermark.isoformat() if self._watermark else None,
+            "seconds_since_refresh": round(time.monotonic() - self._refreshed_at, 1) if self._loaded else None,
+            **self._stats,
+        }
+
+
+def _to_date(value: Any) -> date:
+    """Normalize a day value returned by the driver to datetime.date"""
+    if isinstance(value, datetime):
+        return value.date()
+    if hasattr(value, "to_pydatetime"):
+        return value.to_pydatetime().date()
+    return value
+
+
+def _to_float(value: Any) -> float:
+    """NULL aggregates become NaN, like pandas aggregations of missing values"""
+    if value is None:
+        return math.nan
+    return float(value)
+
+
+# Global weather index instance
+weather_index = WeatherIndex()
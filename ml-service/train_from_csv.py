@@ -6,7 +6,6 @@ import sys
 import os
 import pandas as pd
 import numpy as np
-from datetime import timedelta
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report, f1_score, accuracy_score, precision_score, recall_score
 import xgboost as xgb
@@ -17,6 +16,7 @@ from pathlib import Path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 
 from src.model_manager import model_manager
+from src.preprocessing import build_dataset
 
 def load_and_preprocess_data(data_dir: str = "data"):
     """
@@ -29,24 +29,12 @@ def load_and_preprocess_data(data_dir: str = "data"):
     # 1. Загрузка данных
     print("  Загрузка fires.csv...")
     fires = pd.read_csv(data_path / 'fires.csv')
-    # Переименовываем колонки для совместимости с логикой из model.ipynb
-    fires = fires.rename(columns={
-        'Груз': 'Марка',
-        'Дата начала': 'Дата возгорания',
-        'Нач.форм.штабеля': 'Формирование штабеля'
-    })
     
     print("  Загрузка temperature.csv...")
     temp = pd.read_csv(data_path / 'temperature.csv')
     
     print("  Загрузка supplies.csv...")
     supplies = pd.read_csv(data_path / 'supplies.csv')
-    # Переименовываем колонки для совместимости
-    supplies = supplies.rename(columns={
-        'ВыгрузкаНаСклад': 'Дата поступления',
-        'Наим. ЕТСНГ': 'Марка',
-        'ПогрузкаНаСудно': 'Дата отправления'
-    })
     
     print("  Загрузка погодных данных...")
     # Объединяем все файлы погоды
@@ -77,85 +65,11 @@ def load_and_preprocess_data(data_dir: str = "data"):
     
     print(f"✓ Данные загружены: fires={len(fires)}, temp={len(temp)}, supplies={len(supplies)}, weather={len(weather)}")
     
-    # 2. Преобразование дат
-    print("\n📅 Преобразование дат...")
-    fires['date_fire'] = pd.to_datetime(fires['Дата возгорания'], errors='coerce')
-    fires = fires.dropna(subset=['date_fire'])
-    
-    temp['date'] = pd.to_datetime(temp['Дата акта'], errors='coerce')
-    temp = temp.dropna(subset=['date'])
-    
-    supplies['stack_start_date'] = pd.to_datetime(supplies['Дата поступления'], errors='coerce')
-    supplies = supplies.dropna(subset=['stack_start_date'])
-    
-    # 3. Создание stack_id
-    print("  Создание stack_id...")
-    temp['stack_id'] = temp['Склад'].astype(str) + '_' + temp['Штабель'].astype(str)
-    fires['stack_id'] = fires['Склад'].astype(str) + '_' + fires['Штабель'].astype(str)
-    
-    # Приведём даты к .date()
-    fires['date_fire'] = fires['date_fire'].dt.date
-    temp['date'] = temp['date'].dt.date
-    
-    # 4. Метка: возгорание в окне ±2 дня
-    print("  Создание целевой переменной (target)...")
-    fire_events = set(zip(fires['stack_id'], fires['date_fire']))
-    
-    def has_fire_in_window(row):
-        for delta in range(-2, 3):  # -2, -1, 0, +1, +2
-            candidate = row['date'] + timedelta(days=delta)
-            if (row['stack_id'], candidate) in fire_events:
-                return 1
-        return 0
-    
-    temp['target'] = temp.apply(has_fire_in_window, axis=1)
+    # 2. Даты, stack_id, метка, возраст, погода, динамика (общий конвейер src/preprocessing.py)
+    print("\n📅 Предобработка...")
+    temp = build_dataset(fires, supplies, temp, weather)
     print(f"  Целевая переменная создана: {temp['target'].sum()} возгораний из {len(temp)} записей")
     
-    # 5. Возраст штабеля
-    print("  Расчет возраста штабелей...")
-    supply_start = supplies.groupby(['Склад', 'Штабель'])['stack_start_date'].min().reset_index()
-    supply_start['stack_id'] = supply_start['Склад'].astype(str) + '_' + supply_start['Штабель'].astype(str)
-    stack_age_map = dict(zip(supply_start['stack_id'], supply_start['stack_start_date']))
-    
-    temp['stack_start'] = temp['stack_id'].map(stack_age_map)
-    temp['stack_start'] = pd.to_datetime(temp['stack_start']).dt.date
-    temp['age_days'] = (pd.to_datetime(temp['date']) - pd.to_datetime(temp['stack_start'])).dt.days
-    temp['age_days'] = temp['age_days'].clip(lower=0).fillna(0)
-    
-    # 6. Погода: агрегация до дня
-    print("  Обработка погодных данных...")
-    if not weather.empty:
-        weather['date'] = pd.to_datetime(weather['datetime']).dt.date
-        weather_daily = weather.groupby('date').agg({
-            'temp_air': 'max',
-            'humidity': 'mean',
-            'precip': 'sum'
-        }).reset_index()
-        
-        # Присоединяем погоду по дате
-        temp = temp.merge(weather_daily[['date', 'temp_air', 'humidity', 'precip']], on='date', how='left')
-    else:
-        print("  ⚠ Погодные данные отсутствуют, используем значения по умолчанию")
-        temp['temp_air'] = 20.0
-        temp['humidity'] = 60.0
-        temp['precip'] = 0.0
-    
-    # 7. Динамика температуры: рост за 3 дня
-    print("  Расчет динамики температуры...")
-    temp = temp.sort_values(['stack_id', 'date']).reset_index(drop=True)
-    temp['temp_lag3'] = temp.groupby('stack_id')['Максимальная температура'].shift(3)
-    temp['temp_delta_3d'] = temp['Максимальная температура'] - temp['temp_lag3']
-    temp['temp_delta_3d'] = temp['temp_delta_3d'].fillna(0)
-    
-    # 8. Подготовка финального датасета
-    print("  Подготовка финального датасета...")
-    temp = temp.dropna(subset=['Максимальная температура'])
-    
-    # Заполнение пропусков в погоде
-    for col in ['temp_air', 'humidity', 'precip']:
-        if col in temp.columns:
-            temp[col] = temp[col].ffill().bfill().fillna(20.0 if col == 'temp_air' else (60.0 if col == 'humidity' else 0.0))
-    
     print(f"✓ Предобработка завершена: {len(temp)} записей")
     return temp
 